@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Stand-in for the EBP executable used by the benchmarks: reads the CSV given in `/Import=` and writes an import log
+declaring every record imported, in the format parsed by `Connector.mark_exported_orders`.
+"""
+
+import csv
+import sys
+
+
+def main():
+    args = {}
+    for arg in sys.argv[1:]:
+        key, _, value = arg.lstrip('/').partition('=')
+        args[key] = value.split(';')
+
+    log_path = args['Gui'][1]
+    csv_path = args['Import'][0]
+    with open(csv_path, encoding='utf-8-sig', newline='') as f:
+        records = sum(1 for row in csv.reader(f, delimiter=';') if row)
+
+    with open(log_path, 'w', encoding='utf-8') as f:
+        f.write(f"Import\n"
+                f"\t{records}/{records} enregistrements ont été importés :\n"
+                f" - {records} enregistrements créés.\n"
+                f" - 0 enregistrements mis à jour.\n"
+                f" - 0 enregistrements non importés.\n")
+
+
+if __name__ == '__main__':
+    main()
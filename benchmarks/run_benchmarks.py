@@ -0,0 +1,344 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+End-to-end benchmarks of `Connector.run` against the local Prestashop stand-in (tests/fake_webservice.py) and a fake
+EBP executable (benchmarks/fake_ebp.py).
+
+    python -m benchmarks.run_benchmarks                       # run and compare against benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --sizes 100,1000      # only some sizes
+    python -m benchmarks.run_benchmarks --save-baseline       # store the results as the new baseline
+    python -m benchmarks.run_benchmarks --cassette run.jsonl.gz --simulate-timing   # replay recorded traffic
+
+Every size runs the connector in its own process so peak RSS and CPU time are not polluted by the other sizes nor by
+the stand-in server. The startup cost is measured separately with `python -X importtime`, as the time spent importing
+the connector in a fresh interpreter. Every size is run `--repeat` times and the median of each metric is kept. Exits
+with status 1 when a metric regresses past its threshold: `--threshold` for the HTTP calls per order, deterministic,
+the wider `--time-threshold` for the durations and the peak RSS, which vary from one run to the next.
+
+The baseline holds machine-independent ratios, not absolute timings: every duration is divided by the duration of a
+fixed CPU workload (`calibrate`), the best of the measures taken at the start of the session and before each run, and
+the other metrics are HTTP calls per order and peak RSS. benchmarks/baseline.json was produced by `python -m benchmarks.run_benchmarks --save-baseline`
+with the default parameters (100, 1000 and 10000 orders, 1 to 50 lines per order, no latency, 3 runs per size);
+regenerate it the same way after a change that is expected to move the numbers.
+
+With `--cassette`, the sizes are replaced by the replay of a cassette recorded on a real shop (`[cassette]` section
+with `mode = record`), without network, optionally waiting for the recorded duration of every request.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+FAKE_EBP_PATH = Path(__file__).resolve().parent / 'fake_ebp.py'
+
+# Metrics compared against the baseline; durations under MIN_SECONDS are too noisy to be compared. The durations and
+# the peak RSS (which depends on the scheduling of the scan threads) vary from one run to the next, they are compared
+# with a wider threshold than the deterministic metrics.
+TIME_METRICS = ['wall_time', 'cpu_time', 'phase_fetch', 'phase_transform', 'phase_csv_write', 'phase_import',
+                'phase_writeback', 'import_time']
+VARIABLE_METRICS = ['peak_rss_kb'] + TIME_METRICS
+COMPARED_METRICS = ['http_calls_per_order'] + VARIABLE_METRICS
+MIN_SECONDS = 0.05
+
+CONFIG_TEMPLATE = """[main]
+url = {url}
+apikey = BENCHMARK
+ebp_database_path = {working_directory}/database.ebp
+ebp_executable_path = {ebp_executable_path}
+payment_method_mapping_file_path = {root}/tests/samples/payment_method_mapping.csv
+vat_mapping_file_path = {root}/tests/samples/vat.csv
+working_directory = {working_directory}
+order_valid_status = 2,4,5
+order_refund_status = 7
+"""
+
+
+def _peak_rss_kb() -> int:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_worker(url: str, working_directory: Path, extra_config: str = '') -> dict:
+    """ Run the connector once, in the current process, and measure it from its run report
+
+    :param extra_config: sections added to the configuration file
+    """
+    from psebpconnector.connector import Connector
+
+    config_path = working_directory / 'config.ini'
+    config_path.write_text(CONFIG_TEMPLATE.format(url=url,
+                                                  working_directory=working_directory.as_posix(),
+                                                  ebp_executable_path=FAKE_EBP_PATH.as_posix(),
+                                                  root=ROOT.as_posix()) + extra_config)
+
+    # Keep the connector logs out of the benchmark output, the log file is still written
+    sys.stdout = sys.stderr = open(os.devnull, 'w')
+
+    # Etalonnage supplementaire : la session garde le meilleur, les plus lents tombant sur un pic de charge
+    calibration = calibrate()
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    connector = Connector(config_path)
+    exit_code = connector.run()
+    wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    report = connector.report.to_dict()
+    phases = report['phases']
+    orders = len(connector.pending_orders)
+    return {
+        'exit_code': exit_code,
+        'calibration': calibration,
+        'orders': orders,
+        'rows': report['counters'].get('rows_exported', 0),
+        'http_calls': report['http']['requests'],
+        'http_calls_per_order': report['http']['requests'] / orders if orders else 0,
+        'wall_time': wall_time,
+        'cpu_time': cpu_time,
+        'peak_rss_kb': _peak_rss_kb(),
+        'phase_startup': wall_time - sum(phases.get(phase, 0.0) for phase in ['export', 'import', 'writeback']),
+        'phase_fetch': phases.get('fetch', 0.0),
+        'phase_transform': phases.get('transform', 0.0),
+        'phase_csv_write': phases.get('csv_write', 0.0),
+        'phase_import': phases.get('import', 0.0),
+        'phase_writeback': phases.get('writeback', 0.0),
+    }
+
+
+def measure_import_time(module: str = 'psebpconnector.command', repeat: int = 5) -> dict:
+    """ Import `module` in fresh interpreters with `-X importtime`, keep the best of `repeat` cumulative times """
+    import_times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        # Derniere ligne pour le module demande : "import time: self [us] | cumulative | module"
+        for line in result.stderr.splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                import_times.append(int(fields[1]) / 1e6)
+    modules = subprocess.run([sys.executable, '-c', f"import sys, {module}; print(len(sys.modules))"],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+    return {'import_time': min(import_times), 'imported_modules': int(modules.stdout)}
+
+
+def calibrate(repeat: int = 20) -> float:
+    """ :return: the best duration of a fixed CPU workload close to the connector's (JSON decoding, string
+        formatting, CSV writing), the unit of the durations stored in the baseline """
+    payload = json.dumps([{'id': str(i), 'price': f"{i * 1.1:.6f}", 'name': f"Produit {i}"} for i in range(50000)])
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        writer = csv.writer(io.StringIO(), delimiter=';')
+        for row in json.loads(payload):
+            writer.writerow([row['id'], row['name'].upper(), f"{float(row['price']) * 1.2:.2f}"])
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def to_ratios(results: dict, calibration: float) -> dict:
+    """ :return: the compared metrics of the results, durations in calibration units """
+    ratios = {}
+    for size, metrics in results.items():
+        ratios[size] = {}
+        for metric in COMPARED_METRICS:
+            value = metrics.get(metric)
+            if value is None:
+                continue
+            if metric in TIME_METRICS:
+                if value < MIN_SECONDS:
+                    continue
+                value = value / calibration
+            ratios[size][metric] = value
+    return ratios
+
+
+def run_size(orders: int, lines_per_order, latency: float, repeat: int = 3) -> dict:
+    """ Serve a dataset of the given size and run the connector against it in `repeat` child processes
+
+    :return: the median of every metric over the runs, the best calibration of the runs
+    """
+    from tests.fake_webservice import FakeDataset, FakeWebservice
+
+    runs = []
+    for _ in range(repeat):
+        # Jeu de donnees et repertoire neufs a chaque passage : le precedent a marque les commandes exportees
+        dataset = FakeDataset(orders=orders,
+                              addresses=min(orders * 5, 50000),
+                              products=max(100, min(orders, 5000)),
+                              lines_per_order=lines_per_order)
+        with FakeWebservice(dataset, latency=latency) as server, \
+                tempfile.TemporaryDirectory() as working_directory:
+            result = subprocess.run([sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker',
+                                     '--url', server.url, '--working-directory', working_directory],
+                                    cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark worker failed for {orders} orders:\n{result.stderr}")
+        runs.append(json.loads(result.stdout))
+    results = {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+    results['calibration'] = min(run['calibration'] for run in runs)
+    return results
+
+
+def run_cassette(cassette_path: Path, simulate_timing: bool, timing_factor: float) -> dict:
+    """ Replay a recorded cassette in a child process """
+    with tempfile.TemporaryDirectory() as working_directory:
+        extra_config = (f"[cassette]\nmode = replay\npath = {cassette_path.resolve().as_posix()}\n"
+                        f"simulate_timing = {simulate_timing}\ntiming_factor = {timing_factor}\n")
+        result = subprocess.run([sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker',
+                                 '--url', 'http://cassette.invalid/api', '--working-directory', working_directory,
+                                 '--extra-config', extra_config],
+                                cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark worker failed replaying {cassette_path}:\n{result.stderr}")
+        return json.loads(result.stdout)
+
+
+def compare(ratios: dict, baseline: dict, threshold: float, time_threshold: float):
+    """ :return: the list of metrics regressing past their threshold, both sides as returned by `to_ratios`
+
+    :param threshold: tolerated relative regression of the deterministic metrics
+    :param time_threshold: tolerated relative regression of the durations and peak RSS (VARIABLE_METRICS)
+    """
+    regressions = []
+    for size, metrics in ratios.items():
+        if size not in baseline:
+            continue
+        for metric in COMPARED_METRICS:
+            current, reference = metrics.get(metric), baseline[size].get(metric)
+            if current is None or not reference:
+                continue
+            tolerance = time_threshold if metric in VARIABLE_METRICS else threshold
+            if current > reference * (1 + tolerance):
+                label = size if size in ('startup', 'cassette') else f"{size} orders"
+                regressions.append(f"{label}: {metric} {reference:.3f} -> {current:.3f} "
+                                   f"(+{(current / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmarks of the connector')
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma separated numbers of orders')
+    parser.add_argument('--min-lines', type=int, default=1, help='minimum number of lines per order')
+    parser.add_argument('--max-lines', type=int, default=50, help='maximum number of lines per order')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency added to every HTTP response, in seconds')
+    parser.add_argument('--output', type=Path, default=Path('bench_results.json'), help='where to save the results')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size, the median of each metric is kept')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='tolerated relative regression of the HTTP calls per order (0.10 = 10%%)')
+    parser.add_argument('--time-threshold', type=float, default=0.50,
+                        help='tolerated relative regression of the durations and peak RSS (0.50 = 50%%)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--cassette', type=Path, help='replay this recorded cassette instead of the sizes')
+    parser.add_argument('--simulate-timing', action='store_true',
+                        help='wait for the recorded duration of every replayed request')
+    parser.add_argument('--timing-factor', type=float, default=1.0, help='multiplies the simulated durations')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--working-directory', type=Path, help=argparse.SUPPRESS)
+    parser.add_argument('--extra-config', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.url, args.working_directory, args.extra_config)
+        sys.__stdout__.write(json.dumps(result))
+        return 0
+
+    calibration = calibrate()
+    print(f"Calibration workload: {calibration:.3f}s", flush=True)
+    print("Measuring startup...", flush=True)
+    results = {'startup': measure_import_time()}
+    for metric, value in results['startup'].items():
+        print(f"  {metric}: {value:.3f}" if isinstance(value, float) else f"  {metric}: {value}")
+    if args.cassette:
+        print(f"Replaying {args.cassette}...", flush=True)
+        results['cassette'] = run_cassette(args.cassette, args.simulate_timing, args.timing_factor)
+        for metric, value in results['cassette'].items():
+            print(f"  {metric}: {value:.3f}" if isinstance(value, float) else f"  {metric}: {value}")
+    for size in [] if args.cassette else [int(size) for size in args.sizes.split(',')]:
+        print(f"Benchmarking {size} orders...", flush=True)
+        results[str(size)] = run_size(size, (args.min_lines, args.max_lines), args.latency, args.repeat)
+        for metric, value in results[str(size)].items():
+            print(f"  {metric}: {value:.3f}" if isinstance(value, float) else f"  {metric}: {value}")
+
+    # Le meilleur etalonnage de la session : celui d'une machine sans autre charge
+    calibration = min([calibration] + [metrics['calibration'] for metrics in results.values()
+                                       if 'calibration' in metrics])
+    report = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'sizes': args.sizes, 'lines_per_order': [args.min_lines, args.max_lines],
+                       'latency': args.latency, 'cassette': str(args.cassette) if args.cassette else None,
+                       'simulate_timing': args.simulate_timing, 'repeat': args.repeat},
+        'calibration': calibration,
+        'results': results,
+    }
+    ratios = to_ratios(results, calibration)
+    args.output.write_text(json.dumps(dict(report, ratios=ratios), indent=2))
+    print(f"Results saved to {args.output}")
+
+    if args.save_baseline:
+        baseline = {key: value for key, value in report.items() if key != 'results'}
+        baseline.update(produced_by='python -m benchmarks.run_benchmarks --save-baseline',
+                        units='durations in calibration units (duration / calibration), http_calls_per_order, '
+                              'peak_rss_kb',
+                        ratios=ratios)
+        args.baseline.write_text(json.dumps(baseline, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.is_file():
+        print(f"No baseline found at {args.baseline}, nothing to compare")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if 'ratios' not in baseline:
+        print(f"{args.baseline} holds absolute timings, regenerate it with --save-baseline")
+        return 0
+    regressions = compare(ratios, baseline['ratios'], args.threshold, args.time_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
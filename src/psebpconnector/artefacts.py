@@ -0,0 +1,171 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import re
+import sqlite3
+import time
+import zipfile
+
+from contextlib import closing
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Fichiers laisses par chaque run dans working_directory, suffixes par l'horodatage de debut du run
+RUN_FILE_PATTERN = re.compile(r'^(?:logs|articles|orders|ebp_import_products_logs|ebp_import_orders_logs|report)_'
+                              r'(\d+(?:\.\d+)?)(?:_chunk\d+)?\.(?:txt|csv|json)$')
+
+
+class ArtefactManager:
+    """
+    Keeps the working directory small: the files of the finished runs are compressed into one zip archive per day,
+    archives are deleted past a retention age or a total size, and a SQLite index tells in which run (and archive) an
+    order was exported, and whether EBP imported it.
+    """
+
+    def __init__(self, working_directory: Path, directory: Path, retention_days: int = 90, max_total_size: int = 0,
+                 sweep_grace_period: float = 86400):
+        """
+        :param working_directory: directory where the runs leave their files
+        :param directory: directory of the archives and of the index
+        :param retention_days: archives older than this number of days are deleted, 0 keeps them
+        :param max_total_size: the oldest archives are deleted while the archives weigh more (bytes), 0 disables it
+        :param sweep_grace_period: `sweep` leaves the files of a run alone until it started and last wrote a file
+            this number of seconds ago: the run may still be going on in another process
+        """
+        self.working_directory = working_directory
+        self.directory = directory
+        self.retention_days = retention_days
+        self.max_total_size = max_total_size
+        self.sweep_grace_period = sweep_grace_period
+        self.index_path = directory / 'index.sqlite'
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS runs '
+                               '(run_id TEXT PRIMARY KEY, archive TEXT NOT NULL, started_at REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS orders '
+                               '(order_id INTEGER NOT NULL, is_refund INTEGER NOT NULL, run_id TEXT NOT NULL, '
+                               "status TEXT NOT NULL DEFAULT 'exported')")
+            # Index cree avant l'enregistrement du statut d'import
+            if 'status' not in [row[1] for row in connection.execute('PRAGMA table_info(orders)')]:
+                connection.execute("ALTER TABLE orders ADD COLUMN status TEXT NOT NULL DEFAULT 'exported'")
+            connection.execute('CREATE INDEX IF NOT EXISTS orders_order_id ON orders (order_id)')
+            connection.execute('CREATE INDEX IF NOT EXISTS orders_run_id ON orders (run_id)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def archive_path(self, started_at: float) -> Path:
+        return self.directory / f"runs_{datetime.fromtimestamp(started_at):%Y-%m-%d}.zip"
+
+    def archive_run(self, run_id: str, files: Iterable[Path], orders: Iterable[Tuple[int, bool, str]] = ()) -> Path:
+        """
+        Move the files of a finished run into the archive of its day, and index its orders.
+
+        :param run_id: start timestamp of the run, as in its file names
+        :param orders: (order ID, is refund, import status) of the documents exported by the run, the status being
+            'imported', 'rejected' (by EBP), 'import_failed' (no usable EBP log) or 'exported' (not imported)
+        """
+        started_at = float(run_id)
+        archive = self.archive_path(started_at)
+        files = [path for path in files if path.is_file()]
+        with zipfile.ZipFile(archive, 'a', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zip_file:
+            for path in files:
+                zip_file.write(path, f"{run_id}/{path.name}")
+        with closing(self._connect()) as connection, connection:
+            connection.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?)', (run_id, archive.name, started_at))
+            connection.executemany('INSERT INTO orders VALUES (?, ?, ?, ?)',
+                                   [(order_id, int(is_refund), run_id, status)
+                                    for order_id, is_refund, status in orders])
+        # Suppression apres ecriture de l'archive et de l'index seulement
+        for path in files:
+            path.unlink()
+        return archive
+
+    def sweep(self, exclude: Iterable[str] = (), now: Optional[float] = None) -> int:
+        """ Archive the files left by older runs (interrupted runs, runs before archiving was enabled), once past
+            the grace period: the runs of the other processes (daemon, backfill, other shop) are left alone
+
+        :param exclude: run IDs whose files must be left in place, such as the running one
+        :return: the number of archived runs
+        """
+        now = now or time.time()
+        exclude = set(exclude)
+        runs: Dict[str, List[Path]] = {}
+        for path in self.working_directory.iterdir():
+            match = RUN_FILE_PATTERN.match(path.name)
+            if match and match.group(1) not in exclude:
+                runs.setdefault(match.group(1), []).append(path)
+        archived = 0
+        for run_id, files in sorted(runs.items()):
+            try:
+                last_activity = max([float(run_id)] + [path.stat().st_mtime for path in files])
+            except OSError:
+                # Fichier deplace entre-temps : le run est archive par un autre processus
+                continue
+            if now - last_activity >= self.sweep_grace_period:
+                self.archive_run(run_id, files)
+                archived += 1
+        return archived
+
+    def apply_retention(self, now: Optional[float] = None) -> List[Path]:
+        """ Delete the archives past the retention age, then the oldest ones while over the size limit
+
+        :return: the deleted archives
+        """
+        now = now or time.time()
+        archives = sorted(self.directory.glob('runs_*.zip'))
+        deleted = []
+        if self.retention_days:
+            limit = f"runs_{datetime.fromtimestamp(now) - timedelta(days=self.retention_days):%Y-%m-%d}.zip"
+            deleted += [archive for archive in archives if archive.name < limit]
+        if self.max_total_size:
+            kept = [archive for archive in archives if archive not in deleted]
+            total_size = sum(archive.stat().st_size for archive in kept)
+            # Jamais l'archive du jour : elle contient le run qui vient de se terminer
+            for archive in kept[:-1]:
+                if total_size <= self.max_total_size:
+                    break
+                total_size -= archive.stat().st_size
+                deleted.append(archive)
+        if deleted:
+            with closing(self._connect()) as connection, connection:
+                for archive in deleted:
+                    run_ids = [row[0] for row in connection.execute('SELECT run_id FROM runs WHERE archive = ?',
+                                                                    (archive.name,))]
+                    connection.executemany('DELETE FROM orders WHERE run_id = ?', [(run_id,) for run_id in run_ids])
+                    connection.execute('DELETE FROM runs WHERE archive = ?', (archive.name,))
+            for archive in deleted:
+                archive.unlink()
+        return deleted
+
+    def find_order(self, order_id: int) -> List[Tuple[str, Path, bool, str]]:
+        """ :return: (run ID, archive, is refund, import status) of the runs which exported this order, oldest first """
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT orders.run_id, runs.archive, orders.is_refund, orders.status FROM orders '
+                                      'JOIN runs ON runs.run_id = orders.run_id '
+                                      'WHERE orders.order_id = ? ORDER BY runs.started_at', (order_id,)).fetchall()
+        return [(run_id, self.directory / archive, bool(is_refund), status)
+                for run_id, archive, is_refund, status in rows]
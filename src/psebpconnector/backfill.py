@@ -0,0 +1,170 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from psebpconnector.connector import Connector
+from psebpconnector.csv_writer import BackgroundCsvWriter
+from psebpconnector.exceptions import InvalidOrder
+from psebpconnector.models import Order
+from typing import Dict, List, Tuple
+
+
+PARTITIONS = ('day', 'week')
+
+
+def split_date_range(start: date, end: date, partition: str = 'day') -> List[Tuple[date, date]]:
+    """ Split [start, end] into days or weeks (starting on mondays), bounds included """
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown partition '{partition}', expected one of {', '.join(PARTITIONS)}")
+    if end < start:
+        raise ValueError(f"Backfill end date {end} is before its start date {start}")
+    partitions = []
+    first = start
+    while first <= end:
+        last = first if partition == 'day' else first + timedelta(days=6 - first.weekday())
+        last = min(last, end)
+        partitions.append((first, last))
+        first = last + timedelta(days=1)
+    return partitions
+
+
+class Backfill:
+    """
+    Export of historical orders, for example when a new EBP dossier is set up: the orders created in a date range are
+    exported whatever their exported flag, which is neither read nor updated. The range is split into day or week
+    partitions fetched in parallel, each partition gives a pair of import-ready CSV files (a chunk) and is recorded in
+    a checkpoint file as soon as it is done, so an interrupted backfill resumes with the remaining partitions.
+
+    Orders in a valid status are exported as sales, orders in a refund status as a sale and its refund.
+    """
+
+    def __init__(self, connector: Connector, start: date, end: date, partition: str = 'day', workers: int = 4):
+        """
+        :param start: first day of the range
+        :param end: last day of the range, included
+        :param partition: 'day' or 'week'
+        :param workers: number of partitions fetched at the same time
+        """
+        self.connector = connector
+        self.partitions = split_date_range(start, end, partition)
+        self.workers = workers
+        self.directory = connector.config.working_directory / f"backfill_{start:%Y%m%d}_{end:%Y%m%d}_{partition}"
+        self.checkpoint_path = self.directory / 'checkpoint.json'
+        self.checkpoint: Dict[str, dict] = {}
+
+    def _load_checkpoint(self):
+        if self.checkpoint_path.is_file():
+            self.checkpoint = json.loads(self.checkpoint_path.read_text(encoding='utf-8'))
+
+    def _save_checkpoint(self):
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(self.checkpoint, indent=2), encoding='utf-8')
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _fetch(self, first: date, last: date) -> List[Order]:
+        return list(self.connector.webservice.get_orders_by_date(datetime.combine(first, time.min),
+                                                                 datetime.combine(last, time(23, 59, 59))))
+
+    def _documents(self, orders: List[Order]) -> List[Order]:
+        config = self.connector.config
+        documents = []
+        for order in orders:
+            status = str(order.current_state)
+            if status in config.order_valid_status or status in config.order_refund_status:
+                documents.append(order)
+            if status in config.order_refund_status:
+                documents.append(replace(order, is_refund=True))
+        # Meme ordre qu'un run classique : les ventes puis les avoirs
+        return sorted(documents, key=lambda document: (document.is_refund, document.id))
+
+    def _export_partition(self, first: date, orders: List[Order]) -> dict:
+        connector = self.connector
+        articles_path = self.directory / f"articles_{first:%Y%m%d}.csv"
+        orders_path = self.directory / f"orders_{first:%Y%m%d}.csv"
+        exported, rejected = 0, 0
+        with BackgroundCsvWriter(articles_path) as csv_products, BackgroundCsvWriter(orders_path) as csv_orders:
+            # Chaque chunk doit etre importable seul : les articles sont exportes a nouveau dans chaque chunk
+            connector.csv_products = csv_products
+            connector.csv_orders = csv_orders
+            connector.exported_products = {}
+            connector.pending_orders = []
+            for order in self._documents(orders):
+                try:
+                    connector._process_order(order)
+                    exported += 1
+                    connector.report.increment('refunds_processed' if order.is_refund else 'orders_processed')
+                except InvalidOrder as e:
+                    connector.logger.warning(f"Skipping order {order.id} ({e.cause})")
+                    connector.report.record_rejection(e.cause)
+                    rejected += 1
+                    connector.report.increment('refunds_rejected' if order.is_refund else 'orders_rejected')
+        return {'documents': exported, 'rejected': rejected,
+                'articles_path': str(articles_path), 'orders_path': str(orders_path)}
+
+    def run(self) -> int:
+        """ :return: 0 when every partition was exported, 1 otherwise """
+        connector = self.connector
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_checkpoint()
+        remaining = [(first, last) for first, last in self.partitions if first.isoformat() not in self.checkpoint]
+        connector.logger.info(f"Backfill: {len(remaining)} of {len(self.partitions)} partitions to export "
+                              f"in {self.directory}")
+        exit_code = 1
+        # Les CSV du run ne servent pas : fermes (fichier et thread d'ecriture) puis remis en place a la fin, chaque
+        # partition utilisant ses propres fichiers
+        connector._close_csv_files()
+        run_csv_files = connector.csv_products, connector.csv_orders
+        try:
+            connector.warm_up()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as executor:
+                futures = {executor.submit(self._fetch, first, last): (first, last) for first, last in remaining}
+                # Les partitions sont transformees au fil de l'eau dans ce thread, les ecritures CSV restent sequentielles
+                for future in as_completed(futures):
+                    first, last = futures[future]
+                    with connector._phase('export'):
+                        entry = self._export_partition(first, future.result())
+                    entry['last_day'] = last.isoformat()
+                    self.checkpoint[first.isoformat()] = entry
+                    self._save_checkpoint()
+                    connector.logger.info(f"Backfill: partition {first} to {last} exported, "
+                                          f"{entry['documents']} documents, {entry['rejected']} rejected")
+            exit_code = 0
+        except Exception as e:
+            connector.logger.critical("A critical error was raised during the backfill, see below")
+            connector.logger.exception(e)
+        finally:
+            connector.csv_products, connector.csv_orders = run_csv_files
+            connector._write_run_report(exit_code)
+        return exit_code
+
+    def chunks(self) -> List[Tuple[Path, Path]]:
+        """ :return: the articles and orders CSV files of the exported partitions, in date order """
+        return [(Path(self.checkpoint[key]['articles_path']), Path(self.checkpoint[key]['orders_path']))
+                for key in sorted(self.checkpoint)]
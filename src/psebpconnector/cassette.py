@@ -0,0 +1,139 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import gzip
+import json
+import threading
+import time
+
+from collections import deque
+from pathlib import Path
+from psebpconnector.exceptions import CassetteMiss
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from typing import Deque, Dict, Optional, Tuple
+
+
+MODES = ('record', 'replay')
+
+
+class Cassette:
+    """
+    Record of the HTTP traffic of runs, as gzipped JSON lines: one line per request with the method, the URL
+    relative to the webservice root, the status code, the response body and the duration of the request.
+
+    In record mode every request made by `Webservice` is appended to the cassette. In replay mode the requests are
+    served from the cassette, without network: a whole `Connector.run` can be replayed as a repeatable benchmark. A
+    request made several times gets the recorded responses in the recorded order, then the last one again. Writes
+    (PATCH) are matched on their URL only, their body holds the export date.
+    """
+
+    def __init__(self, path: Path, mode: str, simulate_timing: bool = False, timing_factor: float = 1.0):
+        """
+        :param mode: 'record' or 'replay'
+        :param simulate_timing: in replay mode, wait for the recorded duration of each request
+        :param timing_factor: multiplies the waited durations (0.5: a webservice twice as fast)
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode}, expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.simulate_timing = simulate_timing
+        self.timing_factor = timing_factor
+        self._lock = threading.Lock()
+        self._file = None
+        self._interactions: Dict[Tuple[str, str, Optional[str]], Deque[dict]] = {}
+        if self.replaying:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    @staticmethod
+    def _key(method: str, url: str, data: Optional[str]) -> Tuple[str, str, Optional[str]]:
+        method = method.upper()
+        return method, url, data if method == 'GET' else None
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    interaction = json.loads(line)
+                    key = self._key(interaction['method'], interaction['url'], interaction['data'])
+                    self._interactions.setdefault(key, deque()).append(interaction)
+
+    @property
+    def interaction_count(self) -> int:
+        """ :return: the number of recorded interactions left to replay """
+        return sum(len(interactions) for interactions in self._interactions.values())
+
+    def record(self, method: str, url: str, data: Optional[str], response: Response, duration: float):
+        """
+        :param url: URL relative to the webservice root, without the credentials
+        """
+        interaction = {
+            'method': method.upper(),
+            'url': url,
+            'data': data,
+            'status_code': response.status_code,
+            'content_type': response.headers.get('Content-Type', ''),
+            'body': response.text,
+            'duration': duration,
+        }
+        line = json.dumps(interaction, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                # Ouverte au premier enregistrement, en ajout : les runs successifs (mode daemon) se suivent
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = gzip.open(self.path, 'at', encoding='utf-8')
+            self._file.write(line)
+
+    def replay(self, method: str, url: str, data: Optional[str] = None) -> Response:
+        """ :return: the recorded response of the request, after its recorded duration when timing is simulated """
+        with self._lock:
+            interactions = self._interactions.get(self._key(method, url, data))
+            if not interactions:
+                raise CassetteMiss(f"{method.upper()} {url}: not recorded in {self.path}")
+            interaction = interactions.popleft() if len(interactions) > 1 else interactions[0]
+        if self.simulate_timing:
+            time.sleep(interaction['duration'] * self.timing_factor)
+        response = Response()
+        response.status_code = interaction['status_code']
+        response.headers = CaseInsensitiveDict({'Content-Type': interaction['content_type']})
+        response.encoding = 'utf-8'
+        response._content = interaction['body'].encode('utf-8')
+        response.url = url
+        return response
+
+    def close(self):
+        """ Complete the recorded interactions so they can be replayed, the next ones are appended """
+        if self._file:
+            with self._lock:
+                self._file.close()
+                self._file = None
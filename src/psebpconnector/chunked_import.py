@@ -0,0 +1,123 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import csv
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from psebpconnector.connector import Connector
+from psebpconnector.csv_writer import read_rows
+from psebpconnector.export_models import DOCUMENT_NUMBER_COLUMN
+from psebpconnector.models import Order
+from typing import List
+
+
+@dataclass
+class ImportChunk:
+    orders_path: Path
+    logs_path: Path
+    orders: List[Order]
+
+
+class ChunkedImport:
+    """
+    Import of the orders CSV file in chunks of `chunk_size` documents, each one with its own EBP import log. As soon
+    as a chunk is imported, its confirmed documents are marked exported in Prestashop by a background thread while
+    the next chunk imports: the orders imported before a crash are not exported again by the next run.
+
+    The rows of a document are never split between two chunks. With no more documents than `chunk_size`, the CSV
+    and log files of the run are used as is.
+    """
+
+    def __init__(self, connector: Connector, chunk_size: int):
+        self.connector = connector
+        self.chunk_size = chunk_size
+        self.chunks: List[ImportChunk] = []
+        self._writeback = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writeback')
+        self._futures: List[Future] = []
+
+    @property
+    def logs_paths(self) -> List[Path]:
+        return [chunk.logs_path for chunk in self.chunks]
+
+    def run(self):
+        """ Import the chunks one after the other, the writeback of a chunk overlapping the import of the next """
+        connector = self.connector
+        try:
+            self.chunks = self.split()
+            for index, chunk in enumerate(self.chunks, 1):
+                connector.logger.info(f"Importing orders chunk {index}/{len(self.chunks)} "
+                                      f"({len(chunk.orders)} orders)")
+                connector._run_ebp_import(chunk.logs_path, chunk.orders_path, 'SaleInvoices',
+                                          connector.config.ebp_orders_config_name)
+                self._futures.append(self._writeback.submit(self._mark_chunk_exported, chunk))
+        except BaseException:
+            # Les chunks deja importes sont tout de meme marques exportes
+            self._writeback.shutdown(wait=True)
+            raise
+
+    def wait(self):
+        """ Wait for the writeback of every chunk, then raise the first error met """
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._writeback.shutdown(wait=True)
+
+    def _mark_chunk_exported(self, chunk: ImportChunk):
+        start = time.perf_counter()
+        try:
+            self.connector._mark_documents_exported(chunk.orders, chunk.logs_path)
+        finally:
+            self.connector.report.add_time('chunk_writeback', time.perf_counter() - start)
+
+    def split(self) -> List[ImportChunk]:
+        connector = self.connector
+        documents = {}
+        for row in read_rows(connector._csv_orders_path):
+            documents.setdefault(row[DOCUMENT_NUMBER_COLUMN], []).append(row)
+        if len(documents) <= self.chunk_size:
+            return [ImportChunk(connector._csv_orders_path, connector._ebp_import_orders_logs_path,
+                                list(connector.pending_orders))]
+
+        orders_by_document = {connector._document_number(order): order for order in connector.pending_orders}
+        document_numbers = list(documents)
+        chunks = []
+        for index, start in enumerate(range(0, len(document_numbers), self.chunk_size), 1):
+            numbers = document_numbers[start:start + self.chunk_size]
+            stem = f"{connector._startup_time}_chunk{index}"
+            orders_path = connector.config.working_directory / f"orders_{stem}.csv"
+            with open(orders_path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f, delimiter=';', quotechar='"')
+                for number in numbers:
+                    writer.writerows(documents[number])
+            chunks.append(ImportChunk(orders_path,
+                                      connector.config.working_directory / f"ebp_import_orders_logs_{stem}.txt",
+                                      [orders_by_document.pop(number) for number in numbers
+                                       if number in orders_by_document]))
+        # Commandes sans ligne dans le CSV : suivent le sort du dernier chunk, comme dans un import d'un seul tenant
+        chunks[-1].orders.extend(orders_by_document.values())
+        return chunks
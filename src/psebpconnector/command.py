@@ -22,19 +22,143 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import argparse
+import multiprocessing
 import os
-import sys
+from datetime import date, datetime
 from pathlib import Path
+from typing import Tuple
 
 from psebpconnector.connector import Connector
+from psebpconnector.connector_configuration import ConnectorConfiguration
+
+
+# Profiler.MODES, recopie pour ne pas charger cProfile au demarrage : le profileur n'est importe qu'avec --profile
+PROFILE_MODES = ('cprofile', 'sampling', 'all')
+
+
+def date_range(value: str) -> Tuple[date, date]:
+    start, _, end = value.partition(':')
+    try:
+        return date.fromisoformat(start), date.fromisoformat(end or start)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date range '{value}', expected YYYY-MM-DD:YYYY-MM-DD")
+
+
+def _run_date(run_id: str) -> str:
+    return f"{datetime.fromtimestamp(float(run_id)):%Y-%m-%d %H:%M:%S}"
+
+
+def find_order(config: ConnectorConfiguration, order_id: int):
+    """ Print the exports of an order (and of its refund) recorded in the ledger and in the index of the run
+        archives """
+    if not config.ledger_path and not config.artefacts_directory:
+        print("Neither the [ledger] nor the [artefacts] section is configured, the exported orders are not recorded")
+        return
+    if config.ledger_path:
+        from psebpconnector.ledger import ExportLedger
+        entries = []
+        if config.ledger_path.is_file():
+            ledger = ExportLedger(config.ledger_path, config.ledger_wal)
+            try:
+                entries = ledger.history(order_id)
+            finally:
+                ledger.close()
+        if not entries:
+            print(f"Order {order_id}: not found in the ledger")
+        for entry in entries:
+            print(f"{'Refund' if entry.is_refund else 'Order'} {order_id}: document {entry.document_number}, "
+                  f"run {entry.run_id} ({_run_date(entry.run_id)}), {entry.status}, {len(entry.rows)} rows")
+    if config.artefacts_directory:
+        from psebpconnector.artefacts import ArtefactManager
+        artefacts = ArtefactManager(config.working_directory, config.artefacts_directory)
+        runs = artefacts.find_order(order_id)
+        if not runs:
+            print(f"Order {order_id}: not found in the archives index")
+        for run_id, archive, is_refund, status in runs:
+            print(f"{'Refund' if is_refund else 'Order'} {order_id}: run {run_id} ({_run_date(run_id)}), {status}, "
+                  f"archive {archive}")
 
 
 def main():
-    if len(sys.argv) < 2:
-        config_file_path = Path(os.environ['PROGRAMDATA']) / Path('PS EBP Connector') / Path('config.ini')
+    # Executable PyInstaller (onefile) : les workers de --shards relancent l'executable, qui doit les reconnaitre
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='Synchronize Prestashop orders with EBP Gestion Commerciale')
+    parser.add_argument('config_file_path', nargs='*', help='configuration file, one per shop, defaults to '
+                                                            '%%PROGRAMDATA%%\\PS EBP Connector\\config.ini')
+    parser.add_argument('--profile', nargs='?', const='all', choices=PROFILE_MODES,
+                        help='profile the run phases, files are written in the working directory')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and synchronize on the schedule of the [daemon] section')
+    parser.add_argument('--trigger', action='store_true',
+                        help='keep running and synchronize the orders notified as configured in the [trigger] section')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='split the export of a large backlog between this number of worker processes')
+    parser.add_argument('--backfill', type=date_range, metavar='START:END',
+                        help='export the orders created between these dates (YYYY-MM-DD:YYYY-MM-DD) without touching '
+                             'their exported flag, in import-ready CSV chunks')
+    parser.add_argument('--partition', default='day', help="backfill partition size, 'day' or 'week'")
+    parser.add_argument('--find-order', type=int, metavar='ORDER_ID',
+                        help='print the runs which exported this order and their import status, from the ledger '
+                             'and the archives index, then exit')
+    args = parser.parse_args()
+
+    if len(args.config_file_path) > 1:
+        if args.find_order:
+            parser.error('--find-order requires a single configuration file')
+        if args.trigger:
+            parser.error('--trigger requires a single configuration file')
+        if args.shards or args.backfill:
+            parser.error('--shards and --backfill require a single configuration file')
+        # Les modules propres a chaque mode sont importes a la demande, pour ne pas ralentir le demarrage
+        # Plusieurs boutiques : le runner se comporte comme un connecteur, le daemon suit le [daemon] de la premiere
+        from psebpconnector.multi_shop import MultiShopRunner
+        connector = MultiShopRunner([Path(path) for path in args.config_file_path], profile=args.profile)
+    else:
+        if args.config_file_path:
+            config_file_path = args.config_file_path[0]
+        else:
+            config_file_path = Path(os.environ['PROGRAMDATA']) / Path('PS EBP Connector') / Path('config.ini')
+        if args.find_order:
+            # Simple consultation : pas de Connector, qui ouvrirait les fichiers d'un nouveau run
+            return find_order(ConnectorConfiguration(Path(config_file_path)), args.find_order)
+        connector = Connector(Path(config_file_path), profile=args.profile)
+    if args.trigger:
+        from psebpconnector.order_trigger import OrderTrigger
+        config = connector.config
+        trigger = OrderTrigger(connector,
+                               listen=config.trigger_listen,
+                               spool_directory=config.trigger_spool_directory,
+                               batch_size=config.trigger_batch_size,
+                               batch_window=config.trigger_batch_window,
+                               token=config.trigger_token,
+                               retry_delay=config.trigger_retry_delay,
+                               max_retry_delay=config.trigger_max_retry_delay)
+        trigger.install_signal_handlers()
+        trigger.run_forever()
+    elif args.daemon:
+        from psebpconnector.daemon import Daemon
+        daemon = Daemon(connector, connector.config.daemon_interval, connector.config.daemon_cron)
+        daemon.install_signal_handlers()
+        daemon.run_forever()
+    elif args.backfill:
+        from psebpconnector.backfill import Backfill
+        try:
+            backfill = Backfill(connector, args.backfill[0], args.backfill[1], args.partition)
+        except ValueError as e:
+            parser.error(str(e))
+        backfill.run()
+    elif args.shards:
+        connector.run(shards=args.shards)
     else:
-        config_file_path = sys.argv[1]
-    Connector(Path(config_file_path)).run()
+        connector.run()
+    # Le run est termine (rapport ecrit) : on laisse au plus flush_timeout secondes a l'envoi des mails,
+    # ce qui n'est pas parti reste dans l'outbox pour le prochain run
+    for shop_connector in connector.connectors.values() if len(args.config_file_path) > 1 else [connector]:
+        if shop_connector.mail_outbox:
+            shop_connector.mail_outbox.wait(shop_connector.config.o365_flush_timeout)
+    if len(args.config_file_path) > 1:
+        connector.close()
 
 
 if __name__ == '__main__':
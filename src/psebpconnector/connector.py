@@ -23,62 +23,129 @@ SOFTWARE.
 """
 
 
-import csv
 import logging
 import re
 import subprocess
 import sys
 import time
 
+from contextlib import contextmanager
 from dataclasses import asdict
 from datetime import datetime
+from psebpconnector import money
 from psebpconnector.connector_configuration import ConnectorConfiguration
+from psebpconnector.csv_writer import BackgroundCsvWriter
 from psebpconnector.dummy_handler import DummyHandler
 from psebpconnector.exceptions import BadHTTPCode, InvalidOrder
 from psebpconnector.export_models import ExportOrderRow, ExportProduct
-from psebpconnector.mailer import Mailer
+from psebpconnector.mapping_index import (VAT_MAPPING_EXONERATION_ID, MappingIndex, parse_payment_method_mapping,
+                                         parse_vat_mapping)
 from psebpconnector.models import Order, OrderRow, Address
+from psebpconnector.reconciliation import parse_import_log
+from psebpconnector.reference_data import ReferenceData
+from psebpconnector.run_report import RunReport
+from psebpconnector.shared_resources import DatabaseLocks, MappingCache
 from psebpconnector.webservice import Webservice
+from psebpconnector.writeback_outbox import WritebackOutbox
 from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 
 class Connector:
-    VAT_MAPPING_EXONERATION_ID = -1
+    VAT_MAPPING_EXONERATION_ID = VAT_MAPPING_EXONERATION_ID
 
-    def __init__(self, config_path: Path):
+    def __init__(self, config_path: Path, profile: Optional[str] = None, name: Optional[str] = None,
+                 mapping_cache: Optional[MappingCache] = None, database_locks: Optional[DatabaseLocks] = None,
+                 working_directory: Optional[Path] = None, ledger_path: Optional[Path] = None):
         """
         New Connector object
 
         :param config_path: The path to the configuration file.
+        :param profile: Profiling mode ('cprofile', 'sampling' or 'all'), overrides the `profile` configuration option.
+        :param name: Shop name when several shops are synchronized by the same process, the connector then logs
+            through its own `ps_ebp_connector.<name>` logger.
+        :param mapping_cache: Mapping files cache shared between connectors.
+        :param database_locks: EBP database locks shared between connectors.
+        :param working_directory: Overrides the `working_directory` configuration option.
+        :param ledger_path: Overrides the path of the ledger, when the ledger is enabled.
         :raises:
             FileNotFoundError: If the configuration file does not exist at the given path.
             ValueError: If there is an error reading the configuration file.
         """
-        self.countries_iso_code = {}
-        self.currencies_iso_code = {}
-        self._startup_time = time.time()
-        self.config = ConnectorConfiguration(config_path)
-        self._logs_file_path = Path(self.config.working_directory / f"logs_{self._startup_time}.txt")
+        self.config_path = config_path
+        self.config = ConnectorConfiguration(config_path, working_directory)
+        if ledger_path and self.config.ledger_path:
+            self.config.ledger_path = Path(ledger_path)
+        self.webservice = Webservice(self.config.url, self.config.apikey, language_id=self.config.language_id)
+        self.reference_data = ReferenceData(self.webservice, self.config.working_directory / 'reference_data.json',
+                                            self.config.reference_data_ttl)
+        self.profiler = None
+        self.name = name
+        self.mapping_cache = mapping_cache
+        self.database_locks = database_locks
+        self._profile = profile or self.config.profile
+        self._logs_file_handler = None
         self._setup_logger()
-        self._csv_products_path = Path(self.config.working_directory / f"articles_{self._startup_time}.csv")
-        self._csv_products_file = open(self._csv_products_path, 'w', encoding='utf-8-sig', newline='')
-        self.csv_products = csv.writer(self._csv_products_file, delimiter=';', quotechar='"')
-        self._csv_orders_path = Path(self.config.working_directory / f"orders_{self._startup_time}.csv")
-        self._csv_orders_file = open(self._csv_orders_path, 'w', encoding='utf-8-sig', newline='')
-        self.csv_orders = csv.writer(self._csv_orders_file, delimiter=';', quotechar='"')
-        self.exported_products = set()
-        self.pending_orders = []
-        self.webservice = Webservice(self.config.url, self.config.apikey)
-        self._ebp_import_products_logs_path = self.config.working_directory / f"ebp_import_products_logs_{self._startup_time}.txt"
-        self._ebp_import_orders_logs_path = self.config.working_directory / f"ebp_import_orders_logs_{self._startup_time}.txt"
+        self._authenticated = False
+        self._mappings_signature = None
+        self._run_count = 0
+        self._prepare_run()
 
+        # Modules optionnels importes seulement s'ils sont configures : demarrage plus rapide
         if self.config.o365_email:
+            from psebpconnector.mail_outbox import MailOutbox
+            from psebpconnector.mailer import Mailer
             self.mailer = Mailer(self.config.o365_client_id,
                                  self.config.o365_secret,
                                  self.config.o365_tenant_id,
                                  self.config.o365_email)
+            self.mail_outbox = MailOutbox(self.config.working_directory / 'outbox',
+                                          self.config.o365_max_attachment_size, self.logger,
+                                          self.config.o365_max_attempts)
         else:
             self.mailer = None
+            self.mail_outbox = None
+
+        if self.config.cassette_mode:
+            from psebpconnector.cassette import Cassette
+            self.webservice.cassette = Cassette(self.config.cassette_path, self.config.cassette_mode,
+                                                self.config.cassette_simulate_timing,
+                                                self.config.cassette_timing_factor)
+
+        if self.config.ledger_path:
+            from psebpconnector.ledger import ExportLedger
+            self.ledger = ExportLedger(self.config.ledger_path, self.config.ledger_wal)
+        else:
+            self.ledger = None
+
+        self.writeback_outbox = WritebackOutbox(self.config.working_directory / 'writeback_outbox.json')
+
+        if self.config.quarantine_path:
+            from psebpconnector.quarantine import Quarantine
+            self.quarantine = Quarantine(self.config.quarantine_path, self.config.quarantine_base_delay,
+                                         self.config.quarantine_max_delay)
+        else:
+            self.quarantine = None
+
+        if self.config.artefacts_directory:
+            from psebpconnector.artefacts import ArtefactManager
+            self.artefacts = ArtefactManager(self.config.working_directory, self.config.artefacts_directory,
+                                             self.config.artefacts_retention_days,
+                                             self.config.artefacts_max_total_size,
+                                             self.config.artefacts_sweep_grace_period)
+        else:
+            self.artefacts = None
+
+        if self.config.metrics_textfile_path:
+            from psebpconnector.metrics_exporter import MetricsExporter
+            # Label shop : distingue les series de plusieurs connecteurs ecrivant dans le meme collecteur
+            shop = self.name or urlsplit(self.config.url).hostname or self.config.url
+            self.metrics_exporter = MetricsExporter(self.config.metrics_textfile_path, self.config.metrics_interval,
+                                                    labels={'shop': shop})
+        else:
+            self.metrics_exporter = None
 
 
         """
@@ -97,63 +164,84 @@ class Connector:
         """
         self.vat_mapping = {}
 
+        # Index compile des deux tables ci-dessus, utilise pour les recherches par commande
+        self.mapping_index: Optional[MappingIndex] = None
+
     def _check_if_vat_applied(self, order):
         """ Check if VAT has been applied to this order by looking at the difference between the total order price
             and the total order price without VAT.
         """
-        vat_applied = float(order.total_products_wt) - float(order.total_products) > 0
+        vat_applied = money.parse(order.total_products_wt) > money.parse(order.total_products)
         self.logger.debug(f"Order {order.id}: total_products_wt: {order.total_products_wt}, "
                           f"total_products: {order.total_products}, "
                           f"VAT applied: {vat_applied}")
         return vat_applied
 
-    def _check_territoriality_consistency(self):
-        for payment_method in self.payment_method_mapping:
-            for has_vat in self.payment_method_mapping[payment_method]:
-                territoriality = self.payment_method_mapping[payment_method][has_vat][2]
-                assert territoriality in self.vat_mapping, f"Territoriality '{territoriality}' not found in VAT mapping file"
-
     @staticmethod
-    def _compute_order_total(order, order_rows, vat_value):
-        total = 0.0
-        for order_row in order_rows:
-            total += float(order_row.unit_price_tax_excl) * int(order_row.product_quantity)
-        total += float(order.total_shipping_tax_excl)
-        return total * (1 + vat_value)
+    def _compute_order_total(order, order_rows, vat_value) -> int:
+        """ :return: the order total including VAT, in micro-units (see `money`) """
+        total = sum(money.parse(order_row.unit_price_tax_excl) * int(order_row.product_quantity)
+                    for order_row in order_rows)
+        total += money.parse(order.total_shipping_tax_excl)
+        return money.divide(total * (money.MICRO + money.parse(vat_value)), money.MICRO)
+
+    @property
+    def countries_iso_code(self) -> Dict[int, str]:
+        # Lu a chaque fois : un rafraichissement des donnees de reference remplace le dict
+        return self.reference_data.countries
+
+    @property
+    def currencies_iso_code(self) -> Dict[int, str]:
+        return self.reference_data.currencies
 
     def _get_country_iso_code(self, country_id):
         country_id = int(country_id)
-        if country_id not in self.countries_iso_code:
+        iso_code = self.reference_data.country_iso_code(country_id)
+        if iso_code is None:
             self.logger.error(f"Unable to find country iso code for country_id {country_id}")
-            raise InvalidOrder
-        return self.countries_iso_code[country_id]
+            raise InvalidOrder('unknown_country')
+        return iso_code
 
     def _get_currency_iso_code(self, currency_id):
-        if currency_id not in self.currencies_iso_code:
+        iso_code = self.reference_data.currency_iso_code(int(currency_id))
+        if iso_code is None:
             self.logger.error(f"Unable to find currency iso code for country_id {currency_id}")
-            raise InvalidOrder
-        return self.currencies_iso_code[currency_id]
+            raise InvalidOrder('unknown_currency')
+        return iso_code
 
     def _get_info_from_payment_method(self, order, vat_applied):
-        try:
-            ebp_client_code, currency, territoriality, ebp_payment_method = self.payment_method_mapping[order.payment][vat_applied]
-        except KeyError:
+        info = self.mapping_index.payment_method(order.payment, vat_applied)
+        if info is None:
             self.logger.error(f"Order {order.id}: no payment method found for {order.payment}, with_vat: {vat_applied}, "
                               f"skipping order {order.id}")
-            raise InvalidOrder
+            raise InvalidOrder('unknown_payment_method')
+        ebp_client_code, currency, territoriality, ebp_payment_method = info
         self.logger.debug(f"Order {order.id}: ebp_client_code: {ebp_client_code}, "
                           f"currency: {currency}, "
                           f"territoriality: {territoriality}, "
                           f"ebp_payment_method: {ebp_payment_method}")
         return ebp_client_code, currency, territoriality, ebp_payment_method
 
+    def _validate_payment_method(self, order: Order, vat_applied_by_totals: bool):
+        """ Offline check of the payment method, before the addresses are fetched: whether VAT applies also depends
+            on the delivery country, so the order is only rejected if no possible case is mapped. """
+        infos = [info for info in {self.mapping_index.payment_method(order.payment, with_vat)
+                                   for with_vat in {False, vat_applied_by_totals}} if info is not None]
+        if not infos:
+            self.logger.error(f"Order {order.id}: no payment method found for {order.payment}, skipping order {order.id}")
+            raise InvalidOrder('unknown_payment_method')
+        if not any(territoriality in self.mapping_index.territorialities for _, _, territoriality, _ in infos):
+            self.logger.error(f"Order {order.id}: territoriality of payment method {order.payment} not found in VAT "
+                              f"mapping file")
+            raise InvalidOrder('unknown_territoriality')
+
     def _get_order_delivery_address(self, order):
         try:
             address = self.webservice.get_address(order.id_address_delivery)
         except BadHTTPCode as e:
             self.logger.error(f"Order {order.id}: error while trying to retrieve delivery address (ID "
                               f"{order.id_address_delivery}) - {e}")
-            raise InvalidOrder
+            raise InvalidOrder('delivery_address_unavailable')
         self.logger.debug(f"Order {order.id}: found delivery address {address}")
         return address
 
@@ -163,7 +251,7 @@ class Connector:
         except BadHTTPCode as e:
             self.logger.error(f"Order {order.id}: error while trying to retrieve invoice address (ID "
                               f"{order.id_address_invoice}) - {e}")
-            raise InvalidOrder
+            raise InvalidOrder('invoice_address_unavailable')
         self.logger.debug(f"Order {order.id}: found invoice address {address}")
         return address
 
@@ -172,7 +260,7 @@ class Connector:
                 or 'order_rows' not in order.associations
                 or len(order.associations['order_rows']) == 0):
             self.logger.error(f"Order {order.id}: no product found for this order")
-            raise InvalidOrder
+            raise InvalidOrder('no_order_rows')
 
         rows = []
         try:
@@ -181,11 +269,11 @@ class Connector:
                 self.logger.debug(f"Order {order.id}: has order row {order_row}")
                 if order_row.product_id == 0:
                     self.logger.error(f"Order {order.id}: invalid product_id {order_row_entry['product_id']}, skipping")
-                    raise InvalidOrder
+                    raise InvalidOrder('invalid_product_id')
                 rows.append(order_row)
         except (KeyError, TypeError) as e:
             self.logger.error(f"Order {order.id}: malformed order rows - {order.associations}, {e}")
-            raise InvalidOrder
+            raise InvalidOrder('malformed_order_rows')
         return rows
 
     def _get_order_vat(self, order, territoriality, ps_country_id, vat_applied):
@@ -195,77 +283,195 @@ class Connector:
             :param ps_country_id: Prestashop country ID of the delivery address
         """
         ps_country_id = int(ps_country_id)
-        if territoriality not in self.vat_mapping:
+        if territoriality not in self.mapping_index.territorialities:
             self.logger.error(f"Order {order.id}: territoriality '{territoriality}' not found in VAT mapping file")
-            raise InvalidOrder
+            raise InvalidOrder('unknown_territoriality')
 
         if vat_applied:
-            if ps_country_id not in self.vat_mapping[territoriality]:
+            vat = self.mapping_index.vat_rate(territoriality, ps_country_id)
+            if vat is None:
                 self.logger.error(f"Order {order.id}: country ID '{ps_country_id}' ({self._get_country_iso_code(ps_country_id)}) not found in VAT mapping file for "
                                   f"territoriality '{territoriality}'")
-                raise InvalidOrder
-            vat_value, ebp_vat_id = self.vat_mapping[territoriality][ps_country_id]
+                raise InvalidOrder('unknown_vat_country')
         else:
-            if self.VAT_MAPPING_EXONERATION_ID not in self.vat_mapping[territoriality]:
+            vat = self.mapping_index.vat_rate(territoriality, self.VAT_MAPPING_EXONERATION_ID)
+            if vat is None:
                 self.logger.warning(f"Order {order.id}: VAT_MAPPING_EXONERATION_ID ({self.VAT_MAPPING_EXONERATION_ID}) "
                                     f"not found in VAT mapping file for territoriality {territoriality}")
-                raise InvalidOrder
-            vat_value, ebp_vat_id = self.vat_mapping[territoriality][self.VAT_MAPPING_EXONERATION_ID]
+                raise InvalidOrder('missing_vat_exoneration')
+        vat_value, ebp_vat_id = vat
 
         self.logger.debug(f"Order {order.id}: vat_value={vat_value}, ebp_vat_id={ebp_vat_id}")
         return vat_value, ebp_vat_id
 
+    @contextmanager
+    def _phase(self, name: str):
+        """ Time a phase of the run in the run report, and profile it when profiling is enabled """
+        with self.report.phase(name):
+            if self.profiler:
+                with self.profiler.phase(name):
+                    yield
+            else:
+                yield
+
+    def _prepare_run(self):
+        """ Set up the files and the state of a new run: CSV, logs and report files are specific to each run, while
+            the webservice session, the mapping tables and the reference data are kept from one run to the next. """
+        for csv_writer in [getattr(self, 'csv_products', None), getattr(self, 'csv_orders', None)]:
+            if csv_writer:
+                csv_writer.close()
+        self._startup_time = time.time()
+        # Identifiant du run dans le registre et les archives, celui du processus principal pour un worker de shard
+        self.run_id = str(self._startup_time)
+        self._logs_file_path = Path(self.config.working_directory / f"logs_{self._startup_time}.txt")
+        self._run_report_path = Path(self.config.working_directory / f"report_{self._startup_time}.json")
+        self._open_logs_file()
+        self.report = RunReport()
+        self._csv_products_path = Path(self.config.working_directory / f"articles_{self._startup_time}.csv")
+        self.csv_products = BackgroundCsvWriter(self._csv_products_path)
+        self._csv_orders_path = Path(self.config.working_directory / f"orders_{self._startup_time}.csv")
+        self.csv_orders = BackgroundCsvWriter(self._csv_orders_path)
+        # Articles exportes, dans l'ordre de leurs lignes du fichier CSV
+        self.exported_products: Dict[int, ExportProduct] = {}
+        self.pending_orders = []
+        # Resultat de l'import EBP de chaque document du run, (ID, avoir) -> 'imported', 'rejected'...
+        self.import_statuses: Dict[Tuple[int, bool], str] = {}
+        self.webservice.report = self.report
+        self.webservice.order_error_counter = 0
+        self.webservice.refund_error_counter = 0
+        self._ebp_import_products_logs_path = self.config.working_directory / f"ebp_import_products_logs_{self._startup_time}.txt"
+        self._ebp_import_orders_logs_path = self.config.working_directory / f"ebp_import_orders_logs_{self._startup_time}.txt"
+        self._chunked_import = None
+
+        if self.profiler:
+            self.webservice.request_listeners.remove(self.profiler.trace_request)
+        if self._profile:
+            from psebpconnector.profiler import Profiler
+            self.profiler = Profiler(self.config.working_directory, str(self._startup_time), self._profile)
+            self.webservice.request_listeners.append(self.profiler.trace_request)
+
     def _process_order(self, order):
         self.logger.debug(order)
+        if self.ledger:
+            order_hash = self.ledger.order_hash(order, self._mappings_signature)
+            rows = self.ledger.reusable_rows(order.id, order.is_refund, order_hash)
+            if rows is not None:
+                self._export_ledger_rows(order, rows)
+            else:
+                rows = [(order_row.product_id, asdict(export_order_row))
+                        for order_row, export_order_row in self._transform_order(order)]
+            self.ledger.record(order, self._document_number(order), self.run_id, order_hash, rows)
+        else:
+            self._transform_order(order)
+        # Ne PAS marquer exported ici : on attend la confirmation de l'import EBP
+        # (cf. mark_exported_orders) pour ne pas perdre une commande rejetee par EBP.
+        self.pending_orders.append(order)
+
+    def _export_ledger_rows(self, order: Order, rows: List[Tuple[int, dict]]):
+        """ Export an order unchanged since its last export with the rows recorded in the ledger: no address fetch
+            and no transformation, only the document date is updated """
+        self.logger.debug(f"Order {order.id}: unchanged since its last export, rows taken from the ledger")
+        self.report.increment('ledger_rows_reused', len(rows))
+        for product_id, row in rows:
+            self.export_product(product_id)
+            export_order_row = ExportOrderRow(**{**row, 'document_date': datetime.now().strftime('%d/%m/%Y')})
+            with self.report.phase('csv_write'):
+                self._write_csv_line(export_order_row, self.csv_orders)
+            self.report.increment('rows_exported')
+
+    @staticmethod
+    def _document_number(order: Order) -> str:
+        return f"{order.id}11" if order.is_refund else f"{order.id}"
+
+    def _transform_order(self, order: Order) -> List[Tuple[OrderRow, ExportOrderRow]]:
+        # Controles sans reseau d'abord : une commande mal configuree ne coute aucun appel HTTP
+        order_rows = self._get_order_rows(order)
+        vat_applied_by_totals = self._check_if_vat_applied(order)
+        self._validate_payment_method(order, vat_applied_by_totals)
         delivery_address = self._get_order_delivery_address(order)
-        vat_applied = False if delivery_address.id_country == 21 else self._check_if_vat_applied(order)
+        vat_applied = False if delivery_address.id_country == 21 else vat_applied_by_totals
         ebp_client_code, currency, territoriality, ebp_payment_method = self._get_info_from_payment_method(order, vat_applied)
         invoice_address = self._get_order_invoice_address(order)
         vat_value, ebp_vat_id = self._get_order_vat(order, territoriality, delivery_address.id_country, vat_applied)
-        order_rows = self._get_order_rows(order)
+        amounts = money.OrderAmounts.from_order(order, vat_value)
+        exported_rows = []
         for order_row in order_rows:
             self.export_product(order_row.product_id)
-            self.export_order_row(order, order_row, delivery_address, invoice_address, ebp_vat_id,
-                                  ebp_client_code, ebp_payment_method, territoriality, vat_value)
-        # Ne PAS marquer exported ici : on attend la confirmation de l'import EBP
-        # (cf. mark_exported_orders) pour ne pas perdre une commande rejetee par EBP.
-        self.pending_orders.append(order)
+            exported_rows.append((order_row, self.export_order_row(order, order_row, delivery_address,
+                                                                   invoice_address, ebp_vat_id, ebp_client_code,
+                                                                   ebp_payment_method, territoriality, vat_value,
+                                                                   amounts)))
+        return exported_rows
 
     def _setup_logger(self):
-        logger = logging.getLogger('ps_ebp_connector')
+        if self.name:
+            # Un logger par boutique : les journaux et la detection d'erreurs ne se melangent pas entre boutiques
+            logger = logging.getLogger(f"ps_ebp_connector.{self.name}")
+            logger.propagate = False
+            prefix = f"ps_ebp_connector - {self.name}"
+        else:
+            logger = logging.getLogger('ps_ebp_connector')
+            prefix = 'ps_ebp_connector'
         logger.setLevel(logging.DEBUG)
 
         # STDOUT logs
         handler = logging.StreamHandler(sys.stdout)
-        handler.setFormatter(logging.Formatter('ps_ebp_connector - [%(levelname)s] %(message)s'))
+        handler.setFormatter(logging.Formatter(f"{prefix} - [%(levelname)s] %(message)s"))
         handler.setLevel(logging.DEBUG)
         handler.addFilter(lambda record: record.levelno <= logging.INFO)
         logger.addHandler(handler)
 
         # STDERR logs
         handler = logging.StreamHandler(sys.stderr)
-        handler.setFormatter(logging.Formatter('ps_ebp_connector - [%(levelname)s] %(message)s'))
+        handler.setFormatter(logging.Formatter(f"{prefix} - [%(levelname)s] %(message)s"))
         handler.setLevel(logging.WARNING)
         logger.addHandler(handler)
 
-        handler = logging.FileHandler(self._logs_file_path)
-        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
-        handler.setLevel(logging.DEBUG)
-        logger.addHandler(handler)
-
         handler = DummyHandler()
         handler.setLevel(logging.WARNING)
         logger.addHandler(handler)
+        self._errors_handler = handler
 
         self.logger = logger
 
+    def _open_logs_file(self):
+        """ (Re)open the logs file handler on the logs file of the current run """
+        if self._logs_file_handler:
+            self._logs_file_handler.close()
+            self.logger.removeHandler(self._logs_file_handler)
+        self._logs_file_handler = logging.FileHandler(self._logs_file_path)
+        self._logs_file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        self._logs_file_handler.setLevel(logging.DEBUG)
+        self.logger.addHandler(self._logs_file_handler)
+        self._errors_handler.log_emitted = False
+
+    def _write_run_report(self, exit_code: int):
+        self.report.outcome.update({
+            'exit_code': exit_code,
+            'errors_logged': self.errors_logged(),
+            'errors_raised_by_ebp': self.errors_raised_by_ebp(),
+            'order_error_counter': self.webservice.order_error_counter,
+            'refund_error_counter': self.webservice.refund_error_counter,
+        })
+        try:
+            self.report.write(self._run_report_path)
+        except OSError as e:
+            self.logger.error(f"Unable to write run report {self._run_report_path} - {e}")
+        if self.metrics_exporter:
+            try:
+                self.metrics_exporter.finish(self.report, exit_code == 0)
+            except OSError as e:
+                self.logger.error(f"Unable to write metrics textfile {self.metrics_exporter.textfile_path} - {e}")
+
     @staticmethod
     def _write_csv_line(obj, spamwriter):
         """write a line in a CSV using a dataclass as input"""
         spamwriter.writerow(list(asdict(obj).values()))
 
     def check_consistency(self):
-        self._check_territoriality_consistency()
+        """ Compile the mapping tables and check that they are consistent, see `MappingIndex.validate` """
+        self.mapping_index = MappingIndex.from_nested(self.payment_method_mapping, self.vat_mapping)
+        self.mapping_index.validate()
 
     @staticmethod
     def check_ebp_records_imported(log: str) -> bool:
@@ -278,13 +484,17 @@ class Connector:
         return int(result.group(1)) == int(result.group(2))
 
     def errors_logged(self):
-        return self.logger.handlers[3].log_emitted
+        return self._errors_handler.log_emitted
+
+    def _ebp_import_orders_logs_paths(self) -> List[Path]:
+        """ :return: the EBP import logs of the orders, one per chunk with `import_chunk_size` """
+        return self._chunked_import.logs_paths if self._chunked_import else [self._ebp_import_orders_logs_path]
 
     def errors_raised_by_ebp(self):
-        if not self._ebp_import_orders_logs_path.is_file() or not self._ebp_import_products_logs_path.is_file():
+        logs_paths = [self._ebp_import_products_logs_path] + self._ebp_import_orders_logs_paths()
+        if not all(path.is_file() for path in logs_paths):
             return True
-        return not (self.check_ebp_records_imported(self._ebp_import_orders_logs_path.read_text().lower()) and
-                self.check_ebp_records_imported(self._ebp_import_products_logs_path.read_text().lower()))
+        return not all(self.check_ebp_records_imported(path.read_text().lower()) for path in logs_paths)
 
     def export_order_row(self,
                          order: Order,
@@ -295,7 +505,10 @@ class Connector:
                          ebp_client_code: str,
                          ebp_payment_method: str,
                          ebp_territoriality: str,
-                         vat_rate: float):
+                         vat_rate: float,
+                         amounts: Optional[money.OrderAmounts] = None) -> ExportOrderRow:
+        """ :param amounts: order level amounts shared by the rows of the order, computed when not given """
+        amounts = amounts or money.OrderAmounts.from_order(order, vat_rate)
         export_order_row = ExportOrderRow(
             document_use_original_number='N',
             document_number_prefix='V',
@@ -335,25 +548,25 @@ class Connector:
             document_delivery_email='nomail@nomail.fr',
             document_territoriality=ebp_territoriality,
             document_vat_number="" if str(invoice_address.vat_number) == '0' else str(invoice_address.vat_number).replace(' ', '').upper(),
-            document_discount_pct=f"{round(float(order.total_discounts) / float(order.total_products_wt) * 100, 6):06f}",
+            document_discount_pct=amounts.discount_pct,
             document_discount_amount=f"{order.total_discounts}",
             document_escompte_pct='',
             document_escompte_amount='',
             document_shipping_cost_code='',
-            document_shipping_cost_notax=f"{round((float(order.total_shipping) / (1 + vat_rate)), 6):06f}",
-            document_shipping_cost_vat_rate=f"{round(vat_rate * 100, 6)}",
+            document_shipping_cost_notax=amounts.shipping_notax,
+            document_shipping_cost_vat_rate=amounts.shipping_vat_rate,
             document_shipping_tva_code=f"{ebp_vat_id}",
             document_total_notax='',
-            document_total='' if float(order.total_discounts) > 0 else f"{round((float(order.total_products_wt) + float(order.total_shipping)), 6):06f}",
+            document_total=amounts.total,
             document_notes=f"Commande importée n°{order.id} - {order.reference}",
             line_product_code=f"{order_row.product_ean13}",
             line_description=f"{order_row.product_name}",
             line_quantity=f"{order_row.product_quantity}",
-            line_vat_rate=f"{round(vat_rate * 100, 6):06f}",
+            line_vat_rate=amounts.vat_rate,
             line_vat_code=f"{ebp_vat_id}",
             document_commercial_code='',
             line_unit_price_notax='',
-            line_unit_price=f"{round(float(order_row.unit_price_tax_incl), 6):06f}",
+            line_unit_price=money.format_amount(money.parse(order_row.unit_price_tax_incl)),
             line_discount_pct='0',
             line_discount_notax='0',
             line_price_notax='',
@@ -366,18 +579,18 @@ class Connector:
             document_ignore_prices='0',
             document_name_delivery_address=f"{delivery_address.lastname.upper()} {delivery_address.firstname.upper()}",
             document_depot='',
-            document_currency_rate=f"{round(float(order.conversion_rate), 6):06f}" if float(order.conversion_rate) != 1.0 else '',
-            document_currency_iso_code=f"{self._get_currency_iso_code(order.id_currency)}" if float(order.conversion_rate) != 1.0 else '',
+            document_currency_rate=amounts.currency_rate,
+            document_currency_iso_code=f"{self._get_currency_iso_code(order.id_currency)}" if amounts.foreign_currency else '',
             deposit_amount_currency='',
             deposit_currency_rate='',
             deposit_currency_iso_code='',
-            document_currency_amount=f"{round(float(order.total_products_wt) + float(order.total_shipping), 6):06f}" if float(order.conversion_rate) != 1.0 else '',
+            document_currency_amount=amounts.currency_amount,
             document_currency_amount_notax='',
-            document_currency_amount_shipping_notax=f"{round(float(order.total_shipping) / (1 + vat_rate), 6):06f}" if float(order.conversion_rate) != 1.0 else '',
-            line_currency_unit_price_notax=f"{round(float(order_row.product_price), 6):06f}" if float(order.conversion_rate) != 1.0 else '',
+            document_currency_amount_shipping_notax=amounts.currency_shipping_notax,
+            line_currency_unit_price_notax=money.format_amount(money.parse(order_row.product_price)) if amounts.foreign_currency else '',
             line_currency_cumulative_discount_amount_notax='',
             line_currency_total_notax='',
-            document_currency_used='T' if float(order.conversion_rate) != 1.0 else 'P',
+            document_currency_used='T' if amounts.foreign_currency else 'P',
             document_series='',
             document_business_code='',
             mroad_id='',
@@ -397,10 +610,16 @@ class Connector:
             export_order_row.document_number_suffix += "11"
             export_order_row.document_number += "11"
         self.logger.debug(f"Order {order.id}, export_order_row: {export_order_row}")
-        self._write_csv_line(export_order_row, self.csv_orders)
+        with self.report.phase('csv_write'):
+            self._write_csv_line(export_order_row, self.csv_orders)
+        self.report.increment('rows_exported')
+        return export_order_row
 
     def export_product(self, product_id: int):
-        if product_id not in self.exported_products:
+        if product_id in self.exported_products:
+            self.report.increment('product_cache_hits')
+        else:
+            self.report.increment('product_cache_misses')
             self.logger.info(f"Exporting product {product_id}")
             product = self.webservice.get_product(product_id)
             product_name = product.name
@@ -410,144 +629,292 @@ class Connector:
                 code=product.ean13,
                 name=product_name,
                 type='BIEN',
-                price=f"{float(product.price):06f}",
-                wholesale_price=f"{float(product.wholesale_price):06f}",
+                price=money.format_amount(money.parse(product.price)),
+                wholesale_price=money.format_amount(money.parse(product.wholesale_price)),
                 ean=product.ean13)
             self.logger.debug(f"{export_product}")
-            self._write_csv_line(export_product, self.csv_products)
-            self.exported_products.add(product_id)
+            with self.report.phase('csv_write'):
+                self._write_csv_line(export_product, self.csv_products)
+            self.exported_products[product_id] = export_product
 
-    def export_orders_and_products(self):
+    def export_orders_and_products(self, order_ids: Optional[List[int]] = None,
+                                   id_range: Optional[Tuple[int, int]] = None):
+        """
+        :param order_ids: restrict the export to these orders, all the orders to export when None
+        :param id_range: restrict the export to the orders whose ID is in this interval (sharded export)
+        """
         exported_orders_counter = 0
         seen = set()
-        for order in self.webservice.get_orders_to_export(self.config.order_valid_status, self.config.order_refund_status):
-            key = (order.id, order.is_refund)
-            if key in seen:
-                self.logger.warning(f"Order {order.id}: deja traitee dans ce run, ignoree (anti-doublon)")
-                continue
-            seen.add(key)
-            if self.config.order_limit and exported_orders_counter >= self.config.order_limit:
-                break
-            try:
-                self._process_order(order)
-            except InvalidOrder:
-                self.logger.warning(f"Skipping order {order.id}")
-                if order.is_refund:
-                    self.webservice.refund_error_counter += 1
-                else:
-                    self.webservice.order_error_counter += 1
-            finally:
-                exported_orders_counter += 1
-
-    def import_files(self):
-        self._csv_products_file.close()
-        self._csv_orders_file.close()
+        start, csv_time = time.perf_counter(), self.report.phases.get('csv_write', 0.0)
+        http_time, scan_wait = self.webservice.thread_http_time(), 0.0
+        skip = self._skip_scanned_order if self.quarantine or self.writeback_outbox.order_count else None
+        orders = iter(self.webservice.get_orders_to_export(self.config.order_valid_status,
+                                                           self.config.order_refund_status,
+                                                           order_ids=order_ids,
+                                                           id_range=id_range,
+                                                           skip=skip))
+        try:
+            while True:
+                # Attente des scans de commandes (threads) : les appels de liste se font en arriere-plan
+                wait_start = time.perf_counter()
+                order = next(orders, None)
+                scan_wait += time.perf_counter() - wait_start
+                if order is None:
+                    break
+                key = (order.id, order.is_refund)
+                if key in seen:
+                    self.logger.warning(f"Order {order.id}: deja traitee dans ce run, ignoree (anti-doublon)")
+                    continue
+                seen.add(key)
+                if self.config.order_limit and exported_orders_counter >= self.config.order_limit:
+                    break
+                try:
+                    self._process_order(order)
+                    self.report.increment('refunds_processed' if order.is_refund else 'orders_processed')
+                    if self.quarantine:
+                        self.quarantine.remove(order)
+                except InvalidOrder as e:
+                    self.logger.warning(f"Skipping order {order.id} ({e.cause})")
+                    self.report.record_rejection(e.cause)
+                    if self.quarantine:
+                        self.quarantine.add(order, e.cause, self._mappings_signature)
+                    if order.is_refund:
+                        self.webservice.refund_error_counter += 1
+                        self.report.increment('refunds_rejected')
+                    else:
+                        self.webservice.order_error_counter += 1
+                        self.report.increment('orders_rejected')
+                finally:
+                    exported_orders_counter += 1
+                    if self.metrics_exporter:
+                        self.metrics_exporter.maybe_write(self.report)
+        finally:
+            if hasattr(orders, 'close'):
+                orders.close()
+            if self.quarantine:
+                self.quarantine.save()
+            # Temps reseau vu par ce thread (adresses, produits, attente des scans) vs temps CPU de transformation
+            fetch_time = self.webservice.thread_http_time() - http_time + scan_wait
+            csv_time = self.report.phases.get('csv_write', 0.0) - csv_time
+            self.report.add_time('scan_wait', scan_wait)
+            self.report.add_time('fetch', fetch_time)
+            self.report.add_time('transform', time.perf_counter() - start - fetch_time - csv_time)
+
+    def _skip_scanned_order(self, order_id: int, is_refund: bool, date_upd: str) -> bool:
+        """ Skip predicate of the orders scan (scan threads): order already imported and waiting for its writeback,
+            or quarantined order not due for a retry """
+        if self.writeback_outbox.contains(order_id, is_refund):
+            self.report.increment('writeback_pending_skipped')
+            return True
+        if self.quarantine and self.quarantine.should_skip(order_id, is_refund, date_upd, self._mappings_signature):
+            self.report.increment('quarantine_skipped')
+            return True
+        return False
 
-        import_products_command = [
-            str(self.config.ebp_executable_path),
-            '/Gui=false;' + str(self._ebp_import_products_logs_path),
-            '/Database=' + str(self.config.ebp_database_path) + ';EBPSDK',
-            '/Import=' + str(self._csv_products_path) + ';Items;' + self.config.ebp_articles_config_name
-        ]
+    def _close_csv_files(self):
+        """ Write the rows still queued and force the CSV files to the disk, before EBP reads them """
+        for name, csv_writer in [('csv_products', self.csv_products), ('csv_orders', self.csv_orders)]:
+            if csv_writer.closed:
+                continue
+            csv_writer.close()
+            self.report.record_peak(f"{name}_queued_rows", csv_writer.peak_queued_rows)
+            self.report.add_time('csv_background_write', csv_writer.write_time)
 
-        import_orders_command = [
+    def _run_ebp_import(self, logs_path: Path, csv_path: Path, target: str, config_name: str):
+        command = [
             str(self.config.ebp_executable_path),
-            '/Gui=false;' + str(self._ebp_import_orders_logs_path),
+            '/Gui=false;' + str(logs_path),
             '/Database=' + str(self.config.ebp_database_path) + ';EBPSDK',
-            '/Import=' + str(self._csv_orders_path) + ';SaleInvoices;' + self.config.ebp_orders_config_name
+            '/Import=' + str(csv_path) + ';' + target + ';' + config_name
         ]
+        self.logger.debug(f"Subprocess args: {command}")
+        subprocess.run(command)
 
-        self.logger.info('Importing products')
-        self.logger.debug(f"Subprocess args: {import_products_command}")
-        subprocess.run(import_products_command)
+    def import_files(self):
+        self._close_csv_files()
 
-        self.logger.info('Importing orders')
-        self.logger.debug(f"Subprocess args: {import_orders_command}")
-        subprocess.run(import_orders_command)
+        # Deux boutiques sur la meme base EBP : les imports sont serialises pour ne pas se disputer les verrous
+        database_lock = self.database_locks.lock(self.config.ebp_database_path) if self.database_locks else Lock()
+        with self.report.phase('wait_database_lock'):
+            database_lock.acquire()
+        try:
+            self.logger.info('Importing products')
+            with self.report.phase('import_products'):
+                self._run_ebp_import(self._ebp_import_products_logs_path, self._csv_products_path, 'Items',
+                                     self.config.ebp_articles_config_name)
+
+            self.logger.info('Importing orders')
+            with self.report.phase('import_orders'):
+                if self.config.import_chunk_size:
+                    from psebpconnector.chunked_import import ChunkedImport
+                    self._chunked_import = ChunkedImport(self, self.config.import_chunk_size)
+                    self._chunked_import.run()
+                else:
+                    self._run_ebp_import(self._ebp_import_orders_logs_path, self._csv_orders_path, 'SaleInvoices',
+                                         self.config.ebp_orders_config_name)
+        finally:
+            database_lock.release()
 
     def mark_exported_orders(self):
         """ Marque les commandes comme exportees dans PrestaShop UNIQUEMENT pour les documents
             reellement importes par EBP. Les commandes rejetees par EBP (ou si le log d'import est
             absent/illisible) sont laissees a exported=0 pour etre rejouees au prochain run plutot
-            que perdues silencieusement. """
-        if not self._ebp_import_orders_logs_path.is_file():
+            que perdues silencieusement.
+
+            Import par chunks : chaque chunk est marque en arriere-plan des la fin de son import, il ne reste
+            qu'a attendre la fin de ces mises a jour. """
+        if self._chunked_import:
+            self._chunked_import.wait()
+        else:
+            self._mark_documents_exported(self.pending_orders, self._ebp_import_orders_logs_path)
+
+    def _mark_documents_exported(self, orders: List[Order], logs_path: Path):
+        """ Mark exported the orders of an EBP import whose documents were imported according to its log """
+        if not logs_path.is_file():
             self.logger.error("Log d'import EBP absent : aucune commande marquee exportee (rejeu au prochain run)")
+            self._set_import_status(orders, 'import_failed')
             return
-        log = self._ebp_import_orders_logs_path.read_text(encoding='utf-8', errors='ignore')
-        if not re.search(r'\d+/\d+', log):
+        rejected = parse_import_log(logs_path.read_text(encoding='utf-8', errors='ignore'))
+        if rejected is None:
             self.logger.error("Log d'import EBP incomplet : aucune commande marquee exportee (rejeu au prochain run)")
+            self._set_import_status(orders, 'import_failed')
             return
-        rejected = set(re.findall(r'Le document (\d+) ne sera pas import', log))
-        for order in self.pending_orders:
-            document_number = f"{order.id}11" if order.is_refund else f"{order.id}"
+        for order in orders:
+            document_number = self._document_number(order)
             if document_number in rejected:
                 self.logger.warning(f"Order {order.id}: rejetee par EBP (document {document_number}), "
                                     f"laissee a exported=0 pour rejeu")
-            elif order.is_refund:
-                self.webservice.set_order_refund(order)
-            else:
-                self.webservice.set_order_exported(order)
+                self.report.increment('ebp_rejected_documents')
+                self._set_import_status([order], 'rejected')
+                continue
+            try:
+                if order.is_refund:
+                    self.webservice.set_order_refund(order)
+                    self.report.increment('refunds_marked_exported')
+                else:
+                    self.webservice.set_order_exported(order)
+                    self.report.increment('orders_marked_exported')
+            except Exception as e:
+                # Document deja dans EBP : ne surtout pas le reexporter, le marquage sera retente au prochain run
+                self.logger.error(f"Order {order.id}: importee par EBP mais non marquee exportee, mise en attente "
+                                  f"dans {self.writeback_outbox.path} - {e}")
+                self.writeback_outbox.add(order, str(e))
+                self.report.increment('writebacks_queued')
+            self._set_import_status([order], 'imported')
+
+    def _reconcile_ledger(self):
+        """ Settle the ledger entries left by the runs interrupted after the EBP import, and queue the writeback of the
+            documents they imported: they are flagged exported before fetching the orders to export """
+        from psebpconnector.reconciliation import LedgerReconciliation
+        try:
+            settled = LedgerReconciliation(self.ledger, self.config.working_directory,
+                                           self.artefacts).run(exclude=[self.run_id])
+        except Exception as e:
+            self.logger.error(f"Unable to reconcile the ledger with the EBP import logs - {e}")
+            return
+        for status, entries in settled.items():
+            self.logger.info(f"Ledger: {len(entries)} documents of interrupted runs settled as {status}")
+            self.report.increment('ledger_documents_reconciled', len(entries))
+        for entry in settled.get(self.ledger.IMPORTED, []):
+            self.writeback_outbox.add(Order(id=entry.order_id, is_refund=entry.is_refund),
+                                      f"imported by the interrupted run {entry.run_id}")
+
+    def _retry_writebacks(self):
+        """ Flag the orders left in the writeback outbox by the previous runs, before fetching the orders to export """
+        pending = self.writeback_outbox.order_count
+        flagged = self.writeback_outbox.flush(self.webservice)
+        self.report.increment('writebacks_retried', flagged)
+        self.logger.info(f"Writeback outbox: {flagged}/{pending} orders flagged exported")
+
+    def _set_import_status(self, orders: List[Order], status: str):
+        for order in orders:
+            self.import_statuses[(order.id, order.is_refund)] = status
+            if self.ledger:
+                self.ledger.set_status(order.id, order.is_refund, status)
 
     def load_payment_method_mapping(self):
-        with open(self.config.payment_method_mapping_file_path, 'r') as f:
-            reader = csv.reader(f, delimiter=';')
-            next(reader, None)  # Skip header
-
-            line_number = 2
-            for rows in reader:
-                if rows:
-                    if len(rows) != 6:
-                        raise ValueError(f"{self.config.payment_method_mapping_file_path.name}, l.{line_number}: expected 5 columns")
-                    ps_payment_method, with_vat, client_code, currency, territoriality, ebp_payment_method = rows
-                    with_vat = with_vat == 'AVEC'
-                    self.payment_method_mapping.setdefault(ps_payment_method.strip(), {})
-                    self.payment_method_mapping[ps_payment_method.strip()][with_vat] = (
-                        client_code.strip(),
-                        currency.strip(),
-                        territoriality.strip(),
-                        ebp_payment_method.strip())
+        for (ps_payment_method, with_vat), info in parse_payment_method_mapping(
+                self.config.payment_method_mapping_file_path).items():
+            self.payment_method_mapping.setdefault(ps_payment_method, {})[with_vat] = info
 
     def load_vat_mapping(self):
-        with open(self.config.vat_mapping_file_path, 'r') as f:
-            reader = csv.reader(f, delimiter=';')
-            next(reader, None)  # Skip header
-
-            line_number = 2
-            for rows in reader:
-                if rows:
-                    if len(rows) != 12:
-                        raise ValueError(f"{self.config.vat_mapping_file_path.name}, l.{line_number}: expected 12 columns")
-                    territoriality, vat, ebp_id, ps_country_id = rows[0], rows[2], rows[10], int(rows[11])
-                    self.vat_mapping.setdefault(territoriality, {})
-
-                    # EXONERATION
-                    vat = float(vat.replace(',','.')) / 100
-
-                    self.vat_mapping[territoriality][int(ps_country_id)] = (vat, ebp_id)
-                line_number += 1
-
-    def run(self) -> int:
+        for (territoriality, ps_country_id), info in parse_vat_mapping(self.config.vat_mapping_file_path).items():
+            self.vat_mapping.setdefault(territoriality, {})[ps_country_id] = info
+
+    def _load_mapping_index(self) -> MappingIndex:
+        """ Compiled mappings, shared with the other shops of the process using the same files """
+        paths = (self.config.payment_method_mapping_file_path, self.config.vat_mapping_file_path)
+
+        def load():
+            return MappingIndex.load(*paths, snapshot_path=self.config.working_directory / 'mappings.json')
+
+        return self.mapping_cache.get(paths, load) if self.mapping_cache else load()
+
+    def _get_mappings_signature(self):
+        return tuple(path.stat().st_mtime_ns
+                     for path in [self.config.payment_method_mapping_file_path, self.config.vat_mapping_file_path])
+
+    def warm_up(self):
+        """ Load the mappings, authenticate and fetch the reference data, if not already done by a previous run """
+        with self._phase('load_mappings'):
+            mappings_signature = self._get_mappings_signature()
+            if mappings_signature != self._mappings_signature:
+                self.mapping_index = self._load_mapping_index()
+                self.payment_method_mapping, self.vat_mapping = self.mapping_index.nested()
+                self.logger.debug(f"payment method mapping: {self.payment_method_mapping}")
+                self.logger.debug(f"vat mapping: {self.vat_mapping}")
+                self._mappings_signature = mappings_signature
+        with self._phase('authentication'):
+            if not self._authenticated:
+                assert self.webservice.test_api_authentication(), "Unable to login"
+                self._authenticated = True
+        with self._phase('reference_data'):
+            if not self.reference_data.loaded:
+                if self.webservice.cassette and self.webservice.cassette.recording:
+                    # La cassette doit se suffire a elle-meme : pas de snapshot
+                    self.reference_data.refresh()
+                else:
+                    self.reference_data.ensure_loaded()
+                self.logger.debug(f"countries iso codes: {self.countries_iso_code}")
+                self.logger.debug(f"currencies iso codes: {self.currencies_iso_code}")
+            elif self.reference_data.ttl and self.reference_data.expired:
+                self.reference_data.refresh_in_background()
+
+    def run(self, order_ids: Optional[List[int]] = None, shards: int = 0) -> int:
+        """ Run a synchronization. A connector can run several times (daemon mode), each run gets its own CSV,
+            logs and report files.
+
+            :param order_ids: only synchronize these orders (micro-batch), all the orders to export when None
+            :param shards: split the export between this number of worker processes, see `ShardedExport`
+        """
+        if self._run_count:
+            self._prepare_run()
+        self._run_count += 1
+        exit_code = 1
         try:
-            self.load_payment_method_mapping()
-            self.logger.debug(f"payment method mapping: {self.payment_method_mapping}")
-            self.load_vat_mapping()
-            self.logger.debug(f"vat mapping: {self.vat_mapping}")
-            self.check_consistency()
-            assert self.webservice.test_api_authentication(), "Unable to login"
-            if self.mailer:
-                self.mailer.try_login()
-            self.countries_iso_code = self.webservice.get_countries_iso_code()
-            self.logger.debug(f"countries iso codes: {self.countries_iso_code}")
-            self.currencies_iso_code = self.webservice.get_currencies_iso_code()
-            self.logger.debug(f"currencies iso codes: {self.currencies_iso_code}")
+            self.warm_up()
+            if self.ledger:
+                with self._phase('reconcile'):
+                    self._reconcile_ledger()
+            if self.writeback_outbox.order_count:
+                with self._phase('writeback_retry'):
+                    self._retry_writebacks()
             self.logger.info("Starting orders retrieving")
-            self.export_orders_and_products()
-            self.import_files()
-            self.mark_exported_orders()
-            self.logger.handlers[2].flush()
-            self.logger.handlers[2].close()
+            with self._phase('export'):
+                if shards > 1 and order_ids is None:
+                    from psebpconnector.sharding import ShardedExport
+                    ShardedExport(self, shards).run()
+                else:
+                    self.export_orders_and_products(order_ids)
+            with self._phase('import'):
+                self.import_files()
+            with self._phase('writeback'):
+                self.mark_exported_orders()
+            self._logs_file_handler.flush()
+            self._logs_file_handler.close()
             self.logger.debug(f"errors_logged: {self.errors_logged()}")
             self.logger.debug(f"errors_raised_by_ebp: {self.errors_raised_by_ebp()}")
+            exit_code = 0
             return 0
         except Exception as e:
             self.logger.critical("A critical error was raised, see below")
@@ -555,18 +922,71 @@ class Connector:
             return 1
 
         finally:
-            if self.mailer and (self.errors_logged() or self.errors_raised_by_ebp()):
-                self.mailer.send_mail("PS EBP Connector - Erreurs lors de l'exécution",
-                                      "Des erreurs ont été constatées lors de l'exécution du connecteur, consultez les "
-                                      "journaux en PJ.",
-                                      self.config.o365_recipient,
-                                      [
-                                          f for f in [
-                                            self._logs_file_path,
-                                            self._ebp_import_products_logs_path,
-                                            self._ebp_import_orders_logs_path,
-                                            self._csv_products_path,
-                                            self._csv_orders_path
-                                          ]
-                                          if f.is_file()
-                                      ])
+            if self.profiler:
+                self.profiler.close()
+            if self.webservice.cassette:
+                self.webservice.cassette.close()
+            self._write_run_report(exit_code)
+            if self.mailer:
+                self._send_error_report()
+            if self.artefacts:
+                self._archive_run_files()
+            if self.ledger:
+                self.ledger.close()
+
+    def _archive_run_files(self):
+        """ Move the files of the finished run, and those left by older runs, into the daily archives. The mail
+            outbox holds its own copy of the attachments. """
+        # Plus aucun message ne doit recreer le fichier de logs une fois archive
+        self._logs_file_handler.close()
+        self.logger.removeHandler(self._logs_file_handler)
+        self._close_csv_files()
+        run_id = self.run_id
+        files = [
+            self._logs_file_path,
+            self._run_report_path,
+            self._csv_products_path,
+            self._csv_orders_path,
+            self._ebp_import_products_logs_path,
+            self._ebp_import_orders_logs_path
+        ]
+        if self._chunked_import:
+            for chunk in self._chunked_import.chunks:
+                files += [path for path in (chunk.orders_path, chunk.logs_path) if path not in files]
+        try:
+            # Statut 'exported' : document ecrit dans le CSV mais jamais importe (run interrompu avant l'import)
+            self.artefacts.archive_run(run_id,
+                                       files,
+                                       [(order.id, order.is_refund,
+                                         self.import_statuses.get((order.id, order.is_refund), 'exported'))
+                                        for order in self.pending_orders])
+            self.artefacts.sweep(exclude=[run_id])
+            self.artefacts.apply_retention()
+        except Exception as e:
+            # L'archivage ne doit jamais faire echouer le run, les fichiers restants seront repris au prochain
+            self.logger.error(f"Unable to archive the run files in {self.artefacts.directory} - {e}")
+
+    def _send_error_report(self):
+        """ Queue the error report in the outbox, and send the queued mails in the background: uploading the
+            attachments does not delay the end of the run. """
+        if self.errors_logged() or self.errors_raised_by_ebp():
+            self._close_csv_files()
+            try:
+                self.mail_outbox.enqueue("PS EBP Connector - Erreurs lors de l'exécution",
+                                         "Des erreurs ont été constatées lors de l'exécution du connecteur, consultez "
+                                         "les journaux en PJ.",
+                                         self.config.o365_recipient,
+                                         [
+                                             f for f in [
+                                                 self._logs_file_path,
+                                                 self._ebp_import_products_logs_path,
+                                                 *self._ebp_import_orders_logs_paths(),
+                                                 self._csv_products_path,
+                                                 self._csv_orders_path
+                                             ]
+                                             if f.is_file()
+                                         ])
+            except OSError as e:
+                self.logger.error(f"Unable to queue the error report in {self.mail_outbox.directory} - {e}")
+        if self.mail_outbox.pending():
+            self.mail_outbox.flush_in_background(self.mailer)
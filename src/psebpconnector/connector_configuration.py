@@ -25,7 +25,7 @@ SOFTWARE.
 
 from configparser import ConfigParser, Error
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 
 class ConnectorConfiguration:
@@ -42,14 +42,51 @@ class ConnectorConfiguration:
     ebp_orders_config_name: str = 'foxchip_ebp_connector'
     ebp_database_path: Path
     order_limit: Optional[int]
+    reference_data_ttl: int = 86400
+    language_id: int = 1
+    import_chunk_size: int = 0
     o365_client_id = None
     o365_email = None
     o365_secret = None
     o365_tenant_id = None
     o365_recipient = None
-
-    def __init__(self, config_path: Path):
+    o365_max_attachment_size: int = 1024 * 1024
+    o365_flush_timeout: float = 60
+    o365_max_attempts: int = 5
+    cassette_mode: Optional[str] = None
+    cassette_path: Optional[Path] = None
+    cassette_simulate_timing: bool = False
+    cassette_timing_factor: float = 1.0
+    ledger_path: Optional[Path] = None
+    ledger_wal: bool = False
+    quarantine_path: Optional[Path] = None
+    quarantine_base_delay: float = 3600
+    quarantine_max_delay: float = 7 * 86400
+    artefacts_directory: Optional[Path] = None
+    artefacts_retention_days: int = 90
+    artefacts_max_total_size: int = 0
+    artefacts_sweep_grace_period: float = 86400
+    metrics_textfile_path: Optional[Path] = None
+    metrics_interval: int = 0
+    profile: Optional[str] = None
+    daemon_interval: int = 0
+    daemon_cron: Optional[str] = None
+    trigger_listen: Optional[Tuple[str, int]] = None
+    trigger_spool_directory: Optional[Path] = None
+    trigger_batch_size: int = 50
+    trigger_batch_window: float = 60
+    trigger_token: Optional[str] = None
+    trigger_retry_delay: float = 60
+    trigger_max_retry_delay: float = 3600
+
+    def __init__(self, config_path: Path, working_directory: Optional[Path] = None):
+        """
+        :param working_directory: overrides the `working_directory` option, before the default paths of the ledger,
+            quarantine, archives... are derived from it
+        """
         self._read_configuration(config_path)
+        if working_directory:
+            self._config.set('main', 'working_directory', str(working_directory))
         self.load_required_options()
 
         if not self.ebp_executable_path.is_file():
@@ -87,6 +124,64 @@ class ConnectorConfiguration:
         if self._config.has_section ('o365'):
             for key in ['client_id', 'email', 'secret', 'tenant_id', 'recipient']:
                 setattr(self, f"o365_{key}", self._config.get('o365', key))
+            self.o365_max_attachment_size = self._config.getint('o365', 'max_attachment_size', fallback=1024 * 1024)
+            self.o365_flush_timeout = self._config.getfloat('o365', 'flush_timeout', fallback=60)
+            self.o365_max_attempts = self._config.getint('o365', 'max_attempts', fallback=5)
+
+        if self._config.has_section('cassette'):
+            self.cassette_mode = self._config.get('cassette', 'mode').strip()
+            path = self._config.get('cassette', 'path', fallback='').strip()
+            self.cassette_path = Path(path) if path else self.working_directory / 'cassette.jsonl.gz'
+            self.cassette_simulate_timing = self._config.getboolean('cassette', 'simulate_timing', fallback=False)
+            self.cassette_timing_factor = self._config.getfloat('cassette', 'timing_factor', fallback=1.0)
+
+        if self._config.has_section('ledger'):
+            path = self._config.get('ledger', 'path', fallback='').strip()
+            self.ledger_path = Path(path) if path else self.working_directory / 'ledger.sqlite'
+            # WAL non supporte par SQLite sur un partage reseau : uniquement pour un registre sur disque local
+            self.ledger_wal = self._config.getboolean('ledger', 'wal', fallback=False)
+
+        if self._config.has_section('quarantine'):
+            path = self._config.get('quarantine', 'path', fallback='').strip()
+            self.quarantine_path = Path(path) if path else self.working_directory / 'quarantine.json'
+            self.quarantine_base_delay = self._config.getfloat('quarantine', 'base_delay', fallback=3600)
+            self.quarantine_max_delay = self._config.getfloat('quarantine', 'max_delay', fallback=7 * 86400)
+
+        if self._config.has_section('artefacts'):
+            directory = self._config.get('artefacts', 'directory', fallback='').strip()
+            self.artefacts_directory = Path(directory) if directory else self.working_directory / 'archives'
+            self.artefacts_retention_days = self._config.getint('artefacts', 'retention_days', fallback=90)
+            self.artefacts_max_total_size = self._config.getint('artefacts', 'max_total_size', fallback=0)
+            self.artefacts_sweep_grace_period = self._config.getfloat('artefacts', 'sweep_grace_period',
+                                                                      fallback=86400)
+
+        if self._config.has_section('metrics'):
+            self.metrics_textfile_path = Path(self._config.get('metrics', 'textfile_path'))
+            self.metrics_interval = self._config.getint('metrics', 'interval', fallback=0)
+
+        if self._config.has_section('daemon'):
+            self.daemon_interval = self._config.getint('daemon', 'interval', fallback=0)
+            self.daemon_cron = self._config.get('daemon', 'cron', fallback='').strip() or None
+
+        if self._config.has_section('trigger'):
+            listen = self._config.get('trigger', 'listen', fallback='').strip()
+            if listen:
+                host, _, port = listen.rpartition(':')
+                self.trigger_listen = (host or '127.0.0.1', int(port))
+            spool_directory = self._config.get('trigger', 'spool_directory', fallback='').strip()
+            self.trigger_spool_directory = Path(spool_directory) if spool_directory else None
+            self.trigger_batch_size = self._config.getint('trigger', 'batch_size', fallback=50)
+            self.trigger_batch_window = self._config.getfloat('trigger', 'batch_window', fallback=60)
+            self.trigger_token = self._config.get('trigger', 'token', fallback='').strip() or None
+            self.trigger_retry_delay = self._config.getfloat('trigger', 'retry_delay', fallback=60)
+            self.trigger_max_retry_delay = self._config.getfloat('trigger', 'max_retry_delay', fallback=3600)
+
+        if self._config.has_option('main', 'profile'):
+            self.profile = self._config.get('main', 'profile').strip() or None
+
+        self.reference_data_ttl = self._config.getint('main', 'reference_data_ttl', fallback=86400)
+        self.language_id = self._config.getint('main', 'language_id', fallback=1)
+        self.import_chunk_size = self._config.getint('main', 'import_chunk_size', fallback=0)
 
         if self._config.has_option('main', 'order_limit'):
             self.order_limit = int(self._config.get('main', 'order_limit'))
@@ -0,0 +1,175 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import csv
+import os
+import queue
+import threading
+import time
+
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+def read_rows(path: Path) -> Iterator[Tuple[str, ...]]:
+    """ Read back a CSV file written for EBP (`BackgroundCsvWriter`), one tuple per row """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from parse_rows(f)
+
+
+def parse_rows(lines: Iterable[str]) -> Iterator[Tuple[str, ...]]:
+    """ Parse the lines of a CSV file written for EBP, e.g. read from a run archive """
+    for row in csv.reader(lines, delimiter=';', quotechar='"'):
+        yield tuple(row)
+
+
+class _Sync:
+    """ Marker queued after the rows: the writer thread flushes the file when it reaches it """
+
+    def __init__(self, fsync: bool, stop: bool = False):
+        self.fsync = fsync
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class BackgroundCsvWriter:
+    """
+    CSV file written by a dedicated thread: `writerow` only queues the row, the thread writes the queued rows by
+    batches through a large buffer. The threads fetching and transforming the orders do not wait on the disk, unless
+    the queue is full (the disk cannot keep up), in which case `writerow` blocks until there is room.
+
+    The file is only flushed to the disk by `flush(fsync=True)` and `close`, at the end of a phase. A write error is
+    raised by the next call to `writerow`, `flush` or `close`.
+
+    Same interface as a `csv.writer` (`writerow`, `writerows`) with the delimiter and the encoding expected by EBP.
+    """
+
+    def __init__(self, path: Path, max_queued_rows: int = 10000, batch_size: int = 1000,
+                 buffer_size: int = 1024 * 1024):
+        """
+        :param max_queued_rows: size of the queue, `writerow` blocks while it is full
+        :param batch_size: maximum number of rows written at once by the thread
+        :param buffer_size: size of the file buffer in bytes
+        """
+        self.path = path
+        self.max_queued_rows = max_queued_rows
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.peak_queued_rows = 0
+        self.write_time = 0.0
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='', buffering=buffer_size)
+        self._writer = csv.writer(self._file, delimiter=';', quotechar='"')
+        self._queue = queue.Queue(maxsize=max_queued_rows)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name=f"csv-writer-{path.name}", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'BackgroundCsvWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def queued_rows(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def fill_level(self) -> float:
+        """ :return: how full the queue is, from 0 to 1 """
+        return self._queue.qsize() / self.max_queued_rows
+
+    def writerow(self, row: Iterable):
+        self._raise_error()
+        if self._closed:
+            raise ValueError(f"{self.path} is closed")
+        self._queue.put(list(row))
+        # Lecture approximative sans verrou, suffisante pour une mesure
+        self.peak_queued_rows = max(self.peak_queued_rows, self._queue.qsize())
+
+    def writerows(self, rows: Iterable[Iterable]):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self, fsync: bool = False):
+        """ Wait until the rows queued so far are written
+
+        :param fsync: also force them to the disk, at the end of a phase
+        """
+        if not self._closed:
+            self._sync(_Sync(fsync))
+        self._raise_error()
+
+    def close(self):
+        """ Write the queued rows, force them to the disk and close the file """
+        if not self._closed:
+            self._closed = True
+            self._sync(_Sync(fsync=True, stop=True))
+            self._thread.join()
+        self._raise_error()
+
+    def _sync(self, marker: _Sync):
+        self._queue.put(marker)
+        marker.done.wait()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write_loop(self):
+        while True:
+            batch: List = [self._queue.get()]
+            while len(batch) < self.batch_size and not isinstance(batch[-1], _Sync):
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            marker = batch.pop() if isinstance(batch[-1], _Sync) else None
+            try:
+                # Apres une erreur, la file est toujours videe : les producteurs ne restent pas bloques
+                if batch and self._error is None:
+                    start = time.perf_counter()
+                    self._writer.writerows(batch)
+                    self.rows_written += len(batch)
+                    self.write_time += time.perf_counter() - start
+                if marker and self._error is None:
+                    self._file.flush()
+                    if marker.fsync:
+                        os.fsync(self._file.fileno())
+            except Exception as e:
+                self._error = e
+            if marker and marker.stop:
+                try:
+                    self._file.close()
+                except Exception as e:
+                    self._error = self._error or e
+            if marker:
+                marker.done.set()
+                if marker.stop:
+                    return
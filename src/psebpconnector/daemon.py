@@ -0,0 +1,154 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import signal
+import threading
+
+from datetime import datetime, timedelta
+from psebpconnector.connector import Connector
+from typing import Callable, List, Optional, Set
+
+
+def install_signal_handlers(handler: Callable):
+    """ Call `handler` on Ctrl+C and on termination requests (service stop, kill) """
+    for signal_name in ['SIGINT', 'SIGTERM', 'SIGBREAK']:
+        if hasattr(signal, signal_name):
+            signal.signal(getattr(signal, signal_name), handler)
+
+
+class CronSchedule:
+    """
+    Standard 5 fields cron expression: minute hour day-of-month month day-of-week.
+
+    Each field accepts `*`, values, ranges (`1-5`), steps (`*/15`, `0-30/10`) and lists (`1,15`). Day-of-week goes
+    from 0 (sunday) to 7 (sunday again). As in cron, when both day-of-month and day-of-week are restricted, a day
+    matching either of them matches.
+    """
+
+    _RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}': expected 5 fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self._RANGES)]
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self._days_restricted = fields[2] != '*'
+        self._weekdays_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(','):
+            value_range, _, step = part.partition('/')
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(v) for v in value_range.split('-', 1))
+            else:
+                start = end = int(value_range)
+            if not low <= start <= end <= high or (step and int(step) < 1):
+                raise ValueError(f"Invalid cron field '{field}'")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, date: datetime) -> bool:
+        day = date.day in self.days
+        weekday = (date.weekday() + 1) % 7 in self.weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return day or weekday
+        return day and weekday
+
+    def next_run(self, after: datetime) -> datetime:
+        """ :return: the first matching minute strictly after `after` """
+        date = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = date + timedelta(days=366 * 5)
+        while date < limit:
+            if date.month not in self.months:
+                date = (date.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(date):
+                date = date.replace(hour=0, minute=0) + timedelta(days=1)
+            elif date.hour not in self.hours:
+                date = date.replace(minute=0) + timedelta(hours=1)
+            elif date.minute not in self.minutes:
+                date += timedelta(minutes=1)
+            else:
+                return date
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+class Daemon:
+    """
+    Long-running mode: keeps a single warm connector (webservice session, mapping tables, reference data) and runs
+    synchronization cycles on a fixed interval or on a cron schedule.
+    """
+
+    def __init__(self, connector: Connector, interval: int = 0, cron: Optional[str] = None):
+        """
+        :param interval: seconds between the start of two cycles
+        :param cron: cron expression, takes precedence over `interval`
+        """
+        if not interval and not cron:
+            raise ValueError("Daemon mode requires an interval or a cron expression")
+        self.connector = connector
+        self.interval = interval
+        self.schedule = CronSchedule(cron) if cron else None
+        self.exit_codes: List[int] = []
+        self._stopped = threading.Event()
+        self.logger = logging.getLogger('ps_ebp_connector')
+
+    def next_run(self, last_start: Optional[datetime]) -> datetime:
+        now = datetime.now()
+        if self.schedule:
+            return self.schedule.next_run(now)
+        if last_start is None:
+            return now
+        return max(now, last_start + timedelta(seconds=self.interval))
+
+    def run_cycle(self) -> int:
+        exit_code = self.connector.run()
+        self.exit_codes.append(exit_code)
+        return exit_code
+
+    def run_forever(self, max_cycles: int = 0):
+        """ :param max_cycles: stop after this number of cycles, 0 runs until `stop` is called """
+        last_start = None
+        while not self._stopped.is_set():
+            next_run = self.next_run(last_start)
+            self.logger.info(f"Next synchronization at {next_run:%Y-%m-%d %H:%M:%S}")
+            if self._stopped.wait(max(0.0, (next_run - datetime.now()).total_seconds())):
+                break
+            last_start = datetime.now()
+            self.run_cycle()
+            if max_cycles and len(self.exit_codes) >= max_cycles:
+                break
+
+    def stop(self, *_):
+        self._stopped.set()
+
+    def install_signal_handlers(self):
+        install_signal_handlers(self.stop)
@@ -24,4 +24,5 @@ SOFTWARE.
 
 
 from .bad_http_code import BadHTTPCode
+from .cassette_miss import CassetteMiss
 from .invalid_order import InvalidOrder
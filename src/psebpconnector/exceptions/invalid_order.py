@@ -24,4 +24,9 @@ SOFTWARE.
 
 
 class InvalidOrder(ValueError):
-    pass
+    def __init__(self, cause: str = 'invalid_order', *args):
+        """
+        :param cause: short identifier of the rejection reason, rejections are counted by cause in the run report
+        """
+        super().__init__(cause, *args)
+        self.cause = cause
@@ -22,5 +22,5 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from .export_order_row import ExportOrderRow
+from .export_order_row import DOCUMENT_NUMBER_COLUMN, ExportOrderRow
 from .export_product import ExportProduct
@@ -22,7 +22,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
 
 @dataclass
@@ -115,3 +115,7 @@ class ExportOrderRow:
     document_client_order_number: str
     line_ignore_linked_products: str
     document_language: str
+
+
+# Colonne du numero de document dans le fichier CSV des commandes : les lignes d'un document se suivent
+DOCUMENT_NUMBER_COLUMN = [field.name for field in fields(ExportOrderRow)].index('document_number')
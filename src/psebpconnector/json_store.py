@@ -0,0 +1,76 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from pathlib import Path
+from typing import Any, Dict
+
+
+class JsonOrderStore:
+    """
+    Entries keyed by order (or refund), persisted in a JSON file. The file is written next to its final path then
+    renamed, so a process stopped while saving leaves the previous version intact.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.logger = logging.getLogger('ps_ebp_connector')
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(order_id: int, is_refund: bool) -> str:
+        return f"{order_id}{'-refund' if is_refund else ''}"
+
+    @property
+    def order_count(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        if not self.path.is_file():
+            return
+        try:
+            entries = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            self._load_failed(e)
+            return
+        with self._lock:
+            self._entries = entries
+
+    def _load_failed(self, error: Exception):
+        self.logger.error(f"Unable to read {self.path} - {error}")
+
+    def save(self):
+        with self._lock:
+            if not self._entries and not self.path.is_file():
+                return
+            content = json.dumps(self._entries, indent=2)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(content, encoding='utf-8')
+        os.replace(tmp_path, self.path)
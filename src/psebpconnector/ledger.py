@@ -0,0 +1,181 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from psebpconnector.models import Order
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class LedgerEntry:
+    order_id: int
+    is_refund: bool
+    document_number: str
+    run_id: str
+    row_hash: str
+    status: str
+    rows: List[Tuple[int, Dict[str, Any]]]
+    updated_at: float
+
+
+class ExportLedger:
+    """
+    Local record of every document exported to EBP: one entry per order (or refund) and run, with the EBP document
+    number, the hash of the order content, the exported CSV rows and the import status. It answers "was this order
+    imported, and by which run" without reading the logs, and lets a run reuse the rows of an order whose content did
+    not change instead of transforming it again (no address fetch).
+    """
+
+    # Statuts d'un document dans le registre
+    EXPORTED = 'exported'
+    IMPORTED = 'imported'
+    REJECTED = 'rejected'
+    IMPORT_FAILED = 'import_failed'
+
+    def __init__(self, path: Path, wal: bool = False):
+        """
+        :param wal: use a write-ahead log instead of the rollback journal. Faster when the shard workers write
+            concurrently, but SQLite does not support it on a network share: only for a ledger on a local disk.
+        """
+        self.path = path
+        self.wal = wal
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS documents ('
+                               'order_id INTEGER NOT NULL, '
+                               'is_refund INTEGER NOT NULL, '
+                               'document_number TEXT NOT NULL, '
+                               'run_id TEXT NOT NULL, '
+                               'row_hash TEXT NOT NULL, '
+                               'status TEXT NOT NULL, '
+                               'rows TEXT NOT NULL, '
+                               'updated_at REAL NOT NULL, '
+                               'PRIMARY KEY (order_id, is_refund, run_id))')
+            connection.execute('CREATE INDEX IF NOT EXISTS documents_document_number ON documents (document_number)')
+            connection.execute('CREATE INDEX IF NOT EXISTS documents_run_id ON documents (run_id)')
+            connection.execute('CREATE INDEX IF NOT EXISTS documents_status ON documents (status)')
+
+    def close(self):
+        """ Close the database at the end of a run, the next access reopens it """
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """ Called with the lock held """
+        if not self._connection:
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # Le mode est persistant dans le fichier : on le repose a chaque ouverture pour revenir au journal
+            # classique si le WAL a ete desactive
+            if self.wal:
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute('PRAGMA synchronous=NORMAL')
+            else:
+                self._connection.execute('PRAGMA journal_mode=DELETE')
+        return self._connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                yield connection
+
+    @staticmethod
+    def order_hash(order: Order, mappings_signature: Any) -> str:
+        """ Hash of everything the exported rows are computed from: the order, its rows and the mapping files """
+        content = json.dumps([asdict(order), mappings_signature], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def record(self, order: Order, document_number: str, run_id: str, row_hash: str,
+               rows: List[Tuple[int, Dict[str, Any]]], status: str = EXPORTED):
+        """
+        :param rows: (product ID, exported row as a dict) of the order rows written in the CSV
+        """
+        with self._transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (order.id, int(order.is_refund), document_number, run_id, row_hash, status,
+                                json.dumps(rows), time.time()))
+
+    def set_status(self, order_id: int, is_refund: bool, status: str, run_id: Optional[str] = None):
+        """
+        Update the status of the last export of a document
+
+        :param run_id: update the export of this run instead
+        """
+        with self._transaction() as connection:
+            if run_id is not None:
+                connection.execute('UPDATE documents SET status = ?, updated_at = ? '
+                                   'WHERE order_id = ? AND is_refund = ? AND run_id = ?',
+                                   (status, time.time(), order_id, int(is_refund), run_id))
+            else:
+                connection.execute('UPDATE documents SET status = ?, updated_at = ? '
+                                   'WHERE rowid = (SELECT rowid FROM documents '
+                                   'WHERE order_id = ? AND is_refund = ? ORDER BY updated_at DESC LIMIT 1)',
+                                   (status, time.time(), order_id, int(is_refund)))
+
+    def history(self, order_id: int) -> List[LedgerEntry]:
+        """ :return: the exports of an order and of its refund, oldest first """
+        return self._select('WHERE order_id = ? ORDER BY updated_at', (order_id,))
+
+    def document(self, document_number: str) -> List[LedgerEntry]:
+        """ :return: the exports of an EBP document, oldest first """
+        return self._select('WHERE document_number = ? ORDER BY updated_at', (document_number,))
+
+    def run(self, run_id: str) -> List[LedgerEntry]:
+        """ :return: the documents exported by a run """
+        return self._select('WHERE run_id = ? ORDER BY order_id, is_refund', (run_id,))
+
+    def unsettled_runs(self) -> List[str]:
+        """ :return: the runs with documents still waiting for their import status, oldest first """
+        with self._lock:
+            rows = self._connect().execute('SELECT DISTINCT run_id FROM documents WHERE status = ? ORDER BY run_id',
+                                           (self.EXPORTED,)).fetchall()
+        return [run_id for run_id, in rows]
+
+    def reusable_rows(self, order_id: int, is_refund: bool, row_hash: str) -> Optional[List[Tuple[int, dict]]]:
+        """ :return: the rows of the last export of this document if its content did not change since, else None """
+        entries = self._select('WHERE order_id = ? AND is_refund = ? ORDER BY updated_at DESC LIMIT 1',
+                               (order_id, int(is_refund)))
+        if entries and entries[0].row_hash == row_hash:
+            return entries[0].rows
+        return None
+
+    def _select(self, where: str, parameters: tuple) -> List[LedgerEntry]:
+        with self._lock:
+            rows = self._connect().execute(f"SELECT * FROM documents {where}", parameters).fetchall()
+        return [LedgerEntry(order_id, bool(is_refund), document_number, run_id, row_hash, status,
+                            [(product_id, row) for product_id, row in json.loads(rows_json)], updated_at)
+                for order_id, is_refund, document_number, run_id, row_hash, status, rows_json, updated_at in rows]
@@ -0,0 +1,190 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+
+from pathlib import Path
+from typing import List, Optional
+
+
+ERROR_PATTERN = re.compile(r'ERROR|CRITICAL|WARNING|Traceback|ne sera pas import|erreur', re.IGNORECASE)
+
+
+def error_excerpt(text: str, max_size: int, context: int = 3) -> str:
+    """ Shorten a log to the lines reporting errors and their context, or to its beginning and end if there is none """
+    lines = text.splitlines()
+    selected = set()
+    for i, line in enumerate(lines):
+        if ERROR_PATTERN.search(line):
+            selected.update(range(max(0, i - context), min(len(lines), i + context + 1)))
+    if selected:
+        excerpt, previous = [], -1
+        for i in sorted(selected):
+            if i != previous + 1:
+                excerpt.append('[...]')
+            excerpt.append(lines[i])
+            previous = i
+        if previous != len(lines) - 1:
+            excerpt.append('[...]')
+        text = '\n'.join(excerpt)
+    if len(text) > max_size:
+        text = text[:max_size // 2] + '\n[...]\n' + text[-max_size // 2:]
+    return text
+
+
+class MailOutbox:
+    """
+    On-disk outbox of the error reports: a mail is queued as a zip of its attachments and a JSON file, and sent later
+    by a background thread, so uploading the attachments does not delay the end of the run. Mails that could not be
+    sent stay in the outbox and are sent by the next flush (next run or next daemon cycle), until `max_attempts`
+    failures: the mail is then moved to the `failed` subdirectory.
+
+    A mail being sent is renamed to `.sending`; if the process dies meanwhile, the mail is queued again once its
+    `.sending` file is older than `sending_timeout`.
+    """
+
+    def __init__(self, directory: Path, max_attachment_size: int = 1024 * 1024,
+                 logger: Optional[logging.Logger] = None, max_attempts: int = 5, sending_timeout: float = 3600):
+        """
+        :param directory: outbox directory
+        :param max_attachment_size: attachments larger than this size (bytes) are shortened to their error excerpts
+        :param max_attempts: number of failed sends after which a mail is set aside
+        :param sending_timeout: seconds after which a mail still being sent is considered abandoned
+        """
+        self.directory = directory
+        self.max_attachment_size = max_attachment_size
+        self.max_attempts = max_attempts
+        self.sending_timeout = sending_timeout
+        self.logger = logger or logging.getLogger('ps_ebp_connector')
+        self._flush_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, subject: str, body: str, recipient: str, attachments: List[Path]) -> Path:
+        """ Queue a mail, its attachments are compressed into a single zip. :return: the path of the mail file """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"mail_{time.time():.6f}_{uuid.uuid4().hex[:8]}"
+        zip_path = self.directory / f"{name}.zip"
+        truncated = []
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for attachment in attachments:
+                if attachment.stat().st_size > self.max_attachment_size:
+                    text = attachment.read_text(encoding='utf-8', errors='replace')
+                    archive.writestr(attachment.name, error_excerpt(text, self.max_attachment_size))
+                    truncated.append(attachment.name)
+                else:
+                    archive.write(attachment, attachment.name)
+        if truncated:
+            body += f"\n\nFichiers tronqués aux extraits d'erreurs : {', '.join(truncated)}."
+        mail_path = self.directory / f"{name}.json"
+        tmp_path = mail_path.with_name(mail_path.name + '.tmp')
+        tmp_path.write_text(json.dumps({'subject': subject, 'body': body, 'recipient': recipient,
+                                        'attachment': zip_path.name, 'attempts': 0}, indent=2), encoding='utf-8')
+        # Le fichier JSON est ecrit en dernier : un mail n'est visible qu'une fois son zip complet
+        os.replace(tmp_path, mail_path)
+        return mail_path
+
+    def pending(self) -> List[Path]:
+        """ :return: the queued mails, oldest first, including the abandoned `.sending` mails """
+        if not self.directory.is_dir():
+            return []
+        for sending_path in self.directory.glob('mail_*.sending'):
+            try:
+                if time.time() - sending_path.stat().st_mtime > self.sending_timeout:
+                    sending_path.replace(sending_path.with_suffix('.json'))
+                    self.logger.warning(f"Mail {sending_path.name} abandoned while being sent, queued again")
+            except OSError:
+                pass
+        return sorted(self.directory.glob('mail_*.json'))
+
+    def flush(self, mailer) -> int:
+        """ Send the queued mails, oldest first: a mail that fails is kept for the next flush, the others are still
+            sent. :return: the number of mails sent """
+        sent = 0
+        with self._lock:
+            for mail_path in self.pending():
+                # Renommage = prise en charge, un autre processus ne l'enverra pas en meme temps
+                sending_path = mail_path.with_suffix('.sending')
+                try:
+                    mail_path.replace(sending_path)
+                    # Le renommage conserve la date du fichier : elle marque desormais le debut de l'envoi
+                    os.utime(sending_path)
+                    mail = json.loads(sending_path.read_text(encoding='utf-8'))
+                except OSError:
+                    continue
+                except ValueError as e:
+                    self._set_aside(sending_path, None, f"unreadable mail file - {e}")
+                    continue
+                zip_path = self.directory / mail['attachment']
+                try:
+                    mailer.send_mail(mail['subject'], mail['body'], mail['recipient'], [zip_path])
+                except Exception as e:
+                    mail['attempts'] += 1
+                    sending_path.write_text(json.dumps(mail, indent=2), encoding='utf-8')
+                    if mail['attempts'] >= self.max_attempts:
+                        self._set_aside(sending_path, zip_path, f"{mail['attempts']} failed attempts - {e}")
+                    else:
+                        sending_path.replace(mail_path)
+                        self.logger.warning(f"Unable to send mail {mail_path.name} (attempt {mail['attempts']}), "
+                                            f"kept in the outbox - {e}")
+                    continue
+                sending_path.unlink()
+                zip_path.unlink(missing_ok=True)
+                sent += 1
+        return sent
+
+    def _set_aside(self, sending_path: Path, zip_path: Optional[Path], reason: str):
+        """ Move a mail that will not be sent to the `failed` subdirectory """
+        failed_directory = self.directory / 'failed'
+        failed_directory.mkdir(exist_ok=True)
+        sending_path.replace(failed_directory / sending_path.with_suffix('.json').name)
+        if zip_path and zip_path.is_file():
+            zip_path.replace(failed_directory / zip_path.name)
+        self.logger.error(f"Mail {sending_path.stem} moved to {failed_directory} ({reason})")
+
+    def _flush_quietly(self, mailer):
+        try:
+            self.flush(mailer)
+        except Exception as e:
+            self.logger.warning(f"Unable to flush the mail outbox {self.directory} - {e}")
+
+    def flush_in_background(self, mailer) -> threading.Thread:
+        if self._flush_thread is None or not self._flush_thread.is_alive():
+            self._flush_thread = threading.Thread(target=self._flush_quietly, args=(mailer,), daemon=True,
+                                                  name='mail-outbox')
+            self._flush_thread.start()
+        return self._flush_thread
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """ Wait for the background flush. :return: True if no flush is running anymore """
+        if self._flush_thread:
+            self._flush_thread.join(timeout)
+            return not self._flush_thread.is_alive()
+        return True
@@ -1,8 +1,8 @@
-from O365 import Account
-
-
 class Mailer:
     def __init__(self, client_id: str, client_secret: str, tenant: str, email: str):
+        # Import differe : O365 (et msal, bs4...) n'est charge que si l'envoi de mails est configure
+        from O365 import Account
+
         self._email = email
 
         credentials = (client_id, client_secret)
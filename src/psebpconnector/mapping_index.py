@@ -0,0 +1,196 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import csv
+import json
+import logging
+import os
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+VAT_MAPPING_EXONERATION_ID = -1
+
+PaymentMethodInfo = Tuple[str, str, str, str]
+VatInfo = Tuple[float, str]
+
+
+def parse_payment_method_mapping(path: Path) -> Dict[Tuple[str, bool], PaymentMethodInfo]:
+    """ :return: (ebp_client_code, currency, territoriality, ebp_payment_method) by (payment method, VAT applied) """
+    mapping = {}
+    with open(path, 'r') as f:
+        reader = csv.reader(f, delimiter=';')
+        next(reader, None)  # Skip header
+
+        line_number = 2
+        for rows in reader:
+            if rows:
+                if len(rows) != 6:
+                    raise ValueError(f"{path.name}, l.{line_number}: expected 6 columns")
+                ps_payment_method, with_vat, client_code, currency, territoriality, ebp_payment_method = rows
+                mapping[(ps_payment_method.strip(), with_vat == 'AVEC')] = (
+                    client_code.strip(),
+                    currency.strip(),
+                    territoriality.strip(),
+                    ebp_payment_method.strip())
+            line_number += 1
+    return mapping
+
+
+def parse_vat_mapping(path: Path) -> Dict[Tuple[str, int], VatInfo]:
+    """ :return: (vat_value, ebp_vat_id) by (territoriality, Prestashop country ID) """
+    mapping = {}
+    with open(path, 'r') as f:
+        reader = csv.reader(f, delimiter=';')
+        next(reader, None)  # Skip header
+
+        line_number = 2
+        for rows in reader:
+            if rows:
+                if len(rows) != 12:
+                    raise ValueError(f"{path.name}, l.{line_number}: expected 12 columns")
+                territoriality, vat, ebp_id, ps_country_id = rows[0], rows[2], rows[10], int(rows[11])
+
+                # EXONERATION
+                vat = float(vat.replace(',', '.')) / 100
+
+                mapping[(territoriality, ps_country_id)] = (vat, ebp_id)
+            line_number += 1
+    return mapping
+
+
+class MappingIndex:
+    """
+    Payment method and VAT mappings compiled into flat dicts: one lookup per order instead of nested key checks.
+    The index is validated once when it is built, and cached as a JSON snapshot rebuilt only when a mapping file
+    changes.
+    """
+    SNAPSHOT_VERSION = 2
+
+    def __init__(self,
+                 payment_methods: Dict[Tuple[str, bool], PaymentMethodInfo],
+                 vat: Dict[Tuple[str, int], VatInfo]):
+        self.payment_methods = payment_methods
+        self.vat = vat
+        self.territorialities = {territoriality for territoriality, _ in vat}
+
+    @classmethod
+    def from_files(cls, payment_method_mapping_path: Path, vat_mapping_path: Path) -> 'MappingIndex':
+        """
+        :raises:
+            ValueError: If a mapping file is malformed.
+            AssertionError: If the mappings are not consistent, see `validate`.
+        """
+        index = cls(parse_payment_method_mapping(payment_method_mapping_path), parse_vat_mapping(vat_mapping_path))
+        index.validate()
+        return index
+
+    @classmethod
+    def from_nested(cls, payment_method_mapping: dict, vat_mapping: dict) -> 'MappingIndex':
+        """ Index of the nested dicts of `Connector.payment_method_mapping` and `Connector.vat_mapping` """
+        return cls({(payment_method, with_vat): info
+                    for payment_method, infos in payment_method_mapping.items() for with_vat, info in infos.items()},
+                   {(territoriality, country_id): info
+                    for territoriality, infos in vat_mapping.items() for country_id, info in infos.items()})
+
+    @classmethod
+    def load(cls, payment_method_mapping_path: Path, vat_mapping_path: Path,
+             snapshot_path: Optional[Path] = None) -> 'MappingIndex':
+        """ Index of the mapping files, read from the snapshot when the files did not change since it was written
+
+        The snapshot is plain JSON data (no pickle): the working directory may be a shared folder.
+        """
+        signature = [cls.SNAPSHOT_VERSION] + [[str(path.resolve()), path.stat().st_mtime_ns, path.stat().st_size]
+                                              for path in (payment_method_mapping_path, vat_mapping_path)]
+        if snapshot_path and snapshot_path.is_file():
+            try:
+                snapshot = json.loads(snapshot_path.read_text(encoding='utf-8'))
+                if snapshot['signature'] == signature:
+                    return cls.from_snapshot(snapshot)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.getLogger('ps_ebp_connector').warning(f"Ignoring mapping snapshot {snapshot_path} - {e}")
+
+        index = cls.from_files(payment_method_mapping_path, vat_mapping_path)
+        if snapshot_path:
+            try:
+                tmp_path = snapshot_path.with_name(snapshot_path.name + '.tmp')
+                tmp_path.write_text(json.dumps(index.to_snapshot(signature)), encoding='utf-8')
+                os.replace(tmp_path, snapshot_path)
+            except OSError as e:
+                logging.getLogger('ps_ebp_connector').warning(f"Unable to write mapping snapshot {snapshot_path} - {e}")
+        return index
+
+    def to_snapshot(self, signature: list) -> dict:
+        return {'signature': signature,
+                'payment_methods': [[payment_method, with_vat, list(info)]
+                                    for (payment_method, with_vat), info in self.payment_methods.items()],
+                'vat': [[territoriality, country_id, list(info)]
+                        for (territoriality, country_id), info in self.vat.items()]}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> 'MappingIndex':
+        """
+        :raises:
+            KeyError, TypeError, ValueError: If the snapshot is malformed.
+        """
+        payment_methods = {}
+        for payment_method, with_vat, (client_code, currency, territoriality, ebp_payment_method) \
+                in snapshot['payment_methods']:
+            payment_methods[(str(payment_method), bool(with_vat))] = (
+                str(client_code), str(currency), str(territoriality), str(ebp_payment_method))
+        vat = {(str(territoriality), int(country_id)): (float(rate), str(ebp_id))
+               for territoriality, country_id, (rate, ebp_id) in snapshot['vat']}
+        return cls(payment_methods, vat)
+
+    def validate(self):
+        """
+        Check in one pass that every territoriality of the payment methods is in the VAT mapping, with an exoneration
+        entry when the payment method is used without VAT.
+
+        :raises:
+            AssertionError: If the mappings are not consistent.
+        """
+        for (payment_method, with_vat), info in self.payment_methods.items():
+            territoriality = info[2]
+            assert territoriality in self.territorialities, \
+                f"Territoriality '{territoriality}' not found in VAT mapping file"
+            assert with_vat or (territoriality, VAT_MAPPING_EXONERATION_ID) in self.vat, \
+                f"Payment method '{payment_method}' without VAT: no exoneration entry " \
+                f"({VAT_MAPPING_EXONERATION_ID}) in VAT mapping file for territoriality '{territoriality}'"
+
+    def payment_method(self, payment_method: str, vat_applied: bool) -> Optional[PaymentMethodInfo]:
+        return self.payment_methods.get((payment_method, vat_applied))
+
+    def vat_rate(self, territoriality: str, country_id: int) -> Optional[VatInfo]:
+        return self.vat.get((territoriality, country_id))
+
+    def nested(self) -> Tuple[dict, dict]:
+        """ :return: the nested dicts of `Connector.payment_method_mapping` and `Connector.vat_mapping` """
+        payment_method_mapping, vat_mapping = {}, {}
+        for (payment_method, with_vat), info in self.payment_methods.items():
+            payment_method_mapping.setdefault(payment_method, {})[with_vat] = info
+        for (territoriality, country_id), info in self.vat.items():
+            vat_mapping.setdefault(territoriality, {})[country_id] = info
+        return payment_method_mapping, vat_mapping
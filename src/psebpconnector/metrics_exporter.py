@@ -0,0 +1,172 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import time
+
+from pathlib import Path
+from psebpconnector.run_report import LATENCY_BUCKETS, EndpointStatistics, RunReport
+from typing import Dict, List, Optional
+
+
+class MetricsExporter:
+    """
+    Write connector metrics as a Prometheus/OpenMetrics textfile, to be scraped by the node_exporter textfile collector.
+
+    Counters are cumulated over every run finished by this exporter (one run in one-shot mode, every cycle in
+    long-running modes) plus the run in progress; phase durations are those of the last (or current) run.
+    """
+
+    PREFIX = 'psebpconnector'
+
+    def __init__(self, textfile_path: Path, interval: int = 0, labels: Optional[Dict[str, str]] = None):
+        """
+        :param textfile_path: destination file, should end with `.prom` to be picked up by node_exporter
+        :param interval: minimum number of seconds between two periodic writes during a run, 0 disables them
+        :param labels: constant labels added to every sample (shop name...)
+        """
+        self.textfile_path = Path(textfile_path)
+        self.interval = interval
+        self.labels = labels or {}
+        self._counters: Dict[str, int] = {}
+        self._endpoints: Dict[str, EndpointStatistics] = {}
+        self._runs = {'success': 0, 'failure': 0}
+        self._last_run: Optional[RunReport] = None
+        self._last_write = time.monotonic()
+
+    def _labels(self, **labels) -> str:
+        labels = {**self.labels, **labels}
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{self._escape(value)}"' for key, value in labels.items()) + '}'
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+    def _merged(self, report: Optional[RunReport]):
+        counters = dict(self._counters)
+        endpoints = {}
+        for name, stats in self._endpoints.items():
+            endpoints[name] = EndpointStatistics()
+            endpoints[name].merge(stats)
+        if report is not None:
+            report_counters, report_endpoints = report.snapshot()
+            for name, value in report_counters.items():
+                counters[name] = counters.get(name, 0) + value
+            for name, stats in report_endpoints.items():
+                endpoints.setdefault(name, EndpointStatistics()).merge(stats)
+        return counters, endpoints
+
+    def finish(self, report: RunReport, success: bool):
+        """ Add a finished run to the cumulated counters and write the textfile """
+        self._counters, self._endpoints = self._merged(report)
+        self._runs['success' if success else 'failure'] += 1
+        self._last_run = report
+        self.write()
+
+    def maybe_write(self, report: RunReport):
+        """ Periodic write during a run, at most once every `interval` seconds """
+        if self.interval and time.monotonic() - self._last_write >= self.interval:
+            self.write(report)
+
+    def render(self, report: Optional[RunReport] = None) -> str:
+        """ :param report: run in progress, not yet passed to `finish` """
+        counters, endpoints = self._merged(report)
+        current = report or self._last_run
+        p = self.PREFIX
+        lines: List[str] = []
+
+        # Noms de familles OpenMetrics : le suffixe _total n'apparait que sur les echantillons des compteurs
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {metric_type}")
+
+        family('http_request_duration_seconds', 'histogram', 'Latency of the Prestashop webservice requests.')
+        for name, stats in sorted(endpoints.items()):
+            method, endpoint = name.split(' ', 1)
+            cumulative = 0
+            for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], stats.buckets):
+                cumulative += count
+                lines.append(f"{p}_http_request_duration_seconds_bucket"
+                             f"{self._labels(method=method, endpoint=endpoint, le=bound)} {cumulative}")
+            lines.append(f"{p}_http_request_duration_seconds_sum"
+                         f"{self._labels(method=method, endpoint=endpoint)} {stats.total_time}")
+            lines.append(f"{p}_http_request_duration_seconds_count"
+                         f"{self._labels(method=method, endpoint=endpoint)} {stats.count}")
+
+        family('http_request_errors', 'counter', 'Prestashop webservice requests failed or with an error status.')
+        for name, stats in sorted(endpoints.items()):
+            method, endpoint = name.split(' ', 1)
+            lines.append(f"{p}_http_request_errors_total{self._labels(method=method, endpoint=endpoint)} {stats.errors}")
+
+        family('http_response_bytes', 'counter',
+               'Size of the Prestashop webservice responses, as transferred and once decompressed.')
+        for name, stats in sorted(endpoints.items()):
+            method, endpoint = name.split(' ', 1)
+            for encoding, value in [('transferred', stats.bytes_received), ('decoded', stats.bytes_decoded)]:
+                lines.append(f"{p}_http_response_bytes_total"
+                             f"{self._labels(method=method, endpoint=endpoint, size=encoding)} {value}")
+
+        family('orders', 'counter', 'Orders handled by the connector, by kind and result.')
+        for kind in ['order', 'refund']:
+            for result, counter in [('exported', 'processed'), ('rejected', 'rejected'),
+                                    ('marked_exported', 'marked_exported')]:
+                value = counters.get(f"{kind}s_{counter}", 0)
+                lines.append(f"{p}_orders_total{self._labels(kind=kind, result=result)} {value}")
+
+        family('rows_exported', 'counter', 'Order rows written to the EBP import file.')
+        lines.append(f"{p}_rows_exported_total{self._labels()} {counters.get('rows_exported', 0)}")
+
+        family('ebp_rejected_documents', 'counter', 'Documents rejected by the EBP import.')
+        lines.append(f"{p}_ebp_rejected_documents_total{self._labels()} {counters.get('ebp_rejected_documents', 0)}")
+
+        family('runs', 'counter', 'Connector runs finished, by result.')
+        for result, value in self._runs.items():
+            lines.append(f"{p}_runs_total{self._labels(result=result)} {value}")
+
+        if current is not None:
+            family('phase_duration_seconds', 'gauge', 'Duration of each phase of the last connector run.')
+            for phase, duration in sorted(dict(current.phases).items()):
+                lines.append(f"{p}_phase_duration_seconds{self._labels(phase=phase)} {duration}")
+
+            family('run_in_progress', 'gauge', 'Whether a connector run is in progress.')
+            lines.append(f"{p}_run_in_progress{self._labels()} {int(report is not None)}")
+
+            family('last_run_start_timestamp_seconds', 'gauge', 'Start time of the last connector run.')
+            lines.append(f"{p}_last_run_start_timestamp_seconds{self._labels()} {current.started_at}")
+
+            if report is None and 'exit_code' in current.outcome:
+                family('last_run_success', 'gauge', 'Whether the last connector run succeeded.')
+                lines.append(f"{p}_last_run_success{self._labels()} {int(current.outcome['exit_code'] == 0)}")
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, report: Optional[RunReport] = None):
+        """ Atomically replace the textfile so the collector never reads a partial file """
+        tmp_path = self.textfile_path.with_name(self.textfile_path.name + '.tmp')
+        tmp_path.write_text(self.render(report), encoding='utf-8')
+        os.replace(tmp_path, self.textfile_path)
+        self._last_write = time.monotonic()
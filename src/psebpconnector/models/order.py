@@ -42,6 +42,7 @@ class Order(Model):
     is_refund: bool = False
     associations: Optional[dict] = None
     date_add: str = ""
+    date_upd: str = ''
     conversion_rate: float = 1
     current_state: int = 0
     delivery_date: str = ''
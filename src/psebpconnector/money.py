@@ -0,0 +1,114 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Union
+
+# Montants en micro-unites (entiers, 6 decimales) : la precision des montants Prestashop et du format CSV d'EBP
+MICRO = 1_000_000
+_DIGITS = 6
+
+Amount = Union[str, int, float]
+
+
+def parse(value: Amount) -> int:
+    """
+    Parse an amount once into integer micro-units, without going through a float for the Prestashop strings.
+
+    :param value: Prestashop amount ('12.340000'), or a number (offline datasets, mapping files)
+    :return: the amount in micro-units, rounded half away from zero beyond the 6th decimal
+    """
+    if isinstance(value, int):
+        return value * MICRO
+    text = value.strip() if isinstance(value, str) else repr(float(value))
+    negative = text.startswith('-')
+    if negative or text.startswith('+'):
+        text = text[1:]
+    if not text:
+        raise ValueError(f"Invalid amount {value!r}")
+    if 'e' in text or 'E' in text:
+        # Notation scientifique (repr d'un float) : cas rare, on laisse Decimal s'en charger
+        micro = int((Decimal(text) * MICRO).to_integral_value(ROUND_HALF_UP))
+    else:
+        whole, _, decimals = text.partition('.')
+        micro = int(whole or '0') * MICRO + int(decimals[:_DIGITS].ljust(_DIGITS, '0'))
+        if decimals[_DIGITS:_DIGITS + 1] >= '5':
+            micro += 1
+    return -micro if negative else micro
+
+
+def divide(numerator: int, denominator: int) -> int:
+    """ Integer division rounded half away from zero, like `round` on the exact quotient """
+    quotient = (2 * abs(numerator) + abs(denominator)) // (2 * abs(denominator))
+    return -quotient if (numerator < 0) != (denominator < 0) else quotient
+
+
+def format_amount(micro: int) -> str:
+    """ :return: the amount with 6 decimals ('12.340000'), the format of the EBP CSV files """
+    units, decimals = divmod(abs(micro), MICRO)
+    return '%s%d.%06d' % ('-' if micro < 0 else '', units, decimals)
+
+
+def format_short(micro: int) -> str:
+    """ :return: the amount without its trailing zeros but with at least one decimal ('20.0', '5.5') """
+    return format_amount(micro).rstrip('0').rstrip('.') + ('.0' if micro % MICRO == 0 else '')
+
+
+@dataclass(frozen=True)
+class OrderAmounts:
+    """
+    Order level amounts of the exported rows, computed once per order instead of once per order row: every row of
+    an order carries the same totals, shipping cost and VAT rate.
+    """
+    vat_rate: str
+    shipping_vat_rate: str
+    discount_pct: str
+    shipping_notax: str
+    total: str
+    foreign_currency: bool
+    currency_rate: str
+    currency_amount: str
+    currency_shipping_notax: str
+
+    @classmethod
+    def from_order(cls, order, vat_rate: Amount) -> 'OrderAmounts':
+        """ :param vat_rate: VAT rate of the order, as a fraction (0.2) """
+        rate = parse(vat_rate)
+        total_products_wt = parse(order.total_products_wt)
+        total_shipping = parse(order.total_shipping)
+        conversion_rate = parse(order.conversion_rate)
+        shipping_notax = format_amount(divide(total_shipping * MICRO, MICRO + rate))
+        total = format_amount(total_products_wt + total_shipping)
+        total_discounts = parse(order.total_discounts)
+        foreign_currency = conversion_rate != MICRO
+        return cls(vat_rate=format_amount(rate * 100),
+                   shipping_vat_rate=format_short(rate * 100),
+                   discount_pct=format_amount(divide(total_discounts * 100 * MICRO, total_products_wt)),
+                   shipping_notax=shipping_notax,
+                   total='' if total_discounts > 0 else total,
+                   foreign_currency=foreign_currency,
+                   currency_rate=format_amount(conversion_rate) if foreign_currency else '',
+                   currency_amount=total if foreign_currency else '',
+                   currency_shipping_notax=shipping_notax if foreign_currency else '')
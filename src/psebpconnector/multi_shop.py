@@ -0,0 +1,116 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from psebpconnector.connector import Connector
+from psebpconnector.shared_resources import DatabaseLocks, MappingCache
+from typing import Dict, List, Optional
+
+
+class MultiShopRunner:
+    """
+    Synchronizes several Prestashop instances in one process, one configuration file per shop. Each shop keeps its
+    own webservice session, working directory and EBP database, and the shops are synchronized concurrently: the
+    mapping files they share are parsed once, and the imports in a same EBP database are serialized.
+    """
+
+    def __init__(self, config_paths: List[Path], profile: Optional[str] = None, max_workers: Optional[int] = None):
+        """
+        :param config_paths: one configuration file per shop
+        :param profile: profiling mode, see `Connector`
+        :param max_workers: number of shops synchronized at the same time, all of them by default
+        :raises:
+            ValueError: If two shops share a working directory.
+        """
+        self.mapping_cache = MappingCache()
+        self.database_locks = DatabaseLocks()
+        self.max_workers = max_workers or len(config_paths)
+        self.exit_codes: Dict[str, int] = {}
+        self.logger = self._setup_logger()
+        self.connectors: Dict[str, Connector] = {}
+        config_paths = [Path(config_path) for config_path in config_paths]
+        # shop1.ini, shop2.ini... ou shop1/config.ini, shop2/config.ini...
+        use_stems = len({path.stem for path in config_paths}) == len(config_paths)
+        for config_path in config_paths:
+            name = self._unique_name(config_path.stem if use_stems else config_path.resolve().parent.name)
+            self.connectors[name] = Connector(config_path, profile=profile, name=name,
+                                              mapping_cache=self.mapping_cache,
+                                              database_locks=self.database_locks)
+
+        working_directories = [connector.config.working_directory.resolve() for connector in self.connectors.values()]
+        if len(set(working_directories)) != len(working_directories):
+            raise ValueError("Each shop requires its own working directory")
+        # Un seul pool pour toute la vie du runner (mode daemon) plutot qu'un par cycle
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='shop')
+
+    def _unique_name(self, name: str) -> str:
+        # Les noms servent de noms de loggers : pas de point, sinon la hierarchie des loggers s'en mele
+        name = name.replace('.', '_')
+        unique_name, index = name, 2
+        while unique_name in self.connectors:
+            unique_name = f"{name}-{index}"
+            index += 1
+        return unique_name
+
+    @staticmethod
+    def _setup_logger():
+        logger = logging.getLogger('ps_ebp_connector')
+        logger.setLevel(logging.DEBUG)
+        if not logger.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter('ps_ebp_connector - [%(levelname)s] %(message)s'))
+            handler.setLevel(logging.INFO)
+            logger.addHandler(handler)
+        return logger
+
+    @property
+    def config(self):
+        """ Configuration of the first shop, its [daemon] section schedules all the shops """
+        return next(iter(self.connectors.values())).config
+
+    def _run_shop(self, name: str) -> int:
+        connector = self.connectors[name]
+        try:
+            return connector.run()
+        except Exception as e:
+            self.logger.error(f"Shop {name}: synchronization failed - {e}")
+            return 1
+        finally:
+            # Session propre au thread du pool : le prochain cycle peut confier la boutique a un autre thread
+            connector.webservice._close_thread_session()
+
+    def run(self) -> int:
+        """ Synchronize all the shops, returns 0 when all of them succeeded, 1 otherwise """
+        self.exit_codes = dict(zip(self.connectors, self._executor.map(self._run_shop, self.connectors)))
+        for name, exit_code in self.exit_codes.items():
+            self.logger.info(f"Shop {name}: exit code {exit_code}")
+        return max(self.exit_codes.values(), default=0)
+
+    def close(self):
+        """ Stop the threads of the shops, once the last synchronization is done """
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,347 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from psebpconnector.connector import Connector
+from psebpconnector.daemon import install_signal_handlers
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+
+def parse_order_ids(text: str) -> List[int]:
+    """ Order IDs from a notification: a JSON object ({"id_order": 12} or {"ids": [12, 13]}), a JSON list, a
+        form-encoded body (id_order=12&id_order=13) or IDs separated by spaces, commas or new lines.
+
+        :raises:
+            ValueError: If the notification does not hold order IDs.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except ValueError:
+        form = parse_qs(text)
+        if form:
+            data = {key: values for key, values in form.items()}
+        else:
+            data = [order_id for order_id in re.split(r'[\s,;]+', text) if order_id]
+    if isinstance(data, dict):
+        data = data.get('ids', data.get('id_order', data.get('id', [])))
+    if not isinstance(data, list):
+        data = [data]
+    # int(None), int({...}) levent TypeError : toute notification mal formee leve ValueError pour les appelants
+    try:
+        return [int(order_id) for order_id in data]
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid order IDs: {text[:100]}")
+
+
+class OrderQueue:
+    """ Deduplicated queue of order IDs, consumed by micro-batches. An ID can be queued with a delay (retry of a
+        failed micro-batch): it is only available once the delay is over. """
+
+    def __init__(self):
+        # Instant (time.monotonic) a partir duquel chaque ID est disponible
+        self._ids: Dict[int, float] = {}
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._ids)
+
+    def put(self, order_ids: Iterable[int], delay: float = 0.0):
+        """ :param delay: seconds before the IDs are available, an ID notified again meanwhile is available at once """
+        available_at = time.monotonic() + delay
+        with self._condition:
+            for order_id in order_ids:
+                order_id = int(order_id)
+                self._ids[order_id] = min(self._ids.get(order_id, available_at), available_at)
+            self._condition.notify_all()
+
+    def take_batch(self, batch_size: int, window: float, stop: threading.Event) -> List[int]:
+        """
+        Wait for a micro-batch: returns as soon as `batch_size` IDs are available, or `window` seconds after the
+        oldest available ID arrived. Returns an empty list when `stop` is set.
+        """
+        with self._condition:
+            while not stop.is_set():
+                now = time.monotonic()
+                available = [order_id for order_id, available_at in self._ids.items() if available_at <= now]
+                timeout = 1.0
+                if available:
+                    waited = now - min(self._ids[order_id] for order_id in available)
+                    if len(available) >= batch_size or waited >= window:
+                        batch = available[:batch_size]
+                        for order_id in batch:
+                            del self._ids[order_id]
+                        return batch
+                    timeout = min(timeout, window - waited)
+                deferred = [available_at - now for available_at in self._ids.values() if available_at > now]
+                if deferred:
+                    timeout = min(timeout, min(deferred))
+                self._condition.wait(timeout)
+            return []
+
+
+class SpoolDirectoryWatcher(threading.Thread):
+    """
+    Queue the order IDs of the files dropped in a directory. A file is only deleted once all its orders were exported
+    by a successful micro-batch (`acknowledge`): after a restart, the orders accepted but not yet exported are queued
+    again from the files left in the directory.
+    """
+
+    def __init__(self, directory: Path, queue: OrderQueue, stop: threading.Event, interval: float = 1.0):
+        super().__init__(daemon=True, name='spool-watcher')
+        self.directory = Path(directory)
+        self.queue = queue
+        self.interval = interval
+        self._stop_event = stop
+        # IDs pas encore exportes de chaque fichier deja mis en file
+        self._pending: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.logger = logging.getLogger('ps_ebp_connector')
+
+    def scan(self):
+        for path in sorted(self.directory.iterdir()):
+            # Fichiers en cours d'ecriture par le producteur : a deposer en .tmp puis renommer
+            if not path.is_file() or path.name.startswith('.') or path.suffix in ('.tmp', '.error'):
+                continue
+            with self._lock:
+                if path.name in self._pending:
+                    continue
+            try:
+                order_ids = parse_order_ids(path.read_text(encoding='utf-8'))
+            except ValueError:
+                self.logger.error(f"Spool file {path.name}: invalid content, moved to {path.name}.error")
+                path.replace(path.with_name(path.name + '.error'))
+                continue
+            if not order_ids:
+                path.unlink()
+                continue
+            with self._lock:
+                self._pending[path.name] = set(order_ids)
+            self.queue.put(order_ids)
+
+    def write(self, order_ids: List[int]):
+        """ Durably record notified order IDs in a new spool file, then queue them
+
+        :raises:
+            OSError: If the file cannot be written, the IDs are then not queued.
+        """
+        with self._lock:
+            self._counter += 1
+            name = f"http-{time.time_ns()}-{self._counter}.json"
+            path = self.directory / name
+            tmp_path = path.with_name(name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'ids': order_ids}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+            self._pending[name] = set(order_ids)
+        self.queue.put(order_ids)
+
+    def acknowledge(self, order_ids: Iterable[int]):
+        """ Forget exported orders, and delete the spool files whose orders were all exported """
+        order_ids = set(order_ids)
+        with self._lock:
+            for name, pending in list(self._pending.items()):
+                pending -= order_ids
+                if not pending:
+                    del self._pending[name]
+                    try:
+                        (self.directory / name).unlink()
+                    except FileNotFoundError:
+                        pass
+
+    def run(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        while not self._stop_event.is_set():
+            try:
+                self.scan()
+            except OSError as e:
+                self.logger.error(f"Unable to scan spool directory {self.directory} - {e}")
+            self._stop_event.wait(self.interval)
+
+
+class OrderTrigger:
+    """
+    Event-driven mode: order IDs are notified on a small local HTTP endpoint (POST /orders, for example by a
+    Prestashop hook module) or dropped as files in a spool directory. They are queued and exported by micro-batches,
+    each micro-batch being a regular connector run restricted to the queued orders.
+
+    The IDs notified over HTTP are written to the spool directory before they are acknowledged (`trigger_spool` in the
+    working directory when none is configured), and the spool files are kept until their orders are exported.
+    """
+
+    def __init__(self,
+                 connector: Connector,
+                 listen: Optional[Tuple[str, int]] = None,
+                 spool_directory: Optional[Path] = None,
+                 batch_size: int = 50,
+                 batch_window: float = 60,
+                 token: Optional[str] = None,
+                 retry_delay: float = 60,
+                 max_retry_delay: float = 3600):
+        """
+        :param listen: (host, port) of the HTTP endpoint
+        :param spool_directory: directory watched for files of order IDs, also where the HTTP notifications are kept
+        :param batch_size: maximum number of orders per micro-batch
+        :param batch_window: maximum number of seconds an order waits before its micro-batch starts
+        :param token: when set, HTTP notifications must carry it in the X-Connector-Token header
+        :param retry_delay: seconds before the orders of a failed micro-batch are queued again, doubled after each
+            new failure
+        :param max_retry_delay: maximum number of seconds before a retry
+        """
+        if not listen and not spool_directory:
+            raise ValueError("Trigger mode requires an HTTP endpoint or a spool directory")
+        self.connector = connector
+        self.queue = OrderQueue()
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.token = token
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.exit_codes: List[int] = []
+        # Echecs consecutifs des micro-batches contenant chaque commande
+        self._failures: Dict[int, int] = {}
+        self.logger = logging.getLogger('ps_ebp_connector')
+        self._stopped = threading.Event()
+        self._started = False
+        self._server = ThreadingHTTPServer(listen, self._build_handler()) if listen else None
+        self._watcher = SpoolDirectoryWatcher(spool_directory or connector.config.working_directory / 'trigger_spool',
+                                              self.queue, self._stopped)
+
+    @property
+    def server_address(self) -> Optional[Tuple[str, int]]:
+        return self._server.server_address[:2] if self._server else None
+
+    def _build_handler(self):
+        trigger = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _answer(self, status: int, payload: dict):
+                content = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                if self.path.rstrip('/') != '/health':
+                    return self._answer(404, {'error': 'not found'})
+                self._answer(200, {'queued': len(trigger.queue)})
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/orders':
+                    return self._answer(404, {'error': 'not found'})
+                if trigger.token and self.headers.get('X-Connector-Token') != trigger.token:
+                    return self._answer(403, {'error': 'invalid token'})
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    return self._answer(400, {'error': 'invalid Content-Length'})
+                try:
+                    order_ids = parse_order_ids(self.rfile.read(length).decode('utf-8'))
+                except ValueError:
+                    return self._answer(400, {'error': 'invalid order IDs'})
+                if order_ids:
+                    # 202 seulement une fois les IDs sur disque : un redemarrage ne perd pas les commandes acceptees
+                    try:
+                        trigger._watcher.write(order_ids)
+                    except OSError as e:
+                        trigger.logger.error(f"Unable to spool notified orders {order_ids} - {e}")
+                        return self._answer(503, {'error': 'unable to record the order IDs'})
+                self._answer(202, {'queued': order_ids})
+
+            def log_message(self, *_):
+                pass
+
+        return Handler
+
+    def install_signal_handlers(self):
+        install_signal_handlers(self.stop)
+
+    def start(self):
+        """ Start receiving notifications, in background threads """
+        self._started = True
+        self._watcher.directory.mkdir(parents=True, exist_ok=True)
+        self._watcher.start()
+        self.logger.info(f"Watching spool directory {self._watcher.directory}")
+        if self._server:
+            threading.Thread(target=self._server.serve_forever, args=(0.5,), daemon=True, name='trigger-http').start()
+            self.logger.info(f"Listening for order notifications on {self.server_address}")
+
+    def run_batch(self, order_ids: List[int]) -> int:
+        """ Run a micro-batch. When the run fails, its orders are queued again with an exponential backoff. """
+        self.logger.info(f"Micro-batch of {len(order_ids)} orders: {order_ids}")
+        exit_code = self.connector.run(order_ids=order_ids)
+        self.exit_codes.append(exit_code)
+        if exit_code == 0:
+            for order_id in order_ids:
+                self._failures.pop(order_id, None)
+            self._watcher.acknowledge(order_ids)
+        else:
+            failures = 1 + max(self._failures.get(order_id, 0) for order_id in order_ids)
+            for order_id in order_ids:
+                self._failures[order_id] = failures
+            delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+            self.logger.warning(f"Micro-batch failed (attempt {failures}), its orders are queued again in "
+                                f"{delay:.0f} seconds")
+            self.queue.put(order_ids, delay=delay)
+        return exit_code
+
+    def run_forever(self, max_batches: int = 0):
+        """ :param max_batches: stop after this number of micro-batches, 0 runs until `stop` is called """
+        self.start()
+        try:
+            while not self._stopped.is_set():
+                order_ids = self.queue.take_batch(self.batch_size, self.batch_window, self._stopped)
+                if order_ids:
+                    self.run_batch(order_ids)
+                if max_batches and len(self.exit_codes) >= max_batches:
+                    break
+        finally:
+            self.stop()
+
+    def stop(self, *_):
+        self._stopped.set()
+        if self._server:
+            if self._started:
+                self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,157 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import cProfile
+import csv
+import gc
+import sys
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class StackSampler(threading.Thread):
+    """ Sampling profiler: periodically records the Python stack of one thread, as collapsed stacks """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = self._current_frame()
+            stack = []
+            while frame is not None:
+                stack.append(f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def _current_frame(self):
+        # Un ramasse-miettes declenche pendant sys._current_frames() peut bloquer le processus (CPython gh-106883) :
+        # il est suspendu le temps de l'appel
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return sys._current_frames().get(self.thread_id)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def write(self, path: Path):
+        """ Write the samples in the collapsed format expected by flamegraph.pl / speedscope """
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Opt-in profiling of the connector phases.
+
+    For each phase, writes `profile_<run>_<phase>.pstats` (cProfile) and/or `profile_<run>_<phase>.folded` (sampled
+    collapsed stacks, for flamegraphs) in the output directory. Every webservice call is traced with its wall time in
+    `http_trace_<run>.csv`, and `profile_<run>_summary.csv` gives wall time, CPU time and network wait per phase.
+    """
+
+    MODES = ('cprofile', 'sampling', 'all')
+
+    def __init__(self, output_directory: Path, run_id: str, mode: str = 'all', sampling_interval: float = 0.005):
+        """
+        :param mode: 'cprofile', 'sampling' or 'all'
+        :param sampling_interval: seconds between two samples of the sampling profiler
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}', expected one of {', '.join(self.MODES)}")
+        self.output_directory = Path(output_directory)
+        self.run_id = run_id
+        self.mode = mode
+        self.sampling_interval = sampling_interval
+        self.summary: Dict[str, Dict[str, float]] = {}
+        self._current_phase: Optional[str] = None
+        self._lock = threading.Lock()
+        self._trace_path = self.output_directory / f"http_trace_{run_id}.csv"
+        self._trace_file = open(self._trace_path, 'w', encoding='utf-8', newline='')
+        self._trace = csv.writer(self._trace_file, delimiter=';')
+        self._trace.writerow(['start', 'phase', 'thread', 'method', 'endpoint', 'status_code', 'duration_ms', 'url'])
+
+    def _path(self, phase: str, extension: str) -> Path:
+        return self.output_directory / f"profile_{self.run_id}_{phase}.{extension}"
+
+    @contextmanager
+    def phase(self, name: str):
+        profile = cProfile.Profile() if self.mode in ('cprofile', 'all') else None
+        sampler = StackSampler(threading.get_ident(), self.sampling_interval) if self.mode in ('sampling', 'all') else None
+        previous_phase, self._current_phase = self._current_phase, name
+        summary = self.summary.setdefault(name, {'wall_time': 0.0, 'cpu_time': 0.0, 'http_time': 0.0, 'http_calls': 0})
+        if sampler:
+            sampler.start()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            summary['wall_time'] += time.perf_counter() - wall_start
+            summary['cpu_time'] += time.thread_time() - cpu_start
+            self._current_phase = previous_phase
+            if profile:
+                profile.dump_stats(self._path(name, 'pstats'))
+            if sampler:
+                sampler.stop()
+                sampler.write(self._path(name, 'folded'))
+
+    def trace_request(self, method: str, endpoint: str, url: str, status_code: Optional[int], start: float,
+                      duration: float):
+        """ Webservice request listener, see `Webservice.request_listeners` """
+        with self._lock:
+            phase = self._current_phase or 'none'
+            self._trace.writerow([f"{start:.6f}", phase, threading.current_thread().name, method.upper(), endpoint,
+                                  status_code if status_code is not None else '', f"{duration * 1000:.3f}", url])
+            summary = self.summary.setdefault(phase, {'wall_time': 0.0, 'cpu_time': 0.0, 'http_time': 0.0,
+                                                      'http_calls': 0})
+            summary['http_time'] += duration
+            summary['http_calls'] += 1
+
+    def close(self):
+        self._trace_file.close()
+        with open(self._path('summary', 'csv'), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['phase', 'wall_time', 'cpu_time', 'http_time', 'http_calls'])
+            for phase, summary in self.summary.items():
+                writer.writerow([phase, f"{summary['wall_time']:.6f}", f"{summary['cpu_time']:.6f}",
+                                 f"{summary['http_time']:.6f}", summary['http_calls']])
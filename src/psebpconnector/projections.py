@@ -0,0 +1,37 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from typing import Iterable
+
+
+# Champs lus par la transformation (Connector.export_order_row, export_product, _get_order_vat...) : ajouter ici
+# tout nouveau champ utilise, sinon il arrive vide. Webservice._get_projected verifie que la reponse les contient tous.
+ADDRESS_FIELDS = ('id', 'id_country', 'lastname', 'firstname', 'vat_number', 'address1', 'address2', 'postcode',
+                  'city', 'phone', 'phone_mobile')
+PRODUCT_FIELDS = ('id', 'price', 'wholesale_price', 'ean13', 'name')
+
+
+def display(fields: Iterable[str]) -> str:
+    """ :return: the `display` parameter of a Prestashop list call returning only these fields """
+    return '[' + ','.join(fields) + ']'
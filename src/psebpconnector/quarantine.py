@@ -0,0 +1,82 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+
+from pathlib import Path
+from psebpconnector.json_store import JsonOrderStore
+from psebpconnector.models import Order
+from typing import Any, Dict, Optional, Sequence
+
+
+class Quarantine(JsonOrderStore):
+    """
+    Orders rejected by the transformation (`InvalidOrder`), persisted in a JSON file: they are skipped by the next
+    runs, right from the orders list (no order fetch), and retried on an exponential backoff schedule. An order is
+    retried right away once it changed in Prestashop (`date_upd`) or the mapping files changed.
+    """
+
+    def __init__(self, path: Path, base_delay: float = 3600, max_delay: float = 7 * 86400):
+        """
+        :param base_delay: seconds before the first retry, doubled after each new failure
+        :param max_delay: maximum number of seconds between two retries
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        super().__init__(path)
+
+    def entry(self, order_id: int, is_refund: bool) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._entries.get(self._key(order_id, is_refund))
+
+    def _load_failed(self, error: Exception):
+        self.logger.warning(f"Ignoring quarantine file {self.path} - {error}")
+
+    def add(self, order: Order, cause: str, mappings_signature: Sequence, now: Optional[float] = None):
+        """ Quarantine a rejected order, or push back its next retry if it already was """
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.get(self._key(order.id, order.is_refund), {'failures': 0, 'first_failure': now})
+            entry.update(order_id=order.id,
+                         is_refund=order.is_refund,
+                         cause=cause,
+                         date_upd=order.date_upd,
+                         mappings_signature=list(mappings_signature),
+                         failures=entry['failures'] + 1,
+                         last_failure=now)
+            entry['retry_at'] = now + min(self.base_delay * 2 ** (entry['failures'] - 1), self.max_delay)
+            self._entries[self._key(order.id, order.is_refund)] = entry
+
+    def remove(self, order: Order):
+        with self._lock:
+            self._entries.pop(self._key(order.id, order.is_refund), None)
+
+    def should_skip(self, order_id: int, is_refund: bool, date_upd: str, mappings_signature: Sequence,
+                    now: Optional[float] = None) -> bool:
+        """ :return: True if the order is quarantined, unchanged since, and its retry is not due yet """
+        entry = self.entry(order_id, is_refund)
+        return (entry is not None
+                and entry['date_upd'] == date_upd
+                and entry['mappings_signature'] == list(mappings_signature)
+                and (now or time.time()) < entry['retry_at'])
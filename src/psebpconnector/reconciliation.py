@@ -0,0 +1,131 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import io
+import re
+import time
+import zipfile
+
+from pathlib import Path
+from psebpconnector.csv_writer import parse_rows
+from psebpconnector.export_models import DOCUMENT_NUMBER_COLUMN
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+# Fichiers d'un run confrontes au registre : CSV des commandes et log de son import, par chunk le cas echeant
+RUN_IMPORT_FILE_PATTERN = r'^(orders|ebp_import_orders_logs)_{run_id}(_chunk\d+)?\.(?:csv|txt)$'
+
+# Un log d'import absent ou incomplet peut etre celui d'un import encore en cours : on attend avant de conclure
+IMPORT_FAILED_GRACE_PERIOD = 86400
+
+
+def parse_import_log(log: str) -> Optional[Set[str]]:
+    """ :return: the numbers of the documents rejected by an EBP import, None when its log is incomplete """
+    if not re.search(r'\d+/\d+', log):
+        return None
+    return set(re.findall(r'Le document (\d+) ne sera pas import', log))
+
+
+class LedgerReconciliation:
+    """
+    Settle the documents left with the 'exported' status in the ledger by a run interrupted between the EBP import
+    and the update of the statuses, from the import logs of the run found in the working directory or in its archive.
+    """
+
+    def __init__(self, ledger, working_directory: Path, artefacts=None):
+        """
+        :param ledger: `ExportLedger`
+        :param artefacts: `ArtefactManager`, to read the files of the runs already archived
+        """
+        self.ledger = ledger
+        self.working_directory = working_directory
+        self.artefacts = artefacts
+
+    def run(self, exclude: Iterable[str] = (), now: Optional[float] = None) -> Dict[str, list]:
+        """
+        :param exclude: runs in progress
+        :return: the ledger entries settled, by new status
+        """
+        now = now or time.time()
+        settled = {}
+        for run_id in self.ledger.unsettled_runs():
+            if run_id in exclude:
+                continue
+            statuses = self.import_statuses(run_id)
+            for entry in self.ledger.run(run_id):
+                if entry.status != self.ledger.EXPORTED:
+                    continue
+                status = statuses.get(entry.document_number, self.ledger.IMPORT_FAILED)
+                if status == self.ledger.IMPORT_FAILED and now - entry.updated_at < IMPORT_FAILED_GRACE_PERIOD:
+                    continue
+                self.ledger.set_status(entry.order_id, entry.is_refund, status, run_id)
+                settled.setdefault(status, []).append(entry)
+        return settled
+
+    def import_statuses(self, run_id: str) -> Dict[str, str]:
+        """ :return: the import status of the documents of a run according to its EBP import logs, by number """
+        files = self._read_run_files(run_id)
+        statuses = {}
+        for (kind, chunk), log in files.items():
+            if kind != 'ebp_import_orders_logs' or ('orders', chunk) not in files:
+                continue
+            rejected = parse_import_log(log)
+            for row in parse_rows(io.StringIO(files[('orders', chunk)], newline='')):
+                if len(row) <= DOCUMENT_NUMBER_COLUMN:
+                    continue
+                document_number = row[DOCUMENT_NUMBER_COLUMN]
+                if rejected is None:
+                    statuses[document_number] = self.ledger.IMPORT_FAILED
+                elif document_number in rejected:
+                    statuses[document_number] = self.ledger.REJECTED
+                else:
+                    statuses[document_number] = self.ledger.IMPORTED
+        return statuses
+
+    def _read_run_files(self, run_id: str) -> Dict[Tuple[str, str], str]:
+        """ :return: the content of the orders CSV files and import logs of a run, by (kind, chunk suffix) """
+        pattern = re.compile(RUN_IMPORT_FILE_PATTERN.format(run_id=re.escape(run_id)))
+        files = {}
+        for path in self.working_directory.iterdir():
+            match = pattern.match(path.name)
+            if match and path.is_file():
+                files[match.group(1), match.group(2) or ''] = path.read_text(encoding='utf-8-sig', errors='ignore')
+        if files or not self.artefacts:
+            return files
+
+        # Run deja archive par le balayage du repertoire de travail
+        try:
+            archive = self.artefacts.archive_path(float(run_id))
+        except ValueError:
+            return files
+        if not archive.is_file():
+            return files
+        with zipfile.ZipFile(archive) as zip_file:
+            for name in zip_file.namelist():
+                directory, _, filename = name.partition('/')
+                match = pattern.match(filename)
+                if directory == run_id and match:
+                    files[match.group(1), match.group(2) or ''] = zip_file.read(name).decode('utf-8-sig',
+                                                                                           errors='ignore')
+        return files
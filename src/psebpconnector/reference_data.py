@@ -0,0 +1,174 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from pathlib import Path
+from psebpconnector.exceptions import BadHTTPCode
+from psebpconnector.webservice import Webservice
+from requests import RequestException
+from typing import Dict, Optional, Tuple
+
+
+class ReferenceData:
+    """
+    Countries and currencies ISO codes by Prestashop ID, persisted in a snapshot file so a run starts without waiting
+    for the webservice: the snapshot is loaded at startup and refreshed in the background once expired. An ID missing
+    from the snapshot (a country activated since) is looked up on its own, an ID that cannot be looked up is not
+    looked up again for `missing_ttl` seconds.
+
+    A refresh replaces the `countries` and `currencies` dicts, so the deactivated entries disappear: read them
+    through this object, not through a copy of the reference.
+    """
+
+    def __init__(self, webservice: Webservice, path: Path, ttl: int, missing_ttl: float = 600):
+        """
+        :param path: snapshot file
+        :param ttl: lifetime of the snapshot in seconds, 0 disables the snapshot
+        :param missing_ttl: seconds during which an unknown ID is not looked up again
+        """
+        self.webservice = webservice
+        self.path = path
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.countries: Dict[int, str] = {}
+        self.currencies: Dict[int, str] = {}
+        self.fetched_at = 0.0
+        # Cache negatif : (type, ID) introuvable -> instant (time.monotonic) de la prochaine recherche possible
+        self._missing: Dict[Tuple[str, int], float] = {}
+        self.logger = logging.getLogger('ps_ebp_connector')
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.countries and self.currencies)
+
+    @property
+    def expired(self) -> bool:
+        return not self.ttl or time.time() - self.fetched_at >= self.ttl
+
+    def load(self) -> bool:
+        """ Load the snapshot, returns False when there is no usable snapshot """
+        if not self.ttl or not self.path.is_file():
+            return False
+        try:
+            snapshot = json.loads(self.path.read_text(encoding='utf-8'))
+            if snapshot['url'] != self.webservice.url:
+                return False
+            countries = {int(key): value for key, value in snapshot['countries'].items()}
+            currencies = {int(key): value for key, value in snapshot['currencies'].items()}
+            fetched_at = float(snapshot['fetched_at'])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.warning(f"Ignoring reference data snapshot {self.path} - {e}")
+            return False
+        with self._lock:
+            self.countries = countries
+            self.currencies = currencies
+            self.fetched_at = fetched_at
+        return self.loaded
+
+    def save(self):
+        if not self.ttl:
+            return
+        with self._lock:
+            snapshot = {'url': self.webservice.url, 'fetched_at': self.fetched_at,
+                        'countries': self.countries, 'currencies': self.currencies}
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            tmp_path.write_text(json.dumps(snapshot, indent=2), encoding='utf-8')
+            os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """ Fetch all the active countries and currencies, replacing the previous ones, and update the snapshot """
+        countries = self.webservice.get_countries_iso_code()
+        currencies = self.webservice.get_currencies_iso_code()
+        with self._lock:
+            self.countries = countries
+            self.currencies = currencies
+            self._missing.clear()
+            self.fetched_at = time.time()
+        try:
+            self.save()
+        except OSError as e:
+            self.logger.warning(f"Unable to write reference data snapshot {self.path} - {e}")
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+            self.logger.debug('Reference data refreshed in the background')
+        except (BadHTTPCode, RequestException, ValueError, KeyError) as e:
+            self.logger.warning(f"Unable to refresh reference data, keeping the snapshot of "
+                                f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.fetched_at))} - {e}")
+
+    def refresh_in_background(self) -> threading.Thread:
+        if self._refresh_thread is None or not self._refresh_thread.is_alive():
+            self._refresh_thread = threading.Thread(target=self._refresh_quietly, daemon=True,
+                                                    name='reference-data-refresh')
+            self._refresh_thread.start()
+        return self._refresh_thread
+
+    def ensure_loaded(self):
+        """ Make the reference data available: from the snapshot, refreshed in the background if expired, or from the
+            webservice when there is no snapshot yet. """
+        if not self.loaded:
+            if self.load():
+                self.logger.debug(f"Reference data loaded from {self.path}")
+            else:
+                self.refresh()
+                return
+        if self.expired:
+            self.refresh_in_background()
+
+    def _lookup(self, kind: str, object_id: int, fetch) -> Optional[str]:
+        codes = self.countries if kind == 'country' else self.currencies
+        if object_id in codes:
+            return codes[object_id]
+        if time.monotonic() < self._missing.get((kind, object_id), 0.0):
+            return None
+        try:
+            iso_code = fetch(object_id)
+        except (BadHTTPCode, RequestException, ValueError, KeyError) as e:
+            self.logger.debug(f"Unable to look up {kind} {object_id} - {e}")
+            with self._lock:
+                self._missing[(kind, object_id)] = time.monotonic() + self.missing_ttl
+            return None
+        with self._lock:
+            (self.countries if kind == 'country' else self.currencies)[object_id] = iso_code
+        try:
+            self.save()
+        except OSError as e:
+            self.logger.warning(f"Unable to write reference data snapshot {self.path} - {e}")
+        return iso_code
+
+    def country_iso_code(self, country_id: int) -> Optional[str]:
+        """ :return: the ISO code of the country, looked up if unknown, None if it does not exist """
+        return self._lookup('country', country_id, self.webservice.get_country_iso_code)
+
+    def currency_iso_code(self, currency_id: int) -> Optional[str]:
+        """ :return: the ISO code of the currency, looked up if unknown, None if it does not exist """
+        return self._lookup('currency', currency_id, self.webservice.get_currency_iso_code)
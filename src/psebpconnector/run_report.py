@@ -0,0 +1,205 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class EndpointStatistics:
+    count: int = 0
+    errors: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    bytes_received: int = 0
+    bytes_decoded: int = 0
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def add(self, duration: float, error: bool, bytes_received: int = 0, bytes_decoded: int = 0):
+        self.count += 1
+        self.errors += int(error)
+        self.total_time += duration
+        self.bytes_received += bytes_received
+        self.bytes_decoded += bytes_decoded
+        self.max_time = max(self.max_time, duration)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def merge(self, other: 'EndpointStatistics'):
+        self.count += other.count
+        self.errors += other.errors
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.bytes_received += other.bytes_received
+        self.bytes_decoded += other.bytes_decoded
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_time': self.total_time,
+            'mean_time': self.total_time / self.count if self.count else 0.0,
+            'max_time': self.max_time,
+            'bytes_received': self.bytes_received,
+            'bytes_decoded': self.bytes_decoded,
+            'histogram': {**{f"le_{bound}": n for bound, n in zip(LATENCY_BUCKETS, self.buckets)},
+                          'le_inf': self.buckets[-1]},
+        }
+
+
+class RunReport:
+    """ Timings and counters of a connector run, written as JSON next to the logs file """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.peaks: Dict[str, float] = {}
+        self.rejections: Dict[str, int] = {}
+        self.endpoints: Dict[str, EndpointStatistics] = {}
+        self.http_time = 0.0
+        self.outcome: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """ Time a phase of the run, the durations of phases run several times are summed up """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, duration: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_rejection(self, cause: str):
+        """ Count an order rejected before its export, by cause (see `InvalidOrder.cause`) """
+        with self._lock:
+            self.rejections[cause] = self.rejections.get(cause, 0) + 1
+
+    def record_peak(self, name: str, value: float):
+        """ Keep the highest value of a measure, such as the filling of a queue """
+        with self._lock:
+            self.peaks[name] = max(self.peaks.get(name, value), value)
+
+    def record_request(self, method: str, endpoint: str, status_code: Optional[int], duration: float,
+                       bytes_received: int = 0, bytes_decoded: int = 0):
+        """
+        :param status_code: HTTP status code of the response, None if no response was received
+        :param bytes_received: size of the response body as transferred, compressed when negotiated
+        :param bytes_decoded: size of the response body once decompressed
+        """
+        error = status_code is None or status_code >= 400
+        with self._lock:
+            self.http_time += duration
+            self.endpoints.setdefault(f"{method.upper()} {endpoint}", EndpointStatistics()).add(
+                duration, error, bytes_received, bytes_decoded)
+
+    def merge(self, other: 'RunReport', phase_prefix: str = ''):
+        """ Add the counters, requests and phase durations of another report, for example the report of a worker
+
+        :param phase_prefix: prefix of the merged phase names, so they are not mixed up with the phases of this run
+        """
+        with self._lock:
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for cause, value in other.rejections.items():
+                self.rejections[cause] = self.rejections.get(cause, 0) + value
+            for name, value in other.peaks.items():
+                self.peaks[name] = max(self.peaks.get(name, value), value)
+            for name, duration in other.phases.items():
+                self.phases[phase_prefix + name] = self.phases.get(phase_prefix + name, 0.0) + duration
+            for name, stats in other.endpoints.items():
+                self.endpoints.setdefault(name, EndpointStatistics()).merge(stats)
+            self.http_time += other.http_time
+
+    def __getstate__(self):
+        # Les rapports des workers (export partitionne) sont renvoyes au processus principal par pickle
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def rate(self, counter: str, phase: str) -> float:
+        """ :return: the number of `counter` per second of `phase` """
+        duration = self.phases.get(phase, 0.0)
+        return self.counters.get(counter, 0) / duration if duration else 0.0
+
+    def snapshot(self) -> Tuple[Dict[str, int], Dict[str, EndpointStatistics]]:
+        """ :return: a copy of the counters and of the statistics per endpoint, safe to use while the run goes on """
+        with self._lock:
+            endpoints = {}
+            for name, stats in self.endpoints.items():
+                endpoints[name] = EndpointStatistics()
+                endpoints[name].merge(stats)
+            return dict(self.counters), endpoints
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'duration': time.time() - self.started_at,
+                'phases': dict(self.phases),
+                'counters': dict(self.counters),
+                'rejections': dict(sorted(self.rejections.items(), key=lambda item: -item[1])),
+                'peaks': dict(self.peaks),
+                'rates': {
+                    'orders_per_second': self.rate('orders_processed', 'export'),
+                    'rows_per_second': self.rate('rows_exported', 'export'),
+                },
+                'http': {
+                    'requests': sum(stats.count for stats in self.endpoints.values()),
+                    'total_time': self.http_time,
+                    'bytes_received': sum(stats.bytes_received for stats in self.endpoints.values()),
+                    'bytes_decoded': sum(stats.bytes_decoded for stats in self.endpoints.values()),
+                    'endpoints': {name: stats.to_dict() for name, stats in sorted(self.endpoints.items())},
+                },
+                'outcome': dict(self.outcome),
+            }
+
+    def write(self, path: Path):
+        path.write_text(json.dumps(self.to_dict(), indent=2), encoding='utf-8')
@@ -0,0 +1,198 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import math
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from psebpconnector.connector import Connector
+from psebpconnector.csv_writer import read_rows
+from psebpconnector.export_models import DOCUMENT_NUMBER_COLUMN
+from psebpconnector.models import Order
+from psebpconnector.quarantine import Quarantine
+from psebpconnector.run_report import RunReport
+from psebpconnector.writeback_outbox import WritebackOutbox
+from typing import List, Optional, Sequence, Tuple
+
+
+def split_id_range(first: int, last: int, shards: int) -> List[Tuple[int, int]]:
+    """ Split [first, last] into at most `shards` contiguous intervals of the same size, bounds included """
+    size = max(1, math.ceil((last - first + 1) / shards))
+    return [(start, min(start + size - 1, last)) for start in range(first, last + 1, size)]
+
+
+@dataclass
+class ShardResult:
+    index: int
+    id_range: Tuple[int, int]
+    products_path: Path
+    # IDs des articles exportes, dans l'ordre des lignes de products_path
+    product_ids: List[int]
+    orders_path: Path
+    logs_path: Path
+    pending_orders: List[Order]
+    rejected_orders: List[Tuple[Order, str]]
+    report: RunReport
+    errors_logged: bool
+
+
+class ShardQuarantine(Quarantine):
+    """ Quarantine of the main process as seen by a worker: used to skip the quarantined orders, but never saved,
+        the rejections are returned to the main process which records them """
+
+    def __init__(self, path: Path, base_delay: float, max_delay: float):
+        super().__init__(path, base_delay, max_delay)
+        self.rejected_orders: List[Tuple[Order, str]] = []
+
+    def add(self, order: Order, cause: str, mappings_signature: Sequence, now: Optional[float] = None):
+        super().add(order, cause, mappings_signature, now)
+        self.rejected_orders.append((order, cause))
+
+    def save(self):
+        pass
+
+
+def export_shard(config_path: Path, working_directory: Path, index: int, id_range: Tuple[int, int], run_id: str,
+                 writeback_outbox_path: Optional[Path] = None, ledger_path: Optional[Path] = None,
+                 quarantine_path: Optional[Path] = None) -> ShardResult:
+    """ Worker process: export the orders of an ID interval in partial CSV files of its own working directory
+
+    :param run_id: run of the main process, under which the exported documents are recorded in the ledger
+    :param writeback_outbox_path: writeback outbox of the main process, its orders are not exported again
+    :param ledger_path: ledger of the main process
+    :param quarantine_path: quarantine of the main process, its orders are skipped
+    """
+    connector = Connector(config_path, name=f"shard{index}", working_directory=working_directory,
+                          ledger_path=ledger_path)
+    connector.run_id = run_id
+    if writeback_outbox_path:
+        connector.writeback_outbox = WritebackOutbox(writeback_outbox_path)
+    # Le processus principal se charge des mails et des metriques
+    connector.mailer = None
+    connector.metrics_exporter = None
+    # La quarantaine est mise a jour par le processus principal seulement (fichier JSON non partage)
+    if connector.quarantine:
+        connector.quarantine = ShardQuarantine(quarantine_path or connector.quarantine.path,
+                                               connector.quarantine.base_delay, connector.quarantine.max_delay)
+    if connector.webservice.cassette and connector.webservice.cassette.recording:
+        # Un seul processus ecrit la cassette : les requetes des workers ne sont pas enregistrees
+        connector.webservice.cassette.close()
+        connector.webservice.cassette = None
+    connector.warm_up()
+    connector.export_orders_and_products(id_range=id_range)
+    connector._close_csv_files()
+    connector._logs_file_handler.close()
+    if connector.ledger:
+        connector.ledger.close()
+    return ShardResult(index=index,
+                       id_range=id_range,
+                       products_path=connector._csv_products_path,
+                       product_ids=list(connector.exported_products),
+                       orders_path=connector._csv_orders_path,
+                       logs_path=connector._logs_file_path,
+                       pending_orders=connector.pending_orders,
+                       rejected_orders=connector.quarantine.rejected_orders if connector.quarantine else [],
+                       report=connector.report,
+                       errors_logged=connector.errors_logged())
+
+
+class ShardedExport:
+    """
+    Export of large backlogs (re-export of a fiscal year...): the order ID space is split into intervals exported in
+    parallel by worker processes, each one writing its own partial CSV files. The partial files are then merged in
+    the CSV files of the connector run, ready for `Connector.import_files`: articles are deduplicated and the rows of
+    an order are kept grouped, orders first then refunds, sorted by order ID.
+
+    The `order_limit` option applies to each shard.
+    """
+
+    def __init__(self, connector: Connector, shards: int):
+        self.connector = connector
+        self.shards = shards
+        self.directory = connector.config.working_directory / f"shards_{connector._startup_time}"
+
+    def run(self):
+        connector = self.connector
+        bounds = connector.webservice.get_order_id_range()
+        if bounds is None:
+            connector.logger.info("No order to export")
+            return
+        id_ranges = split_id_range(bounds[0], bounds[1], self.shards)
+        connector.logger.info(f"Exporting orders {bounds[0]} to {bounds[1]} in {len(id_ranges)} shards")
+        for index in range(len(id_ranges)):
+            (self.directory / f"shard{index}").mkdir(parents=True, exist_ok=True)
+
+        with ProcessPoolExecutor(max_workers=len(id_ranges)) as executor:
+            futures = [executor.submit(export_shard, connector.config_path, self.directory / f"shard{index}",
+                                       index, id_range, connector.run_id, connector.writeback_outbox.path,
+                                       connector.config.ledger_path, connector.config.quarantine_path)
+                       for index, id_range in enumerate(id_ranges)]
+            results = [future.result() for future in futures]
+
+        for result in results:
+            connector.report.merge(result.report, phase_prefix='shards.')
+            if result.errors_logged:
+                connector.logger.warning(f"Shard {result.index} (orders {result.id_range[0]} to "
+                                         f"{result.id_range[1]}): errors logged, see {result.logs_path}")
+        if connector.quarantine:
+            self.update_quarantine(results)
+        with connector.report.phase('merge'):
+            self.merge(results)
+
+    def update_quarantine(self, results: List[ShardResult]):
+        """ Record the orders rejected by the workers in the quarantine, and release the exported ones """
+        quarantine = self.connector.quarantine
+        for result in results:
+            for order in result.pending_orders:
+                quarantine.remove(order)
+            for order, cause in result.rejected_orders:
+                quarantine.add(order, cause, self.connector._mappings_signature)
+        quarantine.save()
+
+    def merge(self, results: List[ShardResult]):
+        connector = self.connector
+        # Un article exporte par plusieurs workers n'est ecrit qu'une fois, d'apres son ID (le code EAN13 peut
+        # etre vide ou partage par plusieurs articles)
+        written_products = set()
+        for result in results:
+            for product_id, row in zip(result.product_ids, read_rows(result.products_path)):
+                if product_id not in written_products:
+                    written_products.add(product_id)
+                    connector.csv_products.writerow(row)
+
+        order_keys = {}
+        for result in results:
+            for order in result.pending_orders:
+                order_keys[f"{order.id}11" if order.is_refund else f"{order.id}"] = (order.is_refund, order.id)
+                connector.pending_orders.append(order)
+        connector.pending_orders.sort(key=lambda order: (order.is_refund, order.id))
+
+        documents = {}
+        for result in results:
+            for row in read_rows(result.orders_path):
+                documents.setdefault(row[DOCUMENT_NUMBER_COLUMN], []).append(row)
+        for document_number in sorted(documents, key=lambda number: order_keys.get(number, (True, int(number)))):
+            for row in documents[document_number]:
+                connector.csv_orders.writerow(row)
@@ -0,0 +1,72 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import threading
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+
+class MappingCache:
+    """ Parsed mapping files shared between the connectors of a process, keyed by paths and modification times:
+        mapping files used by several shops are parsed once, and parsed again only once they changed. """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[Path, ...], Tuple[tuple, Any]] = {}
+        self._locks: Dict[Tuple[Path, ...], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.parse_count = 0
+
+    def get(self, paths: Sequence[Path], parse: Callable[[], Any]) -> Any:
+        """
+        :param paths: the files parsed by `parse`
+        :param parse: called to parse the files when they are not cached yet or changed since they were parsed
+        :return: the parsed mapping, shared between the callers: it must not be modified
+        """
+        key = tuple(Path(path).resolve() for path in paths)
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        # Verrou par fichier : deux boutiques qui demarrent en meme temps ne parsent pas deux fois les memes fichiers
+        with key_lock:
+            signature = tuple((path.stat().st_mtime_ns, path.stat().st_size) for path in key)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                entry = (signature, parse())
+                self._entries[key] = entry
+                self.parse_count += 1
+            return entry[1]
+
+
+class DatabaseLocks:
+    """ One lock per EBP database, so that the imports of the shops sharing a database are serialized """
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def lock(self, database_path: Path) -> threading.Lock:
+        key = os.path.normcase(os.path.abspath(database_path))
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
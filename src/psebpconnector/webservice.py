@@ -23,33 +23,53 @@ SOFTWARE.
 """
 
 
+import queue
+import threading
+import time
+
 from datetime import datetime
 from psebpconnector.exceptions import BadHTTPCode
 from psebpconnector.models import *
+from psebpconnector.projections import ADDRESS_FIELDS, PRODUCT_FIELDS, display
+from psebpconnector.run_report import RunReport
 from requests import Response, Session
 from requests.auth import HTTPBasicAuth
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urlencode
 
+if TYPE_CHECKING:
+    from psebpconnector.cassette import Cassette
+
+
+# Fin d'un scan de get_orders_to_export
+_SCAN_DONE = object()
+
 
 class Webservice:
     _PAGINATION_SIZE = 10
+    _FULL_PAGINATION_SIZE = 100
     _MAX_CALLS = 1000
+    # Commandes completes d'avance par scan : une page de liste, la memoire reste bornee sur les gros backlogs
+    _SCAN_QUEUE_SIZE = 10
 
-    def __init__(self, url: str, apikey: str):
+    def __init__(self, url: str, apikey: str, report: Optional[RunReport] = None, language_id: int = 1):
         """
         :param url: The base URL for the API endpoint.
         :param apikey: The API key used for authenticating requests.
+        :param report: Optional run report collecting requests counts, latencies and sizes per endpoint.
+        :param language_id: The only language requested for the multilingual fields (product names).
         """
         self.url = url.rstrip('/')
         self.apikey = apikey
-
-        self._session = Session()
-        self._session.auth = self._build_credentials()
-        self._session.headers = {
-            'Content-Type': 'application/json',
-            'Io-Format': 'JSON',
-        }
+        self.report = report
+        self.language_id = language_id
+        # Called after every request with (method, endpoint, url, status_code, start timestamp, duration)
+        self.request_listeners: List[Callable] = []
+        # Enregistrement ou rejeu des requetes, voir Cassette
+        self.cassette: Optional['Cassette'] = None
+        # Temps HTTP et session par thread : les scans de get_orders_to_export tournent en parallele du thread
+        # principal, et une Session requests n'est pas thread-safe
+        self._thread_state = threading.local()
 
         self.order_error_counter = 0
         self.refund_error_counter = 0
@@ -57,6 +77,28 @@ class Webservice:
     def _build_credentials(self) -> HTTPBasicAuth:
         return HTTPBasicAuth(self.apikey, '')
 
+    @property
+    def _session(self) -> Session:
+        """ :return: the session of the calling thread, created on its first request """
+        session = getattr(self._thread_state, 'session', None)
+        if session is None:
+            session = Session()
+            session.auth = self._build_credentials()
+            # update et non remplacement : on garde Accept-Encoding: gzip, deflate des en-tetes par defaut
+            session.headers.update({
+                'Content-Type': 'application/json',
+                'Io-Format': 'JSON',
+            })
+            self._thread_state.session = session
+        return session
+
+    def _close_thread_session(self):
+        """ Close the session of the calling thread, at the end of a short-lived thread (orders scan) """
+        session = getattr(self._thread_state, 'session', None)
+        if session is not None:
+            session.close()
+            self._thread_state.session = None
+
     def _build_url(self, endpoint: str, params: Optional[Dict[str, str]] = None):
         url = f"{self.url}/{endpoint}"
         if params:
@@ -68,13 +110,42 @@ class Webservice:
                      expected_result_codes: List[int] = [200],
                      method: str = 'get',
                      data: Optional[dict] = None) -> Response:
-        result = getattr(self._session, method)(url, data=data)
+        start_timestamp, start = time.time(), time.perf_counter()
+        status_code = None
+        bytes_received = bytes_decoded = 0
+        try:
+            if self.cassette and self.cassette.replaying:
+                result = self.cassette.replay(method, url[len(self.url):], data)
+            else:
+                result = getattr(self._session, method)(url, data=data)
+                if self.cassette:
+                    self.cassette.record(method, url[len(self.url):], data, result, time.perf_counter() - start)
+            status_code = result.status_code
+            # Octets recus sur le reseau (compresses) et apres decompression
+            bytes_decoded = len(result.content)
+            bytes_received = result.raw.tell() if result.raw is not None else bytes_decoded
+        finally:
+            duration = time.perf_counter() - start
+            self._thread_state.http_time = self.thread_http_time() + duration
+            if self.report:
+                self.report.record_request(method, self._endpoint(url), status_code, duration,
+                                           bytes_received, bytes_decoded)
+            for listener in self.request_listeners:
+                listener(method, self._endpoint(url), url, status_code, start_timestamp, duration)
 
         if result.status_code not in expected_result_codes:
             raise BadHTTPCode(f"{method.upper()} {url}: Bad HTTP status code {result.status_code}\n{result.text}")
 
         return result
 
+    def thread_http_time(self) -> float:
+        """ :return: the time spent in requests by the calling thread """
+        return getattr(self._thread_state, 'http_time', 0.0)
+
+    def _endpoint(self, url: str) -> str:
+        """ :return: the resource targeted by the URL (orders, addresses...), without IDs nor parameters """
+        return url[len(self.url):].lstrip('/').split('?')[0].split('/')[0] or 'root'
+
     def _set_order_exported_field(self, order: Order, field_value: int):
         order_printed = self.get_order_printed(order.id)
 
@@ -89,9 +160,29 @@ class Webservice:
 
         self._do_api_call(self._build_url(f"orders_printed/{order_printed.id_order}"), method='patch', data=patch_xml)
 
+    def _get_projected(self, endpoint: str, name: str, resource_id: int, fields: Iterable[str],
+                       params: Optional[Dict[str, str]] = None) -> dict:
+        """ Fetch only some fields of a resource, through the list call: `display` is ignored on a single resource
+
+        :param name: name of the resource in the response of a direct call (address for addresses)
+        :raise BadHTTPCode: when the resource does not exist (direct call answering 404)
+        :raise ValueError: when a field of the projection is missing from the response, it would be exported empty
+        """
+        url = self._build_url(endpoint, {'filter[id]': f"[{resource_id}]", 'display': display(fields), **(params or {})})
+        resources = self._do_api_call(url).json()
+        if resources and resources.get(endpoint):
+            resource = resources[endpoint][0]
+        else:
+            # Une ressource absente du listing (adresse supprimee logiquement, produit hors de la boutique...) peut
+            # rester accessible en direct : appel complet, qui leve BadHTTPCode si elle n'existe vraiment pas
+            resource = self._do_api_call(self._build_url(f"{endpoint}/{resource_id}", params)).json()[name]
+        missing = [field for field in fields if field not in resource]
+        if missing:
+            raise ValueError(f"GET {url}: {endpoint} {resource_id} without the fields {', '.join(missing)}")
+        return resource
+
     def get_address(self, address_id: int) -> Address:
-        result = self._do_api_call(self._build_url(f"addresses/{address_id}"))
-        return Address.from_dict(result.json()['address'])
+        return Address.from_dict(self._get_projected('addresses', 'address', address_id, ADDRESS_FIELDS))
 
     def get_countries_iso_code(self) -> Dict[int, str]:
         result = self._do_api_call(self._build_url('countries', {
@@ -100,6 +191,14 @@ class Webservice:
         }))
         return {int(country['id']): country['iso_code'] for country in result.json()['countries']}
 
+    def get_country_iso_code(self, country_id: int) -> str:
+        result = self._do_api_call(self._build_url(f"countries/{country_id}"))
+        return result.json()['country']['iso_code']
+
+    def get_currency_iso_code(self, currency_id: int) -> str:
+        result = self._do_api_call(self._build_url(f"currencies/{currency_id}"))
+        return result.json()['currency']['iso_code']
+
     def get_currencies_iso_code(self) -> Dict[int, str]:
         result = self._do_api_call(self._build_url('currencies', {
             'filter[active]': '1',
@@ -127,43 +226,152 @@ class Webservice:
         result = self._do_api_call(self._build_url(f"orders_printed/{id_order_printed}"))
         return OrderPrinted(**result.json()['order_printed'])
 
-    def get_orders_to_export(self, valid_orders_status: List[str], refund_orders_status: List[str]):
+    def get_orders_to_export(self,
+                             valid_orders_status: List[str],
+                             refund_orders_status: List[str],
+                             order_ids: Optional[List[int]] = None,
+                             id_range: Optional[Tuple[int, int]] = None,
+                             skip: Optional[Callable[[int, bool, str], bool]] = None):
         """
         Fetches a list of orders that have been marked as printed but not yet exported, in a paginated manner.
 
+        The orders to export (exported=0, valid status) and the refunds (exported=1, refund status) cannot be
+        fetched with a single filter, Prestashop filters are all combined with AND: the two scans run concurrently in
+        threads, each one queuing up to `_SCAN_QUEUE_SIZE` orders ahead of the caller. The orders are still yielded
+        first, then the refunds. Closing the generator stops the scans.
+
+        :param order_ids: Only consider these orders (event-driven micro-batches), still filtered on status and
+            exported flag so an order notified twice or not ready yet is not exported.
+        :param id_range: Only consider the orders whose ID is in this interval, bounds included (sharded export).
+        :param skip: Called with the order ID, the refund flag and the `date_upd` of each listed order: the order is
+            not fetched when it returns True (quarantined orders).
         :return: A generator yielding orders that need to be exported
         """
+        scans = [(refund_phase, statuses, exported_value)
+                 for refund_phase, statuses, exported_value in ((False, valid_orders_status, '0'),
+                                                                (True, refund_orders_status, '1'))
+                 if statuses]
+        stop = threading.Event()
+        queues = [queue.Queue(self._SCAN_QUEUE_SIZE) for _ in scans]
+        threads = [threading.Thread(target=self._scan_orders_into,
+                                    args=(*scan, order_ids, id_range, skip, scan_queue, stop),
+                                    name=f"scan-{'refunds' if scan[0] else 'orders'}", daemon=True)
+                   for scan, scan_queue in zip(scans, queues)]
+        for thread in threads:
+            thread.start()
+        try:
+            for scan_queue in queues:
+                while True:
+                    item = scan_queue.get()
+                    if item is _SCAN_DONE:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield item
+        finally:
+            # Arret anticipe (order_limit, erreur) : les scans s'arretent a la prochaine commande
+            stop.set()
+
+    def _scan_orders_into(self, refund_phase: bool, statuses: List[str], exported_value: str,
+                          order_ids: Optional[List[int]], id_range: Optional[Tuple[int, int]],
+                          skip: Optional[Callable[[int, bool, str], bool]],
+                          scan_queue: queue.Queue, stop: threading.Event):
+        """ Scan thread of `get_orders_to_export`: queue the orders, then `_SCAN_DONE` or the raised exception """
+        try:
+            for order in self._scan_orders(refund_phase, statuses, exported_value, order_ids, id_range, skip):
+                if not self._put_scanned(scan_queue, order, stop):
+                    return
+            self._put_scanned(scan_queue, _SCAN_DONE, stop)
+        except Exception as e:
+            self._put_scanned(scan_queue, e, stop)
+        finally:
+            self._close_thread_session()
+
+    @staticmethod
+    def _put_scanned(scan_queue: queue.Queue, item, stop: threading.Event) -> bool:
+        """ :return: False if the scan was stopped while waiting for room in the queue """
+        while not stop.is_set():
+            try:
+                scan_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _scan_orders(self, refund_phase: bool, statuses: List[str], exported_value: str,
+                     order_ids: Optional[List[int]], id_range: Optional[Tuple[int, int]],
+                     skip: Optional[Callable[[int, bool, str], bool]] = None) -> Iterator[Order]:
+        # Offset REEL : on avance du nombre de commandes deja lues. Ne PAS se baser
+        # sur le filtre exported pour faire avancer la fenetre : le marquage est
+        # differe apres l'import EBP (cf. Connector.mark_exported_orders), donc le
+        # filtre ne bouge pas pendant le run. Un offset fige -> memes commandes
+        # re-servies en boucle -> doublons / produits x N en EBP.
+        offset = 0
+        for _ in range(self._MAX_CALLS):
+            params = {
+                'filter[orders_printed][exported]': exported_value,
+                'filter[current_state]': '[' + '|'.join(statuses) + ']',
+                'sort': '[id_ASC]',
+                'limit': f"{offset},{self._PAGINATION_SIZE}"
+            }
+            if order_ids is not None:
+                params['filter[id]'] = '[' + '|'.join(str(order_id) for order_id in order_ids) + ']'
+            elif id_range is not None:
+                params['filter[id]'] = f"[{id_range[0]},{id_range[1]}]"
+            if skip is not None:
+                params['display'] = '[id,date_upd]'
+            result = self._do_api_call(self._build_url('orders_with_printed', params))
+            orders_list = result.json()
+            if not orders_list or not orders_list.get('orders'):
+                break
+            orders = orders_list['orders']
+            for order_entry in orders:
+                if skip is not None and skip(int(order_entry['id']), refund_phase, order_entry.get('date_upd', '')):
+                    continue
+                order = self.get_order(order_entry['id'])
+                order.is_refund = refund_phase
+                yield order
+            offset += len(orders)
+
+    def get_orders_by_date(self, date_from: datetime, date_to: datetime) -> Iterator[Order]:
+        """
+        Fetches the orders created in an interval whatever their status and exported flag (backfill), by pages of
+        orders with their full content instead of one call per order.
 
-        for refund_phase, statuses, exported_value in (
-                (False, valid_orders_status, '0'),
-                (True, refund_orders_status, '1')):
-            # Offset REEL : on avance du nombre de commandes deja lues. Ne PAS se baser
-            # sur le filtre exported pour faire avancer la fenetre : le marquage est
-            # differe apres l'import EBP (cf. Connector.mark_exported_orders), donc le
-            # filtre ne bouge pas pendant le run. Un offset fige -> memes commandes
-            # re-servies en boucle -> doublons / produits x N en EBP.
-            offset = 0
-            for _ in range(self._MAX_CALLS):
-                result = self._do_api_call(self._build_url('orders_with_printed', {
-                    'filter[orders_printed][exported]': exported_value,
-                    'filter[current_state]': '[' + '|'.join(statuses) + ']',
-                    'sort': '[id_ASC]',
-                    'limit': f"{offset},{self._PAGINATION_SIZE}"
-                }))
-                orders_list = result.json()
-                if not orders_list or not orders_list.get('orders'):
-                    break
-                orders = orders_list['orders']
-                for order_entry in orders:
-                    order = self.get_order(order_entry['id'])
-                    order.is_refund = refund_phase
-                    yield order
-                offset += len(orders)
-
+        :param date_from: lower bound of the order creation date, included
+        :param date_to: upper bound of the order creation date, included
+        :return: A generator yielding the orders, sorted by ID
+        """
+        offset = 0
+        for _ in range(self._MAX_CALLS):
+            params = {
+                'display': 'full',
+                'date': '1',
+                'filter[date_add]': f"[{date_from:%Y-%m-%d %H:%M:%S},{date_to:%Y-%m-%d %H:%M:%S}]",
+                'sort': '[id_ASC]',
+                'limit': f"{offset},{self._FULL_PAGINATION_SIZE}"
+            }
+            orders_list = self._do_api_call(self._build_url('orders', params)).json()
+            if not orders_list or not orders_list.get('orders'):
+                break
+            for order_entry in orders_list['orders']:
+                yield Order.from_dict(order_entry)
+            offset += len(orders_list['orders'])
+
+    def get_order_id_range(self) -> Optional[Tuple[int, int]]:
+        """ :return: the lowest and highest order IDs of the shop, None if there is no order """
+        bounds = []
+        for sort in ('[id_ASC]', '[id_DESC]'):
+            orders_list = self._do_api_call(self._build_url('orders', {'sort': sort, 'limit': '1'})).json()
+            if not orders_list or not orders_list.get('orders'):
+                return None
+            bounds.append(int(orders_list['orders'][0]['id']))
+        return bounds[0], bounds[1]
 
     def get_product(self, product_id: int):
-        result = self._do_api_call(self._build_url(f"products/{product_id}"))
-        return Product.from_dict(result.json()['product'])
+        # Une seule langue : les descriptions dans toutes les langues representaient l'essentiel de la reponse
+        return Product.from_dict(self._get_projected('products', 'product', product_id, PRODUCT_FIELDS,
+                                                     {'language': str(self.language_id)}))
 
     def set_order_exported(self, order: Order):
         self._set_order_exported_field(order, 1)
@@ -172,6 +380,8 @@ class Webservice:
         self._set_order_exported_field(order, 2)
 
     def test_api_authentication(self) -> bool:
-        s = Session()
-        response = s.get(self._build_url(''), auth=self._build_credentials())
-        return response.status_code == 200
+        try:
+            self._do_api_call(self._build_url(''))
+        except BadHTTPCode:
+            return False
+        return True
@@ -0,0 +1,78 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+
+from psebpconnector.json_store import JsonOrderStore
+from psebpconnector.models import Order
+from typing import List, Optional
+
+
+class WritebackOutbox(JsonOrderStore):
+    """
+    Orders imported by EBP whose `orders_printed` flag could not be set in Prestashop, persisted in a JSON file. They
+    are flagged again at the start of the next runs, before fetching any order, and skipped by the orders scan until
+    then: an order already in EBP is never exported twice.
+    """
+
+    def contains(self, order_id: int, is_refund: bool) -> bool:
+        with self._lock:
+            return self._key(order_id, is_refund) in self._entries
+
+    def _load_failed(self, error: Exception):
+        self.logger.error(f"Unable to read the writeback outbox {self.path} - {error}")
+
+    def add(self, order: Order, error: str, now: Optional[float] = None):
+        """ Queue the writeback of an imported order, saved at once: the process may not reach the end of the run """
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.get(self._key(order.id, order.is_refund), {'attempts': 0, 'queued_at': now})
+            entry.update(order_id=order.id, is_refund=order.is_refund, attempts=entry['attempts'] + 1,
+                         last_attempt=now, last_error=error)
+            self._entries[self._key(order.id, order.is_refund)] = entry
+        self.save()
+
+    def pending(self) -> List[Order]:
+        with self._lock:
+            return [Order(id=entry['order_id'], is_refund=entry['is_refund']) for entry in self._entries.values()]
+
+    def flush(self, webservice) -> int:
+        """ Flag again the queued orders in Prestashop, the failed ones stay queued. :return: the number flagged """
+        flagged = 0
+        for order in self.pending():
+            try:
+                if order.is_refund:
+                    webservice.set_order_refund(order)
+                else:
+                    webservice.set_order_exported(order)
+            except Exception as e:
+                self.logger.warning(f"Order {order.id}: unable to flag it exported, kept in the writeback outbox "
+                                    f"- {e}")
+                self.add(order, str(e))
+                continue
+            with self._lock:
+                del self._entries[self._key(order.id, order.is_refund)]
+            flagged += 1
+        self.save()
+        return flagged
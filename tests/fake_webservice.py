@@ -0,0 +1,470 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+COUNTRIES = {
+    1: 'DE',
+    3: 'BE',
+    6: 'ES',
+    8: 'FR',
+    10: 'IT',
+    13: 'NL',
+}
+
+CURRENCIES = {
+    1: 'EUR',
+}
+
+# Payment methods of tests/samples/payment_method_mapping.csv whose territoriality is 'France', so every generated
+# order can be mapped with the sample VAT file whatever its delivery country.
+PAYMENT_METHODS = [
+    'Ebay - FR - Creditcard',
+    'FNAC Marketplace - FR',
+    'Cdiscount - FR',
+    'CM-CIC P@iement',
+    'Virement bancaire',
+]
+
+VAT_RATE = 0.2
+
+
+class FakeDataset:
+    """ Synthetic shop content, stored the way the Prestashop webservice renders it in JSON (strings everywhere). """
+
+    def __init__(self,
+                 orders: int = 100,
+                 addresses: Optional[int] = None,
+                 products: int = 500,
+                 lines_per_order: Tuple[int, int] = (1, 5),
+                 refund_ratio: float = 0.1,
+                 valid_status: Tuple[int, ...] = (2, 4, 5),
+                 refund_status: Tuple[int, ...] = (7,),
+                 first_order_id: int = 1,
+                 start_date: datetime = datetime(2024, 1, 1),
+                 seed: int = 0):
+        """
+        :param orders: number of orders to generate
+        :param addresses: number of addresses to generate (defaults to 5 per order, as in real shops)
+        :param products: size of the catalog
+        :param lines_per_order: min and max number of order rows per order
+        :param refund_ratio: share of the orders already exported and now in a refund status
+        :param seed: seed of the random generator, the same seed always gives the same dataset
+        """
+        rnd = random.Random(seed)
+        addresses = addresses if addresses is not None else max(1, orders * 5)
+        self.countries = {country_id: {'id': str(country_id), 'iso_code': iso_code, 'active': '1'}
+                          for country_id, iso_code in COUNTRIES.items()}
+        self.currencies = {currency_id: {'id': str(currency_id), 'iso_code': iso_code, 'active': '1'}
+                           for currency_id, iso_code in CURRENCIES.items()}
+        self.addresses = {address_id: self._build_address(rnd, address_id) for address_id in range(1, addresses + 1)}
+        self.products = {product_id: self._build_product(rnd, product_id) for product_id in range(1, products + 1)}
+        self.orders = {}
+        self.orders_printed = {}
+        for i in range(orders):
+            order_id = first_order_id + i
+            is_refund = rnd.random() < refund_ratio
+            self.orders[order_id] = self._build_order(
+                rnd, order_id, start_date + timedelta(minutes=17 * i), lines_per_order,
+                rnd.choice(refund_status if is_refund else valid_status))
+            self.orders_printed[order_id] = {
+                'id': str(order_id),
+                'id_order': str(order_id),
+                'printed': '1',
+                'exported': '1' if is_refund else '0',
+                'printed_date': self.orders[order_id]['date_add'],
+                'exported_date': self.orders[order_id]['date_add'] if is_refund else None,
+            }
+
+    def _build_address(self, rnd: random.Random, address_id: int) -> dict:
+        return {
+            'id': str(address_id),
+            'id_customer': str(address_id),
+            'id_manufacturer': '0',
+            'id_supplier': '0',
+            'id_warehouse': '0',
+            'id_country': str(rnd.choice(list(COUNTRIES))),
+            'id_state': '0',
+            'alias': 'Mon adresse',
+            'company': '',
+            'lastname': f"Nom{address_id}",
+            'firstname': f"Prenom{address_id}",
+            'vat_number': '',
+            'address1': f"{address_id} rue de la Gare",
+            'address2': '',
+            'postcode': f"{rnd.randint(1000, 95999):05d}",
+            'city': 'VILLE',
+            'other': '',
+            'phone': '0102030405',
+            'phone_mobile': '',
+            'dni': '',
+            'deleted': '0',
+            'date_add': '2024-01-01 00:00:00',
+            'date_upd': '2024-01-01 00:00:00',
+        }
+
+    def _build_product(self, rnd: random.Random, product_id: int) -> dict:
+        price = rnd.randint(100, 20000) / 100
+        return {
+            'id': str(product_id),
+            'price': f"{price:.6f}",
+            'wholesale_price': f"{price * 0.6:.6f}",
+            'ean13': f"{3000000000000 + product_id}",
+            'name': [{'id': '1', 'value': f"Product {product_id}"},
+                     {'id': '2', 'value': f"Produit {product_id}"}],
+            'description': [{'id': '1', 'value': f"<p>Description of product {product_id}</p>" * 20},
+                            {'id': '2', 'value': f"<p>Description du produit {product_id}</p>" * 20}],
+        }
+
+    def _build_order(self, rnd: random.Random, order_id: int, date_add: datetime,
+                     lines_per_order: Tuple[int, int], current_state: int) -> dict:
+        rows = []
+        total_products = 0.0
+        for row_id in range(rnd.randint(*lines_per_order)):
+            product = self.products[rnd.randint(1, len(self.products))]
+            quantity = rnd.randint(1, 3)
+            price = float(product['price'])
+            rows.append({
+                'id': str(order_id * 100 + row_id),
+                'product_id': product['id'],
+                'product_attribute_id': '0',
+                'product_quantity': str(quantity),
+                'product_name': product['name'][0]['value'],
+                'product_reference': product['ean13'],
+                'product_ean13': product['ean13'],
+                'product_isbn': '',
+                'product_upc': '',
+                'product_price': f"{price:.6f}",
+                'id_customization': '0',
+                'unit_price_tax_incl': f"{price * (1 + VAT_RATE):.6f}",
+                'unit_price_tax_excl': f"{price:.6f}",
+            })
+            total_products += price * quantity
+        shipping = rnd.choice([0.0, 4.9, 7.5])
+        id_address_delivery = rnd.randint(1, len(self.addresses))
+        id_address_invoice = id_address_delivery if rnd.random() < 0.8 else rnd.randint(1, len(self.addresses))
+        date = date_add.strftime('%Y-%m-%d %H:%M:%S')
+        return {
+            'id': str(order_id),
+            'id_address_delivery': str(id_address_delivery),
+            'id_address_invoice': str(id_address_invoice),
+            'id_cart': str(order_id),
+            'id_currency': '1',
+            'id_lang': '1',
+            'id_customer': str(id_address_invoice),
+            'id_carrier': '1',
+            'id_shop_group': '1',
+            'id_shop': '1',
+            'current_state': str(current_state),
+            'module': 'ps_checkout',
+            'payment': rnd.choice(PAYMENT_METHODS),
+            'reference': f"REF{order_id:09d}",
+            'conversion_rate': '1.000000',
+            'date_add': date,
+            'date_upd': date,
+            'delivery_date': date,
+            'delivery_number': '0',
+            'invoice_date': date,
+            'invoice_number': str(order_id),
+            'shipping_number': '',
+            'total_discounts': '0.000000',
+            'total_paid': f"{total_products * (1 + VAT_RATE) + shipping:.6f}",
+            'total_paid_real': f"{total_products * (1 + VAT_RATE) + shipping:.6f}",
+            'total_products': f"{total_products:.6f}",
+            'total_products_wt': f"{total_products * (1 + VAT_RATE):.6f}",
+            'total_shipping': f"{shipping:.6f}",
+            'total_shipping_tax_incl': f"{shipping:.6f}",
+            'total_shipping_tax_excl': f"{shipping / (1 + VAT_RATE):.6f}",
+            'associations': {'order_rows': rows},
+        }
+
+    def orders_with_printed(self) -> List[dict]:
+        return [dict(order, **{'orders_printed.exported': self.orders_printed[order_id]['exported']})
+                for order_id, order in self.orders.items()]
+
+
+def _parse_filter_value(value: str):
+    """ Prestashop filter syntax: `[a|b]` (one of), `[a,b]` (interval), `value` (equals) """
+    if value.startswith('[') and value.endswith(']'):
+        inner = value[1:-1]
+        if ',' in inner:
+            low, high = inner.split(',', 1)
+            return lambda v: _compare(high, v) <= 0 <= _compare(low, v)
+        choices = set(inner.split('|'))
+        return lambda v: str(v) in choices
+    return lambda v: str(v) == value
+
+
+def _compare(bound: str, value) -> int:
+    try:
+        return (float(value) > float(bound)) - (float(value) < float(bound))
+    except ValueError:
+        return (str(value) > bound) - (str(value) < bound)
+
+
+def apply_list_parameters(resources: List[dict], params: Dict[str, str]) -> List[dict]:
+    """ Apply the `filter[...]`, `sort`, `limit` and `display` parameters of a Prestashop list call """
+    for key, value in params.items():
+        match = re.fullmatch(r'filter\[(.+)\]', key)
+        if match:
+            field = match.group(1).replace('][', '.')
+            accept = _parse_filter_value(value)
+            resources = [resource for resource in resources if accept(resource.get(field, ''))]
+
+    if 'sort' in params:
+        field, direction = params['sort'].strip('[]').rsplit('_', 1)
+        resources = sorted(resources, key=lambda r: _sort_key(r.get(field, '')), reverse=direction == 'DESC')
+
+    if 'limit' in params:
+        limit = params['limit'].split(',')
+        offset, count = (0, int(limit[0])) if len(limit) == 1 else (int(limit[0]), int(limit[1]))
+        resources = resources[offset:offset + count]
+
+    display = params.get('display')
+    if display == 'full':
+        resources = [{k: v for k, v in resource.items() if '.' not in k} for resource in resources]
+    else:
+        fields = display.strip('[]').split(',') if display else ['id']
+        resources = [{field: resource[field] for field in fields if field in resource} for resource in resources]
+    return [apply_language(resource, params.get('language')) for resource in resources]
+
+
+def apply_language(resource: dict, language: Optional[str]) -> dict:
+    """ `language` parameter: multilingual fields only keep the requested language """
+    if not language:
+        return resource
+    return {key: [translation for translation in value if translation.get('id') == language]
+            if isinstance(value, list) and value and isinstance(value[0], dict) and 'value' in value[0] else value
+            for key, value in resource.items()}
+
+
+def _sort_key(value):
+    try:
+        return 0, float(value), ''
+    except (TypeError, ValueError):
+        return 1, 0, str(value)
+
+
+class FakeWebservice:
+    """
+    HTTP server answering like the Prestashop webservice used by the connector
+
+    Serves synthetic shop data (generated the same way as `tests/datasets.py`) so the real `Webservice` client can
+    be exercised end to end: pagination, JSON decoding, `orders_printed` PATCH flow...
+
+        python -m tests.fake_webservice --orders 10000 --addresses 50000 --latency 0.005 --error-rate 0.001
+    """
+
+    _SINGLE_RESOURCES = {
+        'addresses': ('address', 'addresses'),
+        'countries': ('country', 'countries'),
+        'currencies': ('currency', 'currencies'),
+        'orders': ('order', 'orders'),
+        'orders_printed': ('order_printed', 'orders_printed'),
+        'products': ('product', 'products'),
+    }
+
+    def __init__(self,
+                 dataset: FakeDataset,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 seed: int = 0):
+        """
+        :param dataset: data served by the webservice
+        :param latency: delay in seconds added to every response
+        :param error_rate: share of the requests answered with an HTTP 500
+        :param port: TCP port to listen to, 0 picks a free one
+        """
+        self.dataset = dataset
+        self.latency = latency
+        self.error_rate = error_rate
+        # Ressources supprimees logiquement (deleted = 1) absentes des listings, mais accessibles en direct
+        self.lists_hide_deleted = False
+        self.request_counter = {}
+        # Taille des reponses envoyees par ressource, compressees quand le client accepte gzip
+        self.bytes_sent = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._build_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _build_handler(self):
+        webservice = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                webservice._handle(self, 'GET')
+
+            def do_PATCH(self):
+                webservice._handle(self, 'PATCH')
+
+            def log_message(self, *_):
+                pass
+
+        return Handler
+
+    def _handle(self, request: BaseHTTPRequestHandler, method: str):
+        url = urlsplit(request.path)
+        parts = [part for part in url.path.split('/') if part][1:]  # drop the 'api' prefix
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0)).decode('utf-8')
+        endpoint = parts[0] if parts else ''
+
+        with self._lock:
+            self.request_counter[f"{method} {endpoint}"] = self.request_counter.get(f"{method} {endpoint}", 0) + 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failed:
+            status, payload = 500, {'errors': [{'code': 0, 'message': 'Simulated error'}]}
+        elif method == 'PATCH' and endpoint == 'orders_printed':
+            status, payload = self._patch_order_printed(body)
+        elif method != 'GET':
+            status, payload = 405, {'errors': [{'code': 0, 'message': 'Method not allowed'}]}
+        elif not parts:
+            status, payload = 200, {'api': {}}
+        elif endpoint == 'orders_with_printed':
+            status, payload = self._list(self.dataset.orders_with_printed(), 'orders', params)
+        elif endpoint in self._SINGLE_RESOURCES and len(parts) == 2:
+            status, payload = self._get(endpoint, parts[1], params.get('language'))
+        elif endpoint in self._SINGLE_RESOURCES:
+            resources = list(self._resources(endpoint).values())
+            if self.lists_hide_deleted:
+                resources = [resource for resource in resources if resource.get('deleted') != '1']
+            status, payload = self._list(resources, self._SINGLE_RESOURCES[endpoint][1], params)
+        else:
+            status, payload = 404, {'errors': [{'code': 0, 'message': f"Unknown resource {endpoint}"}]}
+
+        content = json.dumps(payload).encode('utf-8')
+        compressed = 'gzip' in request.headers.get('Accept-Encoding', '')
+        if compressed:
+            content = gzip.compress(content, compresslevel=6)
+        with self._lock:
+            self.bytes_sent[endpoint] = self.bytes_sent.get(endpoint, 0) + len(content)
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        if compressed:
+            request.send_header('Content-Encoding', 'gzip')
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def _resources(self, endpoint: str) -> dict:
+        return getattr(self.dataset, endpoint)
+
+    def _get(self, endpoint: str, resource_id: str, language: Optional[str] = None):
+        resource = self._resources(endpoint).get(int(resource_id)) if resource_id.isdigit() else None
+        if resource is None:
+            return 404, {'errors': [{'code': 0, 'message': f"{endpoint} {resource_id} not found"}]}
+        return 200, {self._SINGLE_RESOURCES[endpoint][0]: apply_language(resource, language)}
+
+    @staticmethod
+    def _list(resources: List[dict], name: str, params: Dict[str, str]):
+        resources = apply_list_parameters(resources, params)
+        # Prestashop renders an empty list instead of an empty object when nothing matches
+        return 200, ({name: resources} if resources else [])
+
+    def _patch_order_printed(self, body: str):
+        fields = dict(re.findall(r'<(\w+)><!\[CDATA\[(.*?)\]\]></\1>', body))
+        if 'id' not in fields or not fields['id'].isdigit():
+            return 400, {'errors': [{'code': 0, 'message': 'Missing order_printed id'}]}
+        with self._lock:
+            order_printed = next((p for p in self.dataset.orders_printed.values() if p['id'] == fields['id']), None)
+            if order_printed is None:
+                return 404, {'errors': [{'code': 0, 'message': f"order_printed {fields['id']} not found"}]}
+            order_printed.update({k: v for k, v in fields.items() if k in order_printed and k != 'id'})
+        return 200, {'order_printed': order_printed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Prestashop webservice')
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--addresses', type=int, default=50000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--min-lines', type=int, default=1)
+    parser.add_argument('--max-lines', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='delay added to every response, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of the requests failing with HTTP 500')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = FakeDataset(orders=args.orders,
+                          addresses=args.addresses,
+                          products=args.products,
+                          lines_per_order=(args.min_lines, args.max_lines),
+                          seed=args.seed)
+    server = FakeWebservice(dataset, latency=args.latency, error_rate=args.error_rate, port=args.port, seed=args.seed)
+    print(f"Serving {len(dataset.orders)} orders on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
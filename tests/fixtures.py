@@ -23,6 +23,7 @@ SOFTWARE.
 """
 
 from .datasets import *
+from .fake_webservice import FakeDataset, FakeWebservice
 from pathlib import Path
 from psebpconnector.connector import Connector
 from pytest import fixture
@@ -40,11 +41,19 @@ def get_countries_iso_code():
 def get_currencies_iso_code():
     return CURRENCIES
 
+def get_country_iso_code(_, country_id):
+    return COUNTRIES[country_id]
+
+def get_currency_iso_code(_, currency_id):
+    return CURRENCIES[currency_id]
+
 @fixture
-def offline_connector(request, mocker):
+def offline_connector(request, mocker, tmp_path):
     orders = getattr(request, 'param', SINGLE_ORDER_WITH_TWO_PRODUCTS_BAD_AMOUNT)
     mocker.patch("psebpconnector.webservice.Webservice.get_countries_iso_code", side_effect=get_countries_iso_code)
     mocker.patch("psebpconnector.webservice.Webservice.get_currencies_iso_code", side_effect=get_currencies_iso_code)
+    mocker.patch("psebpconnector.webservice.Webservice.get_country_iso_code", new=get_country_iso_code)
+    mocker.patch("psebpconnector.webservice.Webservice.get_currency_iso_code", new=get_currency_iso_code)
     mocker.patch("psebpconnector.webservice.Webservice.get_orders_to_export", return_value=orders)
     mocker.patch("psebpconnector.webservice.Webservice.get_address", new=get_address)
     mocker.patch("psebpconnector.webservice.Webservice.get_product", new=get_product)
@@ -52,5 +61,34 @@ def offline_connector(request, mocker):
     mocker.patch("psebpconnector.webservice.Webservice.set_order_exported")
     mocker.patch("psebpconnector.webservice.Webservice.set_order_refund")
     mocker.patch("psebpconnector.connector.Connector.import_files")
-    connector = Connector(Path(__file__).parent / 'samples/config/config_file_ok.ini')
+    connector = Connector(Path(__file__).parent / 'samples/config/config_file_ok.ini', working_directory=tmp_path)
     return connector
+
+@fixture
+def fake_webservice(request):
+    dataset = getattr(request, 'param', None) or FakeDataset(orders=25, addresses=30, products=20, refund_ratio=0.2)
+    with FakeWebservice(dataset) as server:
+        yield server
+
+
+def write_online_config(config_path: Path, url: str, working_directory: Path, ebp_database_path: Path) -> Path:
+    """ Configuration file for the local webservice stand-in, with the benchmarks fake EBP executable """
+    root = Path(__file__).parent.parent
+    config_path.write_text(f"[main]\n"
+                           f"url = {url}\n"
+                           f"apikey = APIKEY\n"
+                           f"ebp_database_path = {ebp_database_path}\n"
+                           f"ebp_executable_path = {root / 'benchmarks/fake_ebp.py'}\n"
+                           f"payment_method_mapping_file_path = {root / 'tests/samples/payment_method_mapping.csv'}\n"
+                           f"vat_mapping_file_path = {root / 'tests/samples/vat.csv'}\n"
+                           f"working_directory = {working_directory}\n"
+                           f"order_valid_status = 2,4,5\n"
+                           f"order_refund_status = 7\n")
+    return config_path
+
+
+@fixture
+def online_connector(fake_webservice, tmp_path):
+    """ Connector talking to the local webservice stand-in """
+    return Connector(write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                         tmp_path / 'database.ebp'))
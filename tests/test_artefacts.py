@@ -0,0 +1,142 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import sqlite3
+import time
+import zipfile
+
+from contextlib import closing
+from datetime import datetime
+
+from .fixtures import fake_webservice, write_online_config
+from psebpconnector.artefacts import ArtefactManager
+from psebpconnector.command import find_order
+from psebpconnector.connector import Connector
+from psebpconnector.connector_configuration import ConnectorConfiguration
+
+
+def _run_files(directory, run_id):
+    files = []
+    for name in [f"logs_{run_id}.txt", f"articles_{run_id}.csv", f"orders_{run_id}.csv"]:
+        (directory / name).write_text(name * 100)
+        files.append(directory / name)
+    return files
+
+
+def test_archive_run_and_find_order(tmp_path):
+    manager = ArtefactManager(tmp_path, tmp_path / 'archives')
+    run_id = str(time.time())
+    archive = manager.archive_run(run_id, _run_files(tmp_path, run_id), [(12, False, 'imported'),
+                                                                         (13, True, 'rejected')])
+
+    assert archive.name == f"runs_{datetime.now():%Y-%m-%d}.zip"
+    assert sorted(zipfile.ZipFile(archive).namelist()) == [f"{run_id}/articles_{run_id}.csv",
+                                                           f"{run_id}/logs_{run_id}.txt",
+                                                           f"{run_id}/orders_{run_id}.csv"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['archives']
+    assert manager.find_order(13) == [(run_id, archive, True, 'rejected')]
+    assert manager.find_order(99) == []
+
+
+def test_sweep_leftover_runs(tmp_path):
+    manager = ArtefactManager(tmp_path, tmp_path / 'archives')
+    now = time.time()
+    old_run_id, active_run_id, current_run_id = str(now - 2 * 86400), str(now - 3 * 86400), str(now)
+    for path in _run_files(tmp_path, old_run_id):
+        os.utime(path, (now - 2 * 86400, now - 2 * 86400))
+    # Run ancien mais toujours actif dans un autre processus (backfill) : fichiers recemment modifies
+    _run_files(tmp_path, active_run_id)
+    _run_files(tmp_path, current_run_id)
+    (tmp_path / 'config.ini').write_text('[main]')
+
+    assert manager.sweep(exclude=[current_run_id], now=now) == 1
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_file()) == sorted(
+        ['config.ini'] + [f"{name}_{run_id}.{extension}" for run_id in (active_run_id, current_run_id)
+                          for name, extension in (('logs', 'txt'), ('articles', 'csv'), ('orders', 'csv'))])
+    assert manager.archive_path(float(old_run_id)).is_file()
+    assert manager.sweep(exclude=[current_run_id], now=now + 2 * 86400) == 1
+
+
+def test_retention_by_age_and_size(tmp_path):
+    manager = ArtefactManager(tmp_path, tmp_path / 'archives', retention_days=30)
+    now = time.time()
+    for days in [40, 20, 10, 0]:
+        run_id = str(now - days * 86400)
+        manager.archive_run(run_id, _run_files(tmp_path, run_id), [(days, False, 'imported')])
+
+    assert manager.apply_retention(now) == [manager.archive_path(now - 40 * 86400)]
+    assert manager.find_order(40) == []
+    assert len(manager.find_order(20)) == 1
+
+    manager.max_total_size = os.path.getsize(manager.archive_path(now)) + 1
+    deleted = manager.apply_retention(now)
+    assert deleted == [manager.archive_path(now - 20 * 86400), manager.archive_path(now - 10 * 86400)]
+    assert [path.name for path in (tmp_path / 'archives').glob('*.zip')] == [manager.archive_path(now).name]
+    assert manager.find_order(0)
+
+
+def test_index_without_status_upgraded(tmp_path):
+    (tmp_path / 'archives').mkdir()
+    with closing(sqlite3.connect(tmp_path / 'archives' / 'index.sqlite')) as connection, connection:
+        connection.execute('CREATE TABLE runs (run_id TEXT PRIMARY KEY, archive TEXT NOT NULL, '
+                           'started_at REAL NOT NULL)')
+        connection.execute('CREATE TABLE orders (order_id INTEGER NOT NULL, is_refund INTEGER NOT NULL, '
+                           'run_id TEXT NOT NULL)')
+        connection.execute("INSERT INTO runs VALUES ('1.0', 'runs_1970-01-01.zip', 1.0)")
+        connection.execute("INSERT INTO orders VALUES (7, 0, '1.0')")
+
+    manager = ArtefactManager(tmp_path, tmp_path / 'archives')
+    assert manager.find_order(7) == [('1.0', tmp_path / 'archives' / 'runs_1970-01-01.zip', False, 'exported')]
+
+
+def test_connector_archives_its_runs(fake_webservice, tmp_path):
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write("[artefacts]\nretention_days = 30\n")
+    connector = Connector(config_path)
+
+    assert connector.run() == 0
+    order, first_run_id = connector.pending_orders[0], str(connector._startup_time)
+    assert connector.run() == 0
+    assert not list(tmp_path.glob('logs_*.txt')) and not list(tmp_path.glob('*_*.csv'))
+    archive, = (tmp_path / 'archives').glob('runs_*.zip')
+    assert len({name.split('/')[0] for name in zipfile.ZipFile(archive).namelist()}) == 2
+    assert connector.artefacts.find_order(order.id) == [(first_run_id, archive, order.is_refund, 'imported')]
+
+
+def test_find_order_command(fake_webservice, tmp_path, capsys):
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write("[artefacts]\n")
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    order = next(order for order in connector.pending_orders if not order.is_refund)
+
+    find_order(ConnectorConfiguration(config_path), order.id)
+    assert f"Order {order.id}: run {connector.run_id} (" in capsys.readouterr().out
+    find_order(ConnectorConfiguration(config_path), 999999)
+    assert capsys.readouterr().out == "Order 999999: not found in the archives index\n"
@@ -0,0 +1,109 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import csv
+import pytest
+import threading
+
+from .fake_webservice import FakeDataset
+from .fixtures import fake_webservice, online_connector
+from datetime import date
+from psebpconnector.backfill import Backfill, split_date_range
+
+
+BACKFILL_DATASET = FakeDataset(orders=100, addresses=50, products=30, refund_ratio=0.2, seed=5)
+
+
+def test_split_days():
+    assert split_date_range(date(2024, 1, 30), date(2024, 2, 1)) == [
+        (date(2024, 1, 30), date(2024, 1, 30)),
+        (date(2024, 1, 31), date(2024, 1, 31)),
+        (date(2024, 2, 1), date(2024, 2, 1)),
+    ]
+
+
+def test_split_weeks():
+    # 2024-01-03 est un mercredi
+    assert split_date_range(date(2024, 1, 3), date(2024, 1, 20), 'week') == [
+        (date(2024, 1, 3), date(2024, 1, 7)),
+        (date(2024, 1, 8), date(2024, 1, 14)),
+        (date(2024, 1, 15), date(2024, 1, 20)),
+    ]
+
+
+@pytest.mark.parametrize("start, end, partition", [
+    (date(2024, 1, 2), date(2024, 1, 1), 'day'),
+    (date(2024, 1, 1), date(2024, 1, 2), 'month'),
+])
+def test_split_invalid(start, end, partition):
+    with pytest.raises(ValueError):
+        split_date_range(start, end, partition)
+
+
+def _document_numbers(backfill):
+    numbers = []
+    for _, orders_path in backfill.chunks():
+        with open(orders_path, encoding='utf-8-sig', newline='') as f:
+            numbers.extend(row[3] for row in csv.reader(f, delimiter=';'))
+    return sorted(set(numbers), key=int)
+
+
+@pytest.mark.parametrize("fake_webservice", [BACKFILL_DATASET], indirect=True)
+def test_backfill(online_connector, fake_webservice):
+    dataset = fake_webservice.dataset
+    exported_flags = {order_id: printed['exported'] for order_id, printed in dataset.orders_printed.items()}
+    backfill = Backfill(online_connector, date(2024, 1, 1), date(2024, 1, 3), workers=3)
+    run_csv_files = online_connector.csv_products, online_connector.csv_orders
+
+    assert backfill.run() == 0
+    # Les CSV du run sont fermes (pas de thread d'ecriture laisse en vie) et remis en place
+    assert (online_connector.csv_products, online_connector.csv_orders) == run_csv_files
+    assert all(csv_file.closed for csv_file in run_csv_files)
+    writer_names = {f"csv-writer-{csv_file.path.name}" for csv_file in run_csv_files}
+    assert not [thread for thread in threading.enumerate() if thread.name in writer_names]
+    assert sorted(backfill.checkpoint) == ['2024-01-01', '2024-01-02', '2024-01-03']
+    expected = []
+    for order_id, order in dataset.orders.items():
+        expected.append(str(order_id))
+        if order['current_state'] == '7':
+            expected.append(f"{order_id}11")
+    assert _document_numbers(backfill) == sorted(expected, key=int)
+    # Les drapeaux exported ne sont ni lus ni modifies
+    assert {order_id: printed['exported'] for order_id, printed in dataset.orders_printed.items()} == exported_flags
+    assert not any(key.startswith('PATCH') or 'orders_printed' in key for key in fake_webservice.request_counter)
+
+
+@pytest.mark.parametrize("fake_webservice", [BACKFILL_DATASET], indirect=True)
+def test_backfill_resumes_from_checkpoint(online_connector, fake_webservice):
+    backfill = Backfill(online_connector, date(2024, 1, 1), date(2024, 1, 3))
+    assert backfill.run() == 0
+    del backfill.checkpoint['2024-01-02']
+    backfill._save_checkpoint()
+
+    calls = fake_webservice.request_counter['GET orders']
+    resumed = Backfill(online_connector, date(2024, 1, 1), date(2024, 1, 3))
+    assert resumed.run() == 0
+    assert sorted(resumed.checkpoint) == ['2024-01-01', '2024-01-02', '2024-01-03']
+    # Une seule partition a refaire : une page pleine puis une page vide
+    assert fake_webservice.request_counter['GET orders'] - calls == 2
@@ -0,0 +1,79 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+
+from .fixtures import fake_webservice, write_online_config
+from psebpconnector.cassette import Cassette
+from psebpconnector.connector import Connector
+from psebpconnector.exceptions import BadHTTPCode, CassetteMiss
+from psebpconnector.webservice import Webservice
+
+
+def _connector(directory, url, cassette_path, mode, extra=''):
+    directory.mkdir()
+    config_path = write_online_config(directory / 'config.ini', url, directory, directory / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write(f"[cassette]\nmode = {mode}\npath = {cassette_path}\n{extra}")
+    return Connector(config_path)
+
+
+def test_replay_a_recorded_run(fake_webservice, tmp_path):
+    cassette_path = tmp_path / 'run.jsonl.gz'
+    recorder = _connector(tmp_path / 'record', fake_webservice.url, cassette_path, 'record')
+    assert recorder.run() == 0
+    recorded_requests = sum(fake_webservice.request_counter.values())
+
+    # Rejeu sur une autre URL : aucune requete ne doit atteindre le serveur
+    player = _connector(tmp_path / 'replay', 'http://cassette.invalid/api', cassette_path, 'replay')
+    assert player.run() == 0
+    assert sum(fake_webservice.request_counter.values()) == recorded_requests
+    assert [order.id for order in player.pending_orders] == [order.id for order in recorder.pending_orders]
+    assert player._csv_orders_path.read_text(encoding='utf-8-sig') == \
+        recorder._csv_orders_path.read_text(encoding='utf-8-sig')
+    assert player.report.counters == recorder.report.counters
+
+
+def test_replay_order_and_misses(fake_webservice, tmp_path, mocker):
+    cassette_path = tmp_path / 'cassette.jsonl.gz'
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    webservice.cassette = Cassette(cassette_path, 'record')
+    webservice.get_country_iso_code(1)
+    webservice.get_currency_iso_code(1)
+    with pytest.raises(BadHTTPCode):
+        webservice.get_country_iso_code(99999)
+    webservice.cassette.close()
+
+    player = Webservice('http://cassette.invalid', 'APIKEY')
+    player.cassette = Cassette(cassette_path, 'replay', simulate_timing=True, timing_factor=2)
+    sleep = mocker.patch('psebpconnector.cassette.time.sleep')
+    assert player.cassette.interaction_count == 3
+    assert player.get_country_iso_code(1) == player.get_country_iso_code(1) == webservice.get_country_iso_code(1)
+    assert sleep.call_count == 2
+    with pytest.raises(BadHTTPCode):
+        player.get_country_iso_code(99999)
+    with pytest.raises(CassetteMiss):
+        player.get_country_iso_code(2)
+    with pytest.raises(ValueError):
+        Cassette(cassette_path, 'rewind')
@@ -0,0 +1,95 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from .fixtures import fake_webservice, write_online_config
+from psebpconnector.connector import Connector
+from psebpconnector.csv_writer import read_rows
+from psebpconnector.export_models import DOCUMENT_NUMBER_COLUMN
+
+
+def chunked_connector(fake_webservice, tmp_path, chunk_size: int) -> Connector:
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write(f"import_chunk_size = {chunk_size}\n")
+    return Connector(config_path)
+
+
+def test_chunks_marked_exported_during_import(fake_webservice, tmp_path, mocker):
+    connector = chunked_connector(fake_webservice, tmp_path, 4)
+    run_ebp_import = connector._run_ebp_import
+    patches_before_import = []
+
+    def import_chunk(logs_path, csv_path, target, config_name):
+        if target == 'SaleInvoices':
+            if connector._chunked_import._futures:
+                connector._chunked_import._futures[-1].result()
+            patches_before_import.append(fake_webservice.request_counter.get('PATCH orders_printed', 0))
+        run_ebp_import(logs_path, csv_path, target, config_name)
+
+    mocker.patch.object(connector, '_run_ebp_import', side_effect=import_chunk)
+    assert connector.run() == 0
+
+    chunks = connector._chunked_import.chunks
+    assert len(chunks) > 1 and all(len(chunk.orders) <= 4 for chunk in chunks)
+    assert patches_before_import[0] == 0 and patches_before_import == sorted(patches_before_import)
+    assert patches_before_import[-1] > 0
+    assert not connector.errors_raised_by_ebp()
+    counters = connector.report.counters
+    assert counters['orders_marked_exported'] + counters['refunds_marked_exported'] == len(connector.pending_orders)
+
+    # Les documents ne sont jamais coupes entre deux chunks
+    chunk_rows = [row for chunk in chunks for row in read_rows(chunk.orders_path)]
+    assert chunk_rows == list(read_rows(connector._csv_orders_path))
+    chunk_documents = [{row[DOCUMENT_NUMBER_COLUMN] for row in read_rows(chunk.orders_path)}
+                       for chunk in chunks]
+    assert sum(len(documents) for documents in chunk_documents) == len(set().union(*chunk_documents))
+
+
+def test_rejected_document_in_one_chunk(fake_webservice, tmp_path, mocker):
+    connector = chunked_connector(fake_webservice, tmp_path, 4)
+    run_ebp_import = connector._run_ebp_import
+
+    def import_chunk(logs_path, csv_path, target, config_name):
+        run_ebp_import(logs_path, csv_path, target, config_name)
+        if logs_path.name.endswith('_chunk2.txt'):
+            document_number = next(read_rows(csv_path))[DOCUMENT_NUMBER_COLUMN]
+            logs_path.write_text(f"Import\n\t3/4 enregistrements ont été importés :\n"
+                                 f"Le document {document_number} ne sera pas importé\n", encoding='utf-8')
+
+    mocker.patch.object(connector, '_run_ebp_import', side_effect=import_chunk)
+    assert connector.run() == 0
+
+    rejected = connector._chunked_import.chunks[1].orders[0]
+    assert connector.report.counters['ebp_rejected_documents'] == 1
+    assert fake_webservice.dataset.orders_printed[rejected.id]['exported'] == ('1' if rejected.is_refund else '0')
+    assert connector.errors_raised_by_ebp()
+
+
+def test_single_chunk_uses_run_files(fake_webservice, tmp_path):
+    connector = chunked_connector(fake_webservice, tmp_path, 1000)
+    assert connector.run() == 0
+    assert [(chunk.orders_path, chunk.logs_path) for chunk in connector._chunked_import.chunks] == [
+        (connector._csv_orders_path, connector._ebp_import_orders_logs_path)]
+    assert not list(tmp_path.glob('*_chunk*'))
@@ -0,0 +1,70 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+import threading
+
+from psebpconnector.csv_writer import BackgroundCsvWriter
+
+
+def test_rows_written_in_order(tmp_path):
+    path = tmp_path / 'orders.csv'
+    with BackgroundCsvWriter(path, batch_size=7) as writer:
+        writer.writerows([i, f"row;{i}"] for i in range(100))
+        writer.flush()
+        assert writer.rows_written == 100 and writer.queued_rows == 0
+        assert path.read_text(encoding='utf-8-sig').splitlines()[:2] == ['0;"row;0"', '1;"row;1"']
+    assert path.read_bytes().startswith(b'\xef\xbb\xbf')
+    assert len(path.read_text(encoding='utf-8-sig').splitlines()) == 100
+    with pytest.raises(ValueError):
+        writer.writerow(['closed'])
+
+
+def test_queue_is_bounded(tmp_path, mocker):
+    writer = BackgroundCsvWriter(tmp_path / 'orders.csv', max_queued_rows=3)
+    unblock = threading.Event()
+    csv_writer = writer._writer
+    writer._writer = mocker.Mock()
+    writer._writer.writerows.side_effect = lambda rows: unblock.wait() and csv_writer.writerows(rows)
+    writer.writerow(['first'])
+    producer = threading.Thread(target=writer.writerows, args=([[i] for i in range(10)],))
+    producer.start()
+    producer.join(0.2)
+    # Le disque "bloque" : le producteur attend une place dans la file
+    assert producer.is_alive() and writer.queued_rows == 3 and writer.fill_level == 1
+    unblock.set()
+    producer.join()
+    writer.close()
+    assert writer.rows_written == 11 and writer.peak_queued_rows == 3
+
+
+def test_write_error_raised_to_producer(tmp_path, mocker):
+    writer = BackgroundCsvWriter(tmp_path / 'orders.csv')
+    writer._writer = mocker.Mock()
+    writer._writer.writerows.side_effect = OSError('disk full')
+    writer.writerow(['row'])
+    with pytest.raises(OSError, match='disk full'):
+        writer.flush(fsync=True)
+    with pytest.raises(OSError, match='disk full'):
+        writer.close()
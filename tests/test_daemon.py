@@ -0,0 +1,83 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+
+from .datasets import SINGLE_ORDER_FR_ONE_PRODUCT
+from .fixtures import offline_connector
+from datetime import datetime
+from psebpconnector.daemon import CronSchedule, Daemon
+from psebpconnector.webservice import Webservice
+
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("0 2 * * *", datetime(2024, 11, 13, 1, 59, 30), datetime(2024, 11, 13, 2, 0)),
+    ("0 2 * * *", datetime(2024, 11, 13, 2, 0), datetime(2024, 11, 14, 2, 0)),
+    ("*/15 * * * *", datetime(2024, 11, 13, 10, 7), datetime(2024, 11, 13, 10, 15)),
+    ("30 8-18/2 * * 1-5", datetime(2024, 11, 15, 19, 0), datetime(2024, 11, 18, 8, 30)),
+    ("0 0 1 1 *", datetime(2024, 11, 13, 10, 0), datetime(2025, 1, 1, 0, 0)),
+    ("0 0 13 * 5", datetime(2024, 11, 13, 10, 0), datetime(2024, 11, 15, 0, 0)),
+    ("0 0 29 2 *", datetime(2024, 3, 1, 0, 0), datetime(2028, 2, 29, 0, 0)),
+])
+def test_cron_next_run(expression, after, expected):
+    assert CronSchedule(expression).next_run(after) == expected
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "*/0 * * * *", "0 0 31 2 *"])
+def test_cron_invalid(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression).next_run(datetime(2024, 1, 1))
+
+
+def test_daemon_requires_schedule(offline_connector):
+    with pytest.raises(ValueError):
+        Daemon(offline_connector)
+
+
+@pytest.mark.parametrize("offline_connector", [SINGLE_ORDER_FR_ONE_PRODUCT], indirect=True)
+def test_daemon_cycles_keep_warm_state(offline_connector, mocker):
+    mocker.patch.object(Daemon, 'next_run', side_effect=lambda _: datetime.now())
+    load_mapping_index = mocker.spy(offline_connector, '_load_mapping_index')
+    daemon = Daemon(offline_connector, interval=3600)
+
+    files = []
+    for _ in range(2):
+        daemon.run_cycle()
+        files.append((offline_connector._csv_orders_path, offline_connector._logs_file_path,
+                      offline_connector._run_report_path))
+
+    assert daemon.exit_codes == [0, 0]
+    assert files[0][0] != files[1][0] and files[0][1] != files[1][1] and files[0][2] != files[1][2]
+    assert all(path.is_file() for cycle in files for path in cycle)
+    assert offline_connector.report.counters['orders_processed'] == 1
+    assert load_mapping_index.call_count == 1
+    assert Webservice.test_api_authentication.call_count == 1
+    assert Webservice.get_countries_iso_code.call_count == 1
+
+
+def test_daemon_run_forever(offline_connector, mocker):
+    mocker.patch.object(Daemon, 'next_run', side_effect=lambda _: datetime.now())
+    daemon = Daemon(offline_connector, cron="* * * * *")
+    daemon.run_forever(max_cycles=3)
+    assert len(daemon.exit_codes) == 3
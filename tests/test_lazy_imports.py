@@ -0,0 +1,53 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import subprocess
+import sys
+
+from pathlib import Path
+
+
+def _imported_modules(code: str):
+    """ Modules imported by `code`, run in a fresh interpreter so the modules imported by other tests do not count """
+    script = code + "\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', script], cwd=Path(__file__).parent.parent,
+                            capture_output=True, text=True, check=True)
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_o365_not_imported_without_o365_section():
+    modules = _imported_modules("from pathlib import Path\n"
+                                "from psebpconnector.connector import Connector\n"
+                                "Connector(Path('tests/samples/config/config_file_ok.ini'))")
+    assert 'psebpconnector.connector' in modules
+    assert not {'O365', 'msal', 'psebpconnector.mailer', 'psebpconnector.metrics_exporter',
+                'psebpconnector.artefacts'} & modules
+
+
+def test_command_modes_imported_on_demand():
+    modules = _imported_modules("import psebpconnector.command")
+    assert not {'O365', 'psebpconnector.daemon', 'psebpconnector.order_trigger', 'psebpconnector.backfill',
+                'psebpconnector.multi_shop', 'psebpconnector.sharding', 'psebpconnector.profiler',
+                'cProfile'} & modules
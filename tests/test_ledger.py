@@ -0,0 +1,178 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sqlite3
+import time
+
+from contextlib import closing
+from .fixtures import fake_webservice, write_online_config
+from psebpconnector.artefacts import ArtefactManager
+from psebpconnector.command import find_order
+from psebpconnector.connector import Connector
+from psebpconnector.connector_configuration import ConnectorConfiguration
+from psebpconnector.export_models import DOCUMENT_NUMBER_COLUMN
+from psebpconnector.ledger import ExportLedger
+from psebpconnector.models import Order
+from psebpconnector.reconciliation import LedgerReconciliation
+
+
+def test_record_and_lookup(tmp_path):
+    ledger = ExportLedger(tmp_path / 'ledger.sqlite')
+    order, refund = Order(id=12, reference='A'), Order(id=12, reference='A', is_refund=True)
+    order_hash = ExportLedger.order_hash(order, (1, 2))
+    ledger.record(order, '12', 'run1', order_hash, [(5, {'line_quantity': '2'})])
+    ledger.record(refund, '1211', 'run2', ExportLedger.order_hash(refund, (1, 2)), [(5, {'line_quantity': '-2'})])
+    ledger.set_status(12, True, ExportLedger.IMPORTED)
+
+    assert [(entry.run_id, entry.is_refund, entry.status) for entry in ledger.history(12)] == [
+        ('run1', False, 'exported'), ('run2', True, 'imported')]
+    assert ledger.document('1211')[0].rows == [(5, {'line_quantity': '-2'})]
+    assert [entry.order_id for entry in ledger.run('run1')] == [12]
+    assert ledger.history(13) == []
+
+
+def test_reusable_rows_only_for_unchanged_content(tmp_path):
+    ledger = ExportLedger(tmp_path / 'ledger.sqlite')
+    order = Order(id=12, total_paid=10)
+    order_hash = ExportLedger.order_hash(order, (1, 2))
+    ledger.record(order, '12', 'run1', order_hash, [(5, {'line_quantity': '2'})])
+
+    assert ledger.reusable_rows(12, False, order_hash) == [(5, {'line_quantity': '2'})]
+    assert ledger.reusable_rows(12, True, order_hash) is None
+    assert ledger.reusable_rows(12, False, ExportLedger.order_hash(Order(id=12, total_paid=11), (1, 2))) is None
+    assert ledger.reusable_rows(12, False, ExportLedger.order_hash(order, (1, 3))) is None
+
+
+def _journal_mode(path):
+    with closing(sqlite3.connect(path)) as connection:
+        return connection.execute('PRAGMA journal_mode').fetchone()[0]
+
+
+def test_journal_mode_and_reopen(tmp_path):
+    path = tmp_path / 'ledger.sqlite'
+    ledger = ExportLedger(path, wal=True)
+    ledger.record(Order(id=1), '1', 'run1', 'hash', [])
+    ledger.close()
+    assert _journal_mode(path) == 'wal'
+
+    # Journal classique par defaut, y compris pour un registre cree en WAL
+    ledger = ExportLedger(path)
+    ledger.close()
+    assert _journal_mode(path) == 'delete'
+    # Reouvert a la demande apres close (mode daemon)
+    assert [entry.order_id for entry in ledger.run('run1')] == [1]
+    ledger.close()
+
+
+def _write_run_files(directory, run_id, document_numbers, log):
+    rows = []
+    for document_number in document_numbers:
+        row = [''] * (DOCUMENT_NUMBER_COLUMN + 2)
+        row[DOCUMENT_NUMBER_COLUMN] = document_number
+        rows.append(';'.join(row))
+    orders_path = directory / f"orders_{run_id}.csv"
+    orders_path.write_text('\r\n'.join(rows) + '\r\n', encoding='utf-8-sig')
+    logs_path = directory / f"ebp_import_orders_logs_{run_id}.txt"
+    logs_path.write_text(log, encoding='utf-8')
+    return [orders_path, logs_path]
+
+
+def test_reconciliation(tmp_path):
+    ledger = ExportLedger(tmp_path / 'ledger.sqlite')
+    for order in [Order(id=12), Order(id=13), Order(id=13, is_refund=True), Order(id=14)]:
+        document_number = f"{order.id}11" if order.is_refund else f"{order.id}"
+        ledger.record(order, document_number, '100.0', 'hash', [])
+        ledger.record(order, document_number, '200.0', 'hash', [])
+    ledger.record(Order(id=15), '15', '300.0', 'hash', [])
+    _write_run_files(tmp_path, '100.0', ['12', '13', '1311'], "3/3\nLe document 13 ne sera pas importé\n")
+    files = _write_run_files(tmp_path, '200.0', ['12', '1311'], "2/2\n")
+    artefacts = ArtefactManager(tmp_path, tmp_path / 'archives')
+    artefacts.archive_run('200.0', files)
+    _write_run_files(tmp_path, '300.0', ['15'], "")
+
+    # Pas de log pour 14, log incomplet pour 15 : import peut-etre en cours, on attend
+    settled = LedgerReconciliation(ledger, tmp_path, artefacts).run(exclude=['200.0'])
+    assert {status: [(entry.order_id, entry.is_refund) for entry in entries] for status, entries in settled.items()} == {
+        'imported': [(12, False), (13, True)], 'rejected': [(13, False)]}
+    assert [entry.status for entry in ledger.run('200.0')] == ['exported'] * 4
+
+    # Run archive : les fichiers sont lus dans l'archive
+    settled = LedgerReconciliation(ledger, tmp_path, artefacts).run(now=time.time() + 2 * 86400)
+    assert [(entry.run_id, entry.order_id, entry.is_refund, entry.status) for entry in ledger.history(14)] == [
+        ('100.0', 14, False, 'import_failed'), ('200.0', 14, False, 'import_failed')]
+    assert [(entry.order_id, entry.is_refund, entry.status) for entry in ledger.run('200.0')] == [
+        (12, False, 'imported'), (13, False, 'import_failed'), (13, True, 'imported'), (14, False, 'import_failed')]
+    assert ledger.run('300.0')[0].status == 'import_failed'
+    assert ledger.unsettled_runs() == []
+    ledger.close()
+
+
+def test_connector_reconciles_interrupted_runs(fake_webservice, tmp_path, capsys):
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write("[ledger]\n")
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    order = next(order for order in connector.pending_orders if not order.is_refund)
+    first_run_id = connector.run_id
+    # Run interrompu entre l'import EBP et la mise a jour des statuts et des commandes
+    connector.ledger.set_status(order.id, False, ExportLedger.EXPORTED)
+    fake_webservice.dataset.orders_printed[order.id]['exported'] = '0'
+
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert connector.report.counters['ledger_documents_reconciled'] == 1
+    assert connector.ledger.history(order.id)[0].status == 'imported'
+    assert fake_webservice.dataset.orders_printed[order.id]['exported'] == '1'
+    # Commande marquee exportee avant la recuperation des commandes : pas reexportee
+    assert order.id not in [pending.id for pending in connector.pending_orders]
+
+    find_order(ConnectorConfiguration(config_path), order.id)
+    assert f"Order {order.id}: document {order.id}, run {first_run_id} (" in capsys.readouterr().out
+
+
+def test_connector_reuses_unchanged_orders(fake_webservice, tmp_path):
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write("[ledger]\n")
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    first_rows = connector._csv_orders_path.read_text(encoding='utf-8-sig').splitlines()
+    exported = [(order.id, order.is_refund) for order in connector.pending_orders]
+    assert exported
+    for order_id, is_refund in exported:
+        entry = connector.ledger.history(order_id)[-1]
+        assert entry.status == 'imported' and entry.run_id == str(connector._startup_time)
+
+    # Commandes repassees a exported=0 (reinitialisation dans Prestashop) : rien n'a change, pas de transformation
+    for order_id, printed in fake_webservice.dataset.orders_printed.items():
+        printed['exported'] = '0'
+    addresses_calls = fake_webservice.request_counter.get('GET addresses', 0)
+    assert connector.run() == 0
+    assert fake_webservice.request_counter.get('GET addresses', 0) == addresses_calls
+    assert connector.report.counters['ledger_rows_reused'] == connector.report.counters['rows_exported'] > 0
+    second_rows = connector._csv_orders_path.read_text(encoding='utf-8-sig').splitlines()
+    assert set(second_rows) <= set(first_rows)
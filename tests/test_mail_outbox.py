@@ -0,0 +1,139 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import os
+import pytest
+import time
+import zipfile
+
+from .datasets import SINGLE_ORDER_WITH_UNKNOWN_PAYMENT_METHOD
+from .fixtures import offline_connector
+from psebpconnector.mail_outbox import MailOutbox, error_excerpt
+
+
+class FakeMailer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def try_login(self):
+        raise AssertionError('no login on the startup path')
+
+    def send_mail(self, mail_obj, mail_body, mail_recipient, attachments=None):
+        if self.fail:
+            raise ConnectionError('O365 unreachable')
+        self.sent.append((mail_obj, mail_body, mail_recipient,
+                          {name: zipfile.ZipFile(attachments[0]).read(name).decode() for name in
+                           zipfile.ZipFile(attachments[0]).namelist()}))
+
+
+def test_error_excerpt():
+    lines = [f"INFO line {i}" for i in range(100)]
+    lines[50] = 'ERROR Order 12: no payment method found'
+    excerpt = error_excerpt('\n'.join(lines), 10000, context=2)
+    assert excerpt.splitlines() == ['[...]', 'INFO line 48', 'INFO line 49', lines[50], 'INFO line 51',
+                                    'INFO line 52', '[...]']
+    assert len(error_excerpt('x' * 1000, 100)) < 110
+
+
+def test_enqueue_and_flush(tmp_path):
+    small, large = tmp_path / 'logs.txt', tmp_path / 'orders.csv'
+    small.write_text('ERROR something')
+    large.write_text('\n'.join(['row'] * 1000 + ['ERROR here'] + ['row'] * 1000))
+    outbox = MailOutbox(tmp_path / 'outbox', max_attachment_size=1000)
+    outbox.enqueue('subject', 'body', 'ops@example.com', [small, large])
+    assert len(outbox.pending()) == 1
+
+    mailer = FakeMailer()
+    assert outbox.flush(mailer) == 1
+    (subject, body, recipient, attachments), = mailer.sent
+    assert recipient == 'ops@example.com' and 'orders.csv' in body
+    assert attachments['logs.txt'] == 'ERROR something'
+    assert 'ERROR here' in attachments['orders.csv'] and len(attachments['orders.csv']) < 1000
+    assert not list((tmp_path / 'outbox').iterdir())
+
+
+def test_failed_mail_kept(tmp_path):
+    outbox = MailOutbox(tmp_path / 'outbox')
+    outbox.enqueue('first', 'body', 'ops@example.com', [])
+    outbox.enqueue('second', 'body', 'ops@example.com', [])
+    assert outbox.flush(FakeMailer(fail=True)) == 0
+    pending = outbox.pending()
+    assert len(pending) == 2
+    assert [json.loads(path.read_text())['attempts'] for path in pending] == [1, 1]
+
+    mailer = FakeMailer()
+    assert outbox.flush(mailer) == 2
+    assert [mail[0] for mail in mailer.sent] == ['first', 'second']
+
+
+def test_failing_mail_set_aside(tmp_path):
+    outbox = MailOutbox(tmp_path / 'outbox', max_attempts=2)
+    first = outbox.enqueue('first', 'body', 'ops@example.com', [])
+    outbox.enqueue('second', 'body', 'ops@example.com', [])
+
+    class FirstFails(FakeMailer):
+        def send_mail(self, mail_obj, *args, **kwargs):
+            if mail_obj == 'first':
+                raise ValueError('rejected by the server')
+            super().send_mail(mail_obj, *args, **kwargs)
+
+    mailer = FirstFails()
+    assert outbox.flush(mailer) == 1
+    assert outbox.pending() == [first]
+    assert outbox.flush(mailer) == 0
+    assert outbox.pending() == []
+    failed = tmp_path / 'outbox' / 'failed'
+    assert json.loads((failed / first.name).read_text())['attempts'] == 2
+    assert (failed / first.with_suffix('.zip').name).is_file()
+    assert [mail[0] for mail in mailer.sent] == ['second']
+
+
+def test_abandoned_sending_mail_recovered(tmp_path):
+    outbox = MailOutbox(tmp_path / 'outbox', sending_timeout=60)
+    mail_path = outbox.enqueue('subject', 'body', 'ops@example.com', [])
+    # Processus arrete pendant l'envoi
+    sending_path = mail_path.with_suffix('.sending')
+    mail_path.replace(sending_path)
+    assert outbox.pending() == []
+
+    os.utime(sending_path, (time.time() - 120, time.time() - 120))
+    assert outbox.pending() == [mail_path]
+    mailer = FakeMailer()
+    assert outbox.flush(mailer) == 1
+    assert [mail[0] for mail in mailer.sent] == ['subject']
+
+
+@pytest.mark.parametrize("offline_connector", [SINGLE_ORDER_WITH_UNKNOWN_PAYMENT_METHOD], indirect=True)
+def test_error_report_sent_in_background(offline_connector, tmp_path):
+    offline_connector.mailer = FakeMailer()
+    offline_connector.mail_outbox = MailOutbox(tmp_path / 'outbox')
+    assert offline_connector.run() == 0
+    assert offline_connector.mail_outbox.wait(5)
+
+    (subject, _, _, attachments), = offline_connector.mailer.sent
+    assert 'Erreurs' in subject
+    assert offline_connector._logs_file_path.name in attachments
+    assert not offline_connector.mail_outbox.pending()
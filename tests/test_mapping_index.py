@@ -0,0 +1,104 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import os
+import pytest
+import shutil
+
+from pathlib import Path
+from psebpconnector import mapping_index
+from psebpconnector.connector import Connector
+from psebpconnector.mapping_index import MappingIndex
+
+
+SAMPLES = Path(__file__).parent / 'samples'
+
+
+@pytest.fixture
+def mapping_files(tmp_path):
+    payment_path = shutil.copy(SAMPLES / 'payment_method_mapping.csv', tmp_path / 'payment_method_mapping.csv')
+    vat_path = shutil.copy(SAMPLES / 'vat.csv', tmp_path / 'vat.csv')
+    return Path(payment_path), Path(vat_path)
+
+
+def test_index_matches_connector_mappings(mapping_files):
+    connector = Connector(SAMPLES / 'config/config_file_ok.ini')
+    connector.load_payment_method_mapping()
+    connector.load_vat_mapping()
+
+    index = MappingIndex.from_files(*mapping_files)
+    assert index.nested() == (connector.payment_method_mapping, connector.vat_mapping)
+    assert index.payment_method('Amazon - FR', True) == ('AMAZONFR', '€', 'France', 'AMFR')
+    assert index.payment_method('Amazon - US', True) is None
+    assert index.vat_rate('France', 8) == (0.2, '36cab0de-3e5b-4bee-a556-8eabb1673e76')
+    assert index.vat_rate('France', 999) is None
+
+
+def test_missing_exoneration(mapping_files):
+    payment_path, vat_path = mapping_files
+    lines = vat_path.read_text().splitlines(keepends=True)
+    vat_path.write_text(''.join(line for line in lines if not (line.startswith('France;') and line.rstrip().endswith(';-1'))))
+    with pytest.raises(AssertionError, match='exoneration'):
+        MappingIndex.from_files(payment_path, vat_path)
+
+
+def test_malformed_line_number(mapping_files):
+    payment_path, vat_path = mapping_files
+    with open(payment_path, 'a') as f:
+        f.write('foo;AVEC;bar\n')
+    line_count = len(payment_path.read_text().splitlines())
+    with pytest.raises(ValueError, match=f"l.{line_count}:"):
+        MappingIndex.from_files(payment_path, vat_path)
+
+
+def test_snapshot(mapping_files, tmp_path, mocker):
+    parse_vat_mapping = mocker.spy(mapping_index, 'parse_vat_mapping')
+    snapshot_path = tmp_path / 'mappings.json'
+
+    index = MappingIndex.load(*mapping_files, snapshot_path=snapshot_path)
+    assert snapshot_path.is_file()
+    cached = MappingIndex.load(*mapping_files, snapshot_path=snapshot_path)
+    assert cached.vat == index.vat and cached.payment_methods == index.payment_methods
+    assert parse_vat_mapping.call_count == 1
+
+    # Fichier source modifie : l'instantane est reconstruit
+    payment_path, vat_path = mapping_files
+    with open(vat_path, 'a') as f:
+        f.write('France;Monaco;20;;;;;;;;monaco-id;148\n')
+    os.utime(vat_path, ns=(0, vat_path.stat().st_mtime_ns + 10 ** 9))
+    assert MappingIndex.load(*mapping_files, snapshot_path=snapshot_path).vat_rate('France', 148) == (0.2, 'monaco-id')
+    assert parse_vat_mapping.call_count == 2
+
+
+def test_corrupted_snapshot(mapping_files, tmp_path):
+    snapshot_path = tmp_path / 'mappings.json'
+    snapshot_path.write_bytes(b'not json')
+    assert MappingIndex.load(*mapping_files, snapshot_path=snapshot_path).vat_rate('France', 8)
+
+    # Signature valide mais contenu mal forme : reconstruit depuis les fichiers
+    snapshot = json.loads(snapshot_path.read_text(encoding='utf-8'))
+    snapshot['vat'] = [['France', 8]]
+    snapshot_path.write_text(json.dumps(snapshot), encoding='utf-8')
+    assert MappingIndex.load(*mapping_files, snapshot_path=snapshot_path).vat_rate('France', 8)
@@ -0,0 +1,95 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from .datasets import SINGLE_ORDER_FR_ONE_PRODUCT
+from .fixtures import offline_connector
+from pathlib import Path
+from psebpconnector.connector import Connector
+from psebpconnector.metrics_exporter import MetricsExporter
+from psebpconnector.run_report import RunReport
+
+
+def _report():
+    report = RunReport()
+    report.increment('orders_processed', 3)
+    report.increment('orders_rejected')
+    report.increment('ebp_rejected_documents')
+    report.add_time('export', 1.5)
+    report.record_request('get', 'orders', 200, 0.02)
+    report.record_request('get', 'orders', 200, 0.3)
+    return report
+
+
+def test_render_counters_and_histogram(tmp_path):
+    exporter = MetricsExporter(tmp_path / 'connector.prom', labels={'shop': 'main'})
+    text = exporter.render(_report())
+
+    assert 'psebpconnector_orders_total{shop="main",kind="order",result="exported"} 3' in text
+    assert 'psebpconnector_orders_total{shop="main",kind="order",result="rejected"} 1' in text
+    assert 'psebpconnector_ebp_rejected_documents_total{shop="main"} 1' in text
+    assert 'psebpconnector_phase_duration_seconds{shop="main",phase="export"} 1.5' in text
+    assert ('psebpconnector_http_request_duration_seconds_bucket{shop="main",method="GET",endpoint="orders",le="0.025"} 1'
+            in text)
+    assert ('psebpconnector_http_request_duration_seconds_bucket{shop="main",method="GET",endpoint="orders",le="+Inf"} 2'
+            in text)
+    assert 'psebpconnector_run_in_progress{shop="main"} 1' in text
+    assert text.endswith('# EOF\n')
+
+
+def test_counters_cumulated_over_runs(tmp_path):
+    exporter = MetricsExporter(tmp_path / 'connector.prom')
+    for _ in range(2):
+        report = _report()
+        report.outcome['exit_code'] = 0
+        exporter.finish(report, True)
+
+    text = (tmp_path / 'connector.prom').read_text()
+    assert 'psebpconnector_orders_total{kind="order",result="exported"} 6' in text
+    assert 'psebpconnector_runs_total{result="success"} 2' in text
+    assert 'psebpconnector_last_run_success 1' in text
+    assert 'psebpconnector_run_in_progress 0' in text
+    assert not (tmp_path / 'connector.prom.tmp').exists()
+
+
+def test_counter_families_without_total_suffix(tmp_path):
+    text = MetricsExporter(tmp_path / 'connector.prom').render(_report())
+
+    assert '# TYPE psebpconnector_orders counter' in text
+    assert '# HELP psebpconnector_orders ' in text
+    assert 'psebpconnector_orders_total{kind="order",result="exported"} 3' in text
+    assert '_total counter' not in text
+
+
+def test_connector_writes_textfile(offline_connector, mocker, tmp_path):
+    mocker.patch("psebpconnector.webservice.Webservice.get_orders_to_export", return_value=SINGLE_ORDER_FR_ONE_PRODUCT)
+    textfile_path = tmp_path / 'connector.prom'
+    config_path = tmp_path / 'config.ini'
+    config_path.write_text((Path(__file__).parent / 'samples/config/config_file_ok.ini').read_text()
+                           + f"\n[metrics]\ntextfile_path = {textfile_path}\ninterval = 0\n")
+    connector = Connector(config_path, working_directory=tmp_path)
+
+    assert connector.run() == 0
+    text = textfile_path.read_text()
+    assert 'psebpconnector_orders_total{shop="mywebsite.com",kind="order",result="exported"} 1' in text
+    assert 'psebpconnector_phase_duration_seconds{shop="mywebsite.com",phase="export"}' in text
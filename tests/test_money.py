@@ -0,0 +1,103 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+
+from .fake_webservice import FakeDataset
+from .fixtures import fake_webservice, write_online_config
+from datetime import datetime
+from pathlib import Path
+from psebpconnector import money
+from psebpconnector.connector import Connector
+from psebpconnector.models import Order
+
+GOLDEN = Path(__file__).parent / 'samples/golden'
+
+
+def golden_dataset() -> FakeDataset:
+    """ Fake shop with discounts, foreign currencies and odd amounts, on top of the usual orders and refunds """
+    dataset = FakeDataset(orders=60, addresses=40, products=30, refund_ratio=0.25, seed=48)
+    for order_id, order in dataset.orders.items():
+        if order_id % 4 == 0:
+            order['total_discounts'] = f"{(order_id % 9 + 1) * 1.37:.6f}"
+        if order_id % 5 == 0:
+            order['conversion_rate'] = '1.087300'
+        if order_id % 7 == 0:
+            order['total_shipping'] = order['total_shipping_tax_incl'] = '3.333333'
+            order['total_shipping_tax_excl'] = '2.777778'
+    return dataset
+
+
+def run_csv_files(fake_webservice, tmp_path):
+    """ :return: the products and orders CSV files of a run, the document date replaced by a placeholder """
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    today = datetime.now().strftime('%d/%m/%Y')
+    return [path.read_text(encoding='utf-8-sig').replace(today, 'DD/MM/YYYY')
+            for path in (connector._csv_products_path, connector._csv_orders_path)]
+
+
+@pytest.mark.parametrize('value, micro', [
+    ('12.340000', 12_340_000), ('-0.5', -500_000), ('7', 7_000_000), ('.25', 250_000), ('1.2345675', 1_234_568),
+    (0.2, 200_000), (3, 3_000_000), (1e-05, 10), (' 4.9 ', 4_900_000),
+])
+def test_parse(value, micro):
+    assert money.parse(value) == micro
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '1.2.3'])
+def test_parse_invalid(value):
+    with pytest.raises(ValueError):
+        money.parse(value)
+
+
+def test_divide_and_format():
+    assert money.divide(7, 2) == 4 and money.divide(-7, 2) == -4 and money.divide(7, 3) == 2
+    assert money.format_amount(money.parse('4.9')) == '4.900000'
+    assert money.format_amount(-1_500) == '-0.001500'
+    assert money.format_short(20_000_000) == '20.0' and money.format_short(5_500_000) == '5.5'
+    with pytest.raises(ZeroDivisionError):
+        money.divide(1, 0)
+
+
+def test_order_amounts():
+    order = Order(id=1, total_products_wt='120.000000', total_discounts='7.000000', total_shipping='4.900000',
+                  conversion_rate='1.087300')
+    amounts = money.OrderAmounts.from_order(order, 0.2)
+    assert (amounts.vat_rate, amounts.shipping_vat_rate) == ('20.000000', '20.0')
+    assert (amounts.discount_pct, amounts.shipping_notax, amounts.total) == ('5.833333', '4.083333', '')
+    assert (amounts.currency_rate, amounts.currency_amount) == ('1.087300', '124.900000')
+
+    amounts = money.OrderAmounts.from_order(Order(id=1, total_products_wt='0.1', total_shipping='0.2'), 0.055)
+    assert (amounts.total, amounts.shipping_vat_rate, amounts.foreign_currency) == ('0.300000', '5.5', False)
+    assert amounts.currency_amount == amounts.currency_shipping_notax == ''
+
+
+@pytest.mark.parametrize('fake_webservice', [golden_dataset()], indirect=True)
+def test_golden_csv_files(fake_webservice, tmp_path):
+    products, orders = run_csv_files(fake_webservice, tmp_path)
+    assert products == (GOLDEN / 'products.csv').read_text(encoding='utf-8')
+    assert orders == (GOLDEN / 'orders.csv').read_text(encoding='utf-8')
@@ -0,0 +1,129 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+import threading
+
+from .fake_webservice import FakeDataset, FakeWebservice
+from .fixtures import write_online_config
+from psebpconnector.multi_shop import MultiShopRunner
+from psebpconnector.shared_resources import DatabaseLocks, MappingCache
+
+
+@pytest.fixture
+def shops(tmp_path):
+    webservices = [FakeWebservice(FakeDataset(orders=5 * (index + 1), seed=index)) for index in range(2)]
+    config_paths = []
+    for index, webservice in enumerate(webservices):
+        webservice.start()
+        working_directory = tmp_path / f"shop{index + 1}"
+        working_directory.mkdir()
+        config_paths.append(write_online_config(working_directory / 'config.ini', webservice.url, working_directory,
+                                                tmp_path / 'database.ebp'))
+    yield webservices, config_paths
+    for webservice in webservices:
+        webservice.stop()
+
+
+def test_run_all_shops(shops):
+    webservices, config_paths = shops
+    runner = MultiShopRunner(config_paths)
+
+    assert list(runner.connectors) == ['shop1', 'shop2']
+    assert runner.run() == 0
+    assert runner.exit_codes == {'shop1': 0, 'shop2': 0}
+    for webservice, connector in zip(webservices, runner.connectors.values()):
+        dataset = webservice.dataset
+        assert len(connector.pending_orders) == len(dataset.orders)
+        assert all(printed['exported'] in ('1', '2') for printed in dataset.orders_printed.values())
+        counters = connector.report.counters
+        assert counters.get('orders_marked_exported', 0) + counters.get('refunds_marked_exported', 0) == len(dataset.orders)
+    # Fichiers de mapping communs aux deux boutiques : parses une seule fois
+    assert runner.mapping_cache.parse_count == 1
+
+
+def test_pool_kept_between_runs(shops):
+    _, config_paths = shops
+    runner = MultiShopRunner(config_paths)
+    closed_sessions = []
+    for name, connector in runner.connectors.items():
+        webservice = connector.webservice
+        close_thread_session = webservice._close_thread_session
+
+        def close_and_count(name=name, close_thread_session=close_thread_session):
+            if threading.current_thread().name.startswith('shop_'):
+                closed_sessions.append(name)
+            close_thread_session()
+
+        webservice._close_thread_session = close_and_count
+
+    assert runner.run() == 0
+    assert runner.run() == 0
+    # Pas de nouveau pool par cycle, et la session de chaque boutique est fermee dans le thread qui l'a ouverte
+    assert len([thread for thread in threading.enumerate() if thread.name.startswith('shop_')]) <= 2
+    assert sorted(closed_sessions) == ['shop1', 'shop1', 'shop2', 'shop2']
+    runner.close()
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith('shop_')]
+
+
+def test_shop_loggers(shops):
+    _, config_paths = shops
+    runner = MultiShopRunner(config_paths)
+    shop1, shop2 = runner.connectors.values()
+
+    assert shop1.logger.name == 'ps_ebp_connector.shop1'
+    assert not shop1.logger.propagate
+    shop1.logger.error('shop1 only')
+    assert shop1.errors_logged()
+    assert not shop2.errors_logged()
+
+
+def test_shared_working_directory(shops, tmp_path):
+    _, config_paths = shops
+    text = config_paths[1].read_text().replace(str(tmp_path / 'shop2'), str(tmp_path / 'shop1'))
+    config_paths[1].write_text(text)
+    with pytest.raises(ValueError):
+        MultiShopRunner(config_paths)
+
+
+def test_mapping_cache(tmp_path):
+    path = tmp_path / 'mapping.csv'
+    path.write_text('a')
+    cache = MappingCache()
+    calls = []
+
+    def parse():
+        calls.append(path.read_text())
+        return {'content': path.read_text()}
+
+    assert cache.get([path], parse) is cache.get([tmp_path / '.' / 'mapping.csv'], parse)
+    path.write_text('bb')
+    assert cache.get([path], parse) == {'content': 'bb'}
+    assert calls == ['a', 'bb']
+
+
+def test_database_locks(tmp_path):
+    locks = DatabaseLocks()
+    assert locks.lock(tmp_path / 'a.ebp') is locks.lock(tmp_path / 'x' / '..' / 'a.ebp')
+    assert locks.lock(tmp_path / 'a.ebp') is not locks.lock(tmp_path / 'b.ebp')
@@ -0,0 +1,178 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import http.client
+import pytest
+import requests
+import threading
+import time
+
+from .fixtures import fake_webservice, offline_connector, online_connector
+from psebpconnector.order_trigger import OrderQueue, OrderTrigger, SpoolDirectoryWatcher, parse_order_ids
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"id_order": 12}', [12]),
+    ('{"ids": [12, 13]}', [12, 13]),
+    ('[12, "13"]', [12, 13]),
+    ('14', [14]),
+    ('id_order=12&id_order=13', [12, 13]),
+    ('12, 13\n14', [12, 13, 14]),
+    ('', []),
+])
+def test_parse_order_ids(text, expected):
+    assert parse_order_ids(text) == expected
+
+
+@pytest.mark.parametrize("text", ['foo bar', '{"ids": null}', '[1, {"a": 1}]', '{"id_order": [[12]]}'])
+def test_parse_invalid_order_ids(text):
+    with pytest.raises(ValueError):
+        parse_order_ids(text)
+
+
+def test_queue_batch_by_size():
+    queue = OrderQueue()
+    queue.put([1, 2, 2, 3])
+    assert len(queue) == 3
+    assert queue.take_batch(2, 60, threading.Event()) == [1, 2]
+    assert len(queue) == 1
+
+
+def test_queue_batch_by_window():
+    queue = OrderQueue()
+    queue.put([1])
+    start = time.monotonic()
+    assert queue.take_batch(10, 0.2, threading.Event()) == [1]
+    assert time.monotonic() - start >= 0.2
+
+
+def test_queue_delayed_ids():
+    queue = OrderQueue()
+    queue.put([1, 2], delay=0.3)
+    queue.put([3])
+    start = time.monotonic()
+    assert queue.take_batch(10, 0, threading.Event()) == [3]
+    assert queue.take_batch(10, 0, threading.Event()) == [1, 2]
+    assert time.monotonic() - start >= 0.3
+
+    # Une nouvelle notification rend la commande disponible tout de suite
+    queue.put([4], delay=60)
+    queue.put([4])
+    assert queue.take_batch(10, 0, threading.Event()) == [4]
+
+
+def test_queue_stop():
+    stop = threading.Event()
+    stop.set()
+    assert OrderQueue().take_batch(10, 60, stop) == []
+
+
+def test_http_endpoint(offline_connector):
+    trigger = OrderTrigger(offline_connector, listen=('127.0.0.1', 0), token='secret')
+    trigger.start()
+    try:
+        host, port = trigger.server_address
+        url = f"http://{host}:{port}"
+        assert requests.post(f"{url}/orders", json={'ids': [1, 2]}).status_code == 403
+        assert requests.post(f"{url}/orders", data='1, 2', headers={'X-Connector-Token': 'secret'}).status_code == 202
+        assert requests.post(f"{url}/orders", data='foo', headers={'X-Connector-Token': 'secret'}).status_code == 400
+        assert requests.get(f"{url}/health").json() == {'queued': 2}
+
+        connection = http.client.HTTPConnection(host, port)
+        connection.putrequest('POST', '/orders')
+        connection.putheader('X-Connector-Token', 'secret')
+        connection.putheader('Content-Length', 'abc')
+        connection.endheaders()
+        assert connection.getresponse().status == 400
+        connection.close()
+    finally:
+        trigger.stop()
+
+    # Les IDs acceptes sont sur disque : un nouveau processus les remet en file
+    restarted = OrderTrigger(offline_connector, listen=('127.0.0.1', 0))
+    restarted._watcher.scan()
+    assert restarted.queue.take_batch(10, 0, threading.Event()) == [1, 2]
+    restarted.stop()
+
+
+def test_spool_directory(tmp_path):
+    queue = OrderQueue()
+    (tmp_path / 'a.txt').write_text('1\n2\n')
+    (tmp_path / 'b.tmp').write_text('3')
+    (tmp_path / 'c.txt').write_text('foo')
+    (tmp_path / 'd.json').write_text('{"ids": null}')
+    watcher = SpoolDirectoryWatcher(tmp_path, queue, threading.Event())
+    watcher.scan()
+
+    assert queue.take_batch(10, 0, threading.Event()) == [1, 2]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a.txt', 'b.tmp', 'c.txt.error', 'd.json.error']
+
+    # Le fichier reste jusqu'a l'export de toutes ses commandes, sans etre remis en file
+    watcher.scan()
+    assert len(queue) == 0
+    watcher.acknowledge([1])
+    assert (tmp_path / 'a.txt').exists()
+    watcher.acknowledge([2])
+    assert not (tmp_path / 'a.txt').exists()
+
+
+def test_failed_micro_batch_queued_again(offline_connector, mocker):
+    spool_directory = offline_connector.config.working_directory / 'spool'
+    spool_directory.mkdir()
+    spooled = []
+
+    def failing_run(order_ids):
+        spooled.append(len(list(spool_directory.glob('*.json'))))
+        return [1, 1, 0][len(spooled) - 1]
+
+    run = mocker.patch.object(offline_connector, 'run', side_effect=failing_run)
+    trigger = OrderTrigger(offline_connector, spool_directory=spool_directory,
+                           batch_size=2, batch_window=0, retry_delay=0.1, max_retry_delay=0.15)
+    trigger._watcher.write([1, 2])
+    start = time.monotonic()
+    trigger.run_forever(max_batches=3)
+
+    assert trigger.exit_codes == [1, 1, 0]
+    assert [call.kwargs['order_ids'] for call in run.call_args_list] == [[1, 2]] * 3
+    # Backoff : 0,1 s puis 0,15 s (plafond) au lieu de 0,2 s
+    assert time.monotonic() - start >= 0.25
+    assert len(trigger.queue) == 0 and trigger._failures == {}
+    # Le fichier de spool survit aux echecs et disparait apres l'export
+    assert spooled == [1, 1, 1]
+    assert list(spool_directory.iterdir()) == []
+
+
+def test_micro_batch_exports_only_notified_orders(online_connector, fake_webservice):
+    dataset = fake_webservice.dataset
+    to_export = [order_id for order_id, printed in dataset.orders_printed.items() if printed['exported'] == '0']
+    notified = to_export[:3]
+
+    trigger = OrderTrigger(online_connector, spool_directory=online_connector.config.working_directory / 'spool',
+                           batch_size=3)
+    trigger.queue.put(notified)
+    trigger.run_forever(max_batches=1)
+
+    assert trigger.exit_codes == [0]
+    assert [order.id for order in online_connector.pending_orders] == notified
+    assert [order_id for order_id in to_export if dataset.orders_printed[order_id]['exported'] == '1'] == notified
@@ -26,6 +26,7 @@ import pytest
 
 from .datasets import *
 from .fixtures import offline_connector
+from dataclasses import replace
 from pathlib import Path
 from psebpconnector.connector import Connector
 from psebpconnector.export_models import ExportOrderRow, ExportProduct
@@ -200,3 +201,21 @@ def test_orders_semicolon(offline_connector, mocker):
     assert order.document_delivery_city == "VILLE"
     assert order.document_delivery_lastname == "DUPONT"
     assert order.document_delivery_firstname == "JEAN"
+
+
+@pytest.mark.parametrize("offline_connector, cause", [
+    (SINGLE_ORDER_WITH_UNKNOWN_PAYMENT_METHOD, 'unknown_payment_method'),
+    ([replace(SINGLE_ORDER_FR_ONE_PRODUCT[0], associations={'order_rows': []})], 'no_order_rows'),
+    ([replace(SINGLE_ORDER_FR_ONE_PRODUCT[0],
+              associations={'order_rows': [{**SINGLE_ORDER_FR_ONE_PRODUCT[0].associations['order_rows'][0],
+                                            'product_id': 0}]})], 'invalid_product_id'),
+], indirect=['offline_connector'])
+def test_offline_rejection_without_http_call(offline_connector, cause, mocker):
+    get_address = mocker.patch("psebpconnector.webservice.Webservice.get_address")
+    get_product = mocker.patch("psebpconnector.webservice.Webservice.get_product")
+
+    offline_connector.run()
+
+    assert not get_address.called and not get_product.called
+    assert offline_connector.report.rejections == {cause: 1}
+    assert offline_connector.report.to_dict()['rejections'] == {cause: 1}
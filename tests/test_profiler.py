@@ -0,0 +1,90 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import csv
+import pstats
+import pytest
+
+from .datasets import SINGLE_ORDER_FR_ONE_PRODUCT
+from .fixtures import fake_webservice, offline_connector
+from pathlib import Path
+from psebpconnector.command import PROFILE_MODES
+from psebpconnector.connector import Connector
+from psebpconnector.exceptions import BadHTTPCode
+from psebpconnector.profiler import Profiler
+from psebpconnector.webservice import Webservice
+
+
+def test_connector_profiling(offline_connector, mocker):
+    mocker.patch("psebpconnector.webservice.Webservice.get_orders_to_export", return_value=SINGLE_ORDER_FR_ONE_PRODUCT)
+    connector = Connector(Path(__file__).parent / 'samples/config/config_file_ok.ini', profile='all')
+    assert connector.run() == 0
+
+    profiler = connector.profiler
+    for phase in ['load_mappings', 'export', 'import', 'writeback']:
+        assert pstats.Stats(str(profiler._path(phase, 'pstats'))).total_calls > 0
+        assert profiler._path(phase, 'folded').is_file()
+    with open(profiler._path('summary', 'csv'), encoding='utf-8') as f:
+        phases = {row['phase'] for row in csv.DictReader(f, delimiter=';')}
+    assert {'load_mappings', 'export', 'import', 'writeback'} <= phases
+
+
+def test_invalid_profiling_mode(tmp_path):
+    with pytest.raises(ValueError):
+        Profiler(tmp_path, 'run', 'foo')
+    assert PROFILE_MODES == Profiler.MODES
+
+
+def test_sampling_profiler_collapsed_stacks(tmp_path):
+    profiler = Profiler(tmp_path, 'run', 'sampling', sampling_interval=0.001)
+    with profiler.phase('busy'):
+        sum(i * i for i in range(2000000))
+    profiler.close()
+
+    lines = (tmp_path / 'profile_run_busy.folded').read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert 'test_profiler:test_sampling_profiler_collapsed_stacks' in stack
+    assert int(count) > 0
+    assert not (tmp_path / 'profile_run_busy.pstats').exists()
+
+
+def test_http_trace(fake_webservice, tmp_path):
+    profiler = Profiler(tmp_path, 'run', 'cprofile')
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    webservice.request_listeners.append(profiler.trace_request)
+    with profiler.phase('fetch'):
+        webservice.get_address(1)
+        with pytest.raises(BadHTTPCode):
+            webservice.get_product(999999)
+    profiler.close()
+
+    with open(tmp_path / 'http_trace_run.csv', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f, delimiter=';'))
+    # Produit inexistant : la liste projetee repond 200 et vide, l'appel direct de repli repond 404
+    assert [(row['phase'], row['endpoint'], row['status_code']) for row in rows] == [('fetch', 'addresses', '200'),
+                                                                                     ('fetch', 'products', '200'),
+                                                                                     ('fetch', 'products', '404')]
+    assert profiler.summary['fetch']['http_calls'] == 3
+    assert profiler.summary['fetch']['http_time'] <= profiler.summary['fetch']['wall_time']
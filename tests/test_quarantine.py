@@ -0,0 +1,105 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from .fixtures import fake_webservice, write_online_config
+from psebpconnector.connector import Connector
+from psebpconnector.models import Order
+from psebpconnector.quarantine import Quarantine
+
+
+def test_backoff_schedule(tmp_path):
+    quarantine = Quarantine(tmp_path / 'quarantine.json', base_delay=10, max_delay=25)
+    order = Order(id=12, date_upd='2024-01-01 00:00:00')
+    signature = (1, 2)
+
+    quarantine.add(order, 'unknown_payment_method', signature, now=1000)
+    assert quarantine.entry(12, False)['retry_at'] == 1010
+    assert quarantine.should_skip(12, False, order.date_upd, signature, now=1009)
+    assert not quarantine.should_skip(12, False, order.date_upd, signature, now=1010)
+    assert not quarantine.should_skip(12, True, order.date_upd, signature, now=1009)
+
+    quarantine.add(order, 'unknown_payment_method', signature, now=1010)
+    assert quarantine.entry(12, False)['retry_at'] == 1030
+    quarantine.add(order, 'unknown_payment_method', signature, now=1030)
+    entry = quarantine.entry(12, False)
+    assert entry['retry_at'] == 1055 and entry['failures'] == 3 and entry['first_failure'] == 1000
+
+
+def test_changed_order_or_mappings_retried_at_once(tmp_path):
+    quarantine = Quarantine(tmp_path / 'quarantine.json')
+    quarantine.add(Order(id=12, date_upd='2024-01-01 00:00:00'), 'no_order_rows', (1, 2), now=1000)
+
+    assert quarantine.should_skip(12, False, '2024-01-01 00:00:00', (1, 2), now=1001)
+    assert not quarantine.should_skip(12, False, '2024-01-02 00:00:00', (1, 2), now=1001)
+    assert not quarantine.should_skip(12, False, '2024-01-01 00:00:00', (1, 3), now=1001)
+
+
+def test_persistence(tmp_path):
+    path = tmp_path / 'quarantine.json'
+    quarantine = Quarantine(path)
+    quarantine.add(Order(id=12), 'no_order_rows', (1, 2))
+    quarantine.add(Order(id=13, is_refund=True), 'unknown_currency', (1, 2))
+    quarantine.remove(Order(id=12))
+    quarantine.save()
+
+    reloaded = Quarantine(path)
+    assert reloaded.order_count == 1
+    assert reloaded.entry(13, True)['cause'] == 'unknown_currency'
+
+    path.write_text('{not json', encoding='utf-8')
+    assert Quarantine(path).order_count == 0
+
+
+def test_connector_skips_quarantined_orders(fake_webservice, tmp_path):
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    with config_path.open('a') as config_file:
+        config_file.write("[quarantine]\n")
+    dataset = fake_webservice.dataset
+    order_id = next(order_id for order_id, printed in dataset.orders_printed.items()
+                    if printed['exported'] == '0' and dataset.orders[order_id]['current_state'] in ('2', '4', '5'))
+    payment, dataset.orders[order_id]['payment'] = dataset.orders[order_id]['payment'], 'Unknown payment method'
+
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert connector.report.rejections == {'unknown_payment_method': 1}
+    assert connector.quarantine.entry(order_id, False)['cause'] == 'unknown_payment_method'
+    assert order_id not in [order.id for order in connector.pending_orders]
+
+    # Run suivant, commande inchangee : ni rechargee ni rejetee a nouveau
+    orders_calls = fake_webservice.request_counter.get('GET orders', 0)
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert fake_webservice.request_counter.get('GET orders', 0) == orders_calls
+    assert connector.report.counters['quarantine_skipped'] == 1
+    assert connector.report.rejections == {}
+
+    # Commande corrigee dans Prestashop : retentee tout de suite et sortie de la quarantaine
+    dataset.orders[order_id]['payment'] = payment
+    dataset.orders[order_id]['date_upd'] = '2030-01-01 00:00:00'
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert order_id in [order.id for order in connector.pending_orders]
+    assert connector.quarantine.entry(order_id, False) is None
+    assert Quarantine(tmp_path / 'quarantine.json').order_count == 0
@@ -0,0 +1,120 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import time
+
+from .fixtures import fake_webservice
+from psebpconnector.reference_data import ReferenceData
+from psebpconnector.webservice import Webservice
+
+
+def _calls(fake_webservice):
+    return fake_webservice.request_counter.get('GET countries', 0)
+
+
+def test_snapshot_warm_start(fake_webservice, tmp_path):
+    path = tmp_path / 'reference_data.json'
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), path, ttl=3600)
+    reference_data.ensure_loaded()
+    assert reference_data.countries[8] == 'FR'
+    assert path.is_file()
+
+    calls = _calls(fake_webservice)
+    warm = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), path, ttl=3600)
+    warm.ensure_loaded()
+    assert warm.countries == reference_data.countries
+    assert warm.currencies == {1: 'EUR'}
+    assert _calls(fake_webservice) == calls
+
+
+def test_expired_snapshot_refreshed_in_background(fake_webservice, tmp_path):
+    path = tmp_path / 'reference_data.json'
+    path.write_text(json.dumps({'url': fake_webservice.url, 'fetched_at': time.time() - 7200,
+                                'countries': {'8': 'FR'}, 'currencies': {'1': 'EUR'}}))
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), path, ttl=3600)
+    reference_data.ensure_loaded()
+    # Les donnees de l'instantane sont disponibles tout de suite
+    assert reference_data.countries[8] == 'FR'
+    reference_data._refresh_thread.join(5)
+    assert not reference_data.expired
+    assert reference_data.countries[1] == 'DE'
+    assert json.loads(path.read_text())['countries']['1'] == 'DE'
+
+
+def test_snapshot_of_another_shop_ignored(fake_webservice, tmp_path):
+    path = tmp_path / 'reference_data.json'
+    path.write_text(json.dumps({'url': 'https://another.shop/api', 'fetched_at': time.time(),
+                                'countries': {'8': 'XX'}, 'currencies': {'1': 'EUR'}}))
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), path, ttl=3600)
+    reference_data.ensure_loaded()
+    assert reference_data.countries[8] == 'FR'
+
+
+def test_snapshot_disabled(fake_webservice, tmp_path):
+    path = tmp_path / 'reference_data.json'
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), path, ttl=0)
+    reference_data.ensure_loaded()
+    assert reference_data.countries[8] == 'FR'
+    assert not path.exists()
+
+
+def test_unknown_id_lookup(fake_webservice, tmp_path):
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), tmp_path / 'reference_data.json',
+                                   ttl=3600)
+    reference_data.ensure_loaded()
+    del reference_data.countries[8]
+
+    calls = _calls(fake_webservice)
+    assert reference_data.country_iso_code(8) == 'FR'
+    assert reference_data.country_iso_code(8) == 'FR'
+    assert _calls(fake_webservice) == calls + 1
+    assert reference_data.country_iso_code(999) is None
+    assert reference_data.currency_iso_code(1) == 'EUR'
+
+
+def test_unknown_id_not_looked_up_again(fake_webservice, tmp_path):
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), tmp_path / 'reference_data.json',
+                                   ttl=3600, missing_ttl=0.2)
+    reference_data.ensure_loaded()
+
+    calls = _calls(fake_webservice)
+    assert reference_data.country_iso_code(999) is None
+    assert reference_data.country_iso_code(999) is None
+    assert _calls(fake_webservice) == calls + 1
+    time.sleep(0.2)
+    assert reference_data.country_iso_code(999) is None
+    assert _calls(fake_webservice) == calls + 2
+
+
+def test_refresh_drops_deactivated_entries(fake_webservice, tmp_path):
+    path = tmp_path / 'reference_data.json'
+    path.write_text(json.dumps({'url': fake_webservice.url, 'fetched_at': time.time() - 7200,
+                                'countries': {'8': 'FR', '9999': 'XX'}, 'currencies': {'1': 'EUR'}}))
+    reference_data = ReferenceData(Webservice(fake_webservice.url, 'APIKEY'), path, ttl=3600)
+    reference_data.ensure_loaded()
+    reference_data._refresh_thread.join(5)
+
+    assert reference_data.countries[8] == 'FR' and 9999 not in reference_data.countries
+    assert '9999' not in json.loads(path.read_text())['countries']
@@ -0,0 +1,81 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import pytest
+
+from .datasets import SINGLE_ORDER_FR_ONE_PRODUCT, SINGLE_ORDER_WITH_UNKNOWN_PAYMENT_METHOD
+from .fixtures import fake_webservice, offline_connector
+from psebpconnector.run_report import RunReport
+from psebpconnector.webservice import Webservice
+
+
+@pytest.mark.parametrize("offline_connector", [SINGLE_ORDER_FR_ONE_PRODUCT], indirect=True)
+def test_report_written_next_to_logs(offline_connector):
+    assert offline_connector.run() == 0
+    assert offline_connector._run_report_path.parent == offline_connector._logs_file_path.parent
+
+    report = json.loads(offline_connector._run_report_path.read_text())
+    for phase in ['load_mappings', 'authentication', 'reference_data', 'export', 'fetch', 'transform', 'csv_write',
+                  'import', 'writeback']:
+        assert phase in report['phases']
+    assert report['counters']['orders_processed'] == 1
+    assert report['counters']['rows_exported'] == 1
+    assert report['counters']['product_cache_misses'] == 1
+    assert report['outcome']['exit_code'] == 0
+
+
+@pytest.mark.parametrize("offline_connector", [SINGLE_ORDER_WITH_UNKNOWN_PAYMENT_METHOD], indirect=True)
+def test_report_rejected_orders(offline_connector):
+    offline_connector.run()
+    report = json.loads(offline_connector._run_report_path.read_text())
+    assert report['counters']['orders_rejected'] == 1
+    assert report['outcome']['order_error_counter'] == 1
+
+
+def test_report_http_requests(fake_webservice):
+    report = RunReport()
+    webservice = Webservice(fake_webservice.url, 'APIKEY', report)
+    orders = list(webservice.get_orders_to_export(['2', '4', '5'], ['7']))
+    webservice.get_address(1)
+
+    endpoints = report.to_dict()['http']['endpoints']
+    assert endpoints['GET orders']['count'] == len(orders)
+    assert endpoints['GET addresses']['count'] == 1
+    assert endpoints['GET orders_with_printed']['count'] >= 2
+    assert sum(endpoints['GET orders']['histogram'].values()) == len(orders)
+
+
+def test_report_latency_histogram():
+    report = RunReport()
+    report.record_request('get', 'orders', 200, 0.003)
+    report.record_request('get', 'orders', 500, 0.2)
+    report.record_request('get', 'orders', None, 60)
+
+    stats = report.to_dict()['http']['endpoints']['GET orders']
+    assert stats['count'] == 3
+    assert stats['errors'] == 2
+    assert stats['histogram']['le_0.005'] == 1
+    assert stats['histogram']['le_0.25'] == 1
+    assert stats['histogram']['le_inf'] == 1
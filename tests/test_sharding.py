@@ -0,0 +1,118 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+
+from .fake_webservice import FakeDataset, FakeWebservice
+from .fixtures import write_online_config
+from psebpconnector.connector import Connector
+from psebpconnector.ledger import ExportLedger
+from psebpconnector.quarantine import Quarantine
+from psebpconnector.sharding import split_id_range
+
+
+@pytest.mark.parametrize("first, last, shards, expected", [
+    (1, 10, 2, [(1, 5), (6, 10)]),
+    (1, 10, 3, [(1, 4), (5, 8), (9, 10)]),
+    (5, 6, 4, [(5, 5), (6, 6)]),
+    (7, 7, 2, [(7, 7)]),
+])
+def test_split_id_range(first, last, shards, expected):
+    assert split_id_range(first, last, shards) == expected
+
+
+def _run(tmp_path, name, shards, empty_ean13=False, extra_config=''):
+    dataset = FakeDataset(orders=40, addresses=30, products=15, refund_ratio=0.25, seed=3)
+    if empty_ean13:
+        for product in dataset.products.values():
+            product['ean13'] = ''
+    working_directory = tmp_path / name
+    working_directory.mkdir()
+    with FakeWebservice(dataset) as webservice:
+        config_path = write_online_config(working_directory / 'config.ini', webservice.url, working_directory,
+                                          working_directory / 'database.ebp')
+        with config_path.open('a') as config_file:
+            config_file.write(extra_config)
+        connector = Connector(config_path)
+        assert connector.run(shards=shards) == 0
+    return connector, dataset
+
+
+def test_sharded_export_matches_sequential_export(tmp_path):
+    sequential, sequential_dataset = _run(tmp_path, 'sequential', 0)
+    sharded, sharded_dataset = _run(tmp_path, 'sharded', 3)
+
+    assert sharded._csv_orders_path.read_text(encoding='utf-8-sig') == \
+        sequential._csv_orders_path.read_text(encoding='utf-8-sig')
+    sharded_products = sharded._csv_products_path.read_text(encoding='utf-8-sig').splitlines()
+    assert len(sharded_products) == len(set(sharded_products))
+    assert sorted(sharded_products) == sorted(sequential._csv_products_path.read_text(encoding='utf-8-sig').splitlines())
+
+    assert [(order.id, order.is_refund) for order in sharded.pending_orders] == \
+        [(order.id, order.is_refund) for order in sequential.pending_orders]
+    assert {order_id: printed['exported'] for order_id, printed in sharded_dataset.orders_printed.items()} == \
+        {order_id: printed['exported'] for order_id, printed in sequential_dataset.orders_printed.items()}
+    assert sharded.report.counters['orders_processed'] == sequential.report.counters['orders_processed']
+    assert 'shards.fetch' in sharded.report.phases
+
+
+def test_sharded_export_keeps_products_without_ean13(tmp_path):
+    sequential, _ = _run(tmp_path, 'sequential', 0, empty_ean13=True)
+    sharded, _ = _run(tmp_path, 'sharded', 3, empty_ean13=True)
+
+    sequential_products = sequential._csv_products_path.read_text(encoding='utf-8-sig').splitlines()
+    assert len(sequential_products) > 1
+    assert sorted(sharded._csv_products_path.read_text(encoding='utf-8-sig').splitlines()) == \
+        sorted(sequential_products)
+
+
+def test_sharded_export_records_the_main_run_in_the_ledger(tmp_path):
+    connector, _ = _run(tmp_path, 'sharded', 3, extra_config="[ledger]\n")
+
+    ledger = ExportLedger(tmp_path / 'sharded' / 'ledger.sqlite')
+    entries = ledger.run(connector.run_id)
+    ledger.close()
+    assert sorted((entry.order_id, entry.is_refund) for entry in entries) == \
+        sorted((order.id, order.is_refund) for order in connector.pending_orders)
+    assert not list((tmp_path / 'sharded').glob('shards_*/shard*/ledger.sqlite'))
+
+
+def test_sharded_export_records_rejections_in_quarantine(tmp_path):
+    dataset = FakeDataset(orders=40, addresses=30, products=15, refund_ratio=0.25, seed=3)
+    order_id = next(order_id for order_id, printed in dataset.orders_printed.items()
+                    if printed['exported'] == '0' and dataset.orders[order_id]['current_state'] in ('2', '4', '5'))
+    dataset.orders[order_id]['payment'] = 'Unknown payment method'
+    with FakeWebservice(dataset) as webservice:
+        config_path = write_online_config(tmp_path / 'config.ini', webservice.url, tmp_path, tmp_path / 'database.ebp')
+        with config_path.open('a') as config_file:
+            config_file.write("[quarantine]\n")
+        connector = Connector(config_path)
+        assert connector.run(shards=3) == 0
+        assert Quarantine(tmp_path / 'quarantine.json').entry(order_id, False)['cause'] == 'unknown_payment_method'
+
+        # Run suivant : la commande en quarantaine est ignoree par le worker qui la scanne
+        connector = Connector(config_path)
+        assert connector.run(shards=3) == 0
+        assert connector.report.counters['quarantine_skipped'] == 1
+        assert Quarantine(tmp_path / 'quarantine.json').entry(order_id, False)['failures'] == 1
@@ -0,0 +1,201 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pytest
+import threading
+import time
+
+from .fixtures import fake_webservice, get_address, get_product, offline_connector
+from psebpconnector.exceptions import BadHTTPCode
+from psebpconnector.models import Address, Product
+from psebpconnector.projections import ADDRESS_FIELDS, PRODUCT_FIELDS
+from psebpconnector.run_report import RunReport
+from psebpconnector.webservice import Webservice
+
+
+def test_authentication(fake_webservice):
+    assert Webservice(fake_webservice.url, 'APIKEY').test_api_authentication()
+
+
+def test_reference_data(fake_webservice):
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    assert webservice.get_countries_iso_code()[8] == 'FR'
+    assert webservice.get_currencies_iso_code() == {1: 'EUR'}
+
+
+def test_orders_to_export_pagination(fake_webservice):
+    dataset = fake_webservice.dataset
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    orders = list(webservice.get_orders_to_export(['2', '4', '5'], ['7']))
+
+    expected_refunds = {order_id for order_id, printed in dataset.orders_printed.items() if printed['exported'] == '1'}
+    assert len(orders) == len(dataset.orders)
+    assert {order.id for order in orders} == set(dataset.orders)
+    assert {order.id for order in orders if order.is_refund} == expected_refunds
+    assert fake_webservice.request_counter['GET orders'] == len(dataset.orders)
+
+
+def test_set_order_exported(fake_webservice):
+    dataset = fake_webservice.dataset
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    order = next(webservice.get_orders_to_export(['2', '4', '5'], ['7']))
+    webservice.set_order_exported(order)
+
+    assert dataset.orders_printed[order.id]['exported'] == '1'
+    assert order.id not in {o.id for o in webservice.get_orders_to_export(['2', '4', '5'], [])}
+
+
+def test_resources_not_found(fake_webservice):
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    with pytest.raises(BadHTTPCode):
+        webservice.get_address(999999)
+    with pytest.raises(BadHTTPCode):
+        webservice.get_product(999999)
+
+
+def test_objects_decoding(fake_webservice):
+    dataset = fake_webservice.dataset
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    address = webservice.get_address(1)
+    product = webservice.get_product(1)
+
+    assert address.lastname == dataset.addresses[1]['lastname']
+    assert int(address.id_country) in (1, 3, 6, 8, 10, 13)
+    assert product.name[0]['value'] == 'Product 1'
+
+
+@pytest.mark.parametrize("fake_webservice", [None], indirect=True)
+def test_simulated_errors(fake_webservice):
+    fake_webservice.error_rate = 1
+    with pytest.raises(BadHTTPCode):
+        Webservice(fake_webservice.url, 'APIKEY').get_address(1)
+
+
+def test_projected_and_compressed_responses(fake_webservice):
+    report = RunReport()
+    webservice = Webservice(fake_webservice.url, 'APIKEY', report=report, language_id=2)
+    address, product = webservice.get_address(1), webservice.get_product(1)
+
+    assert {field for field, value in vars(address).items() if value != Address.__dataclass_fields__[field].default} \
+        <= set(ADDRESS_FIELDS)
+    assert product.name == [{'id': '2', 'value': 'Produit 1'}] and product.description == ''
+    products = report.endpoints['GET products']
+    assert products.bytes_received == fake_webservice.bytes_sent['products'] < products.bytes_decoded
+    assert report.to_dict()['http']['bytes_received'] == sum(fake_webservice.bytes_sent.values())
+
+
+def test_address_missing_from_list_fetched_directly(fake_webservice):
+    fake_webservice.lists_hide_deleted = True
+    fake_webservice.dataset.addresses[1]['deleted'] = '1'
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+
+    address = webservice.get_address(1)
+    assert address.deleted == '1' and address.city == fake_webservice.dataset.addresses[1]['city']
+    assert fake_webservice.request_counter['GET addresses'] == 2
+    with pytest.raises(BadHTTPCode):
+        webservice.get_address(999999)
+
+
+def test_projected_field_missing_from_response(fake_webservice, mocker):
+    mocker.patch('psebpconnector.webservice.ADDRESS_FIELDS', ADDRESS_FIELDS + ('not_a_field',))
+    with pytest.raises(ValueError, match='not_a_field'):
+        Webservice(fake_webservice.url, 'APIKEY').get_address(1)
+
+
+def test_transform_reads_only_projected_fields(offline_connector, mocker):
+    """ A field read by the transformation but missing from the projection would be exported empty """
+    read_fields = set()
+
+    def tracking(model, fields):
+        class Tracking(model):
+            def __getattribute__(self, name):
+                if name in model.__dataclass_fields__:
+                    read_fields.add((model.__name__, name))
+                return super().__getattribute__(name)
+
+            def __repr__(self):
+                # Les logs de debug affichent l'objet entier : ce n'est pas une lecture par la transformation
+                return model.__name__
+
+        return lambda _, resource_id: Tracking(**vars(fields(_, resource_id)))
+
+    mocker.patch('psebpconnector.webservice.Webservice.get_address', new=tracking(Address, get_address))
+    mocker.patch('psebpconnector.webservice.Webservice.get_product', new=tracking(Product, get_product))
+    offline_connector.run()
+
+    assert read_fields
+    assert {field for model, field in read_fields if model == 'Address'} <= set(ADDRESS_FIELDS)
+    assert {field for model, field in read_fields if model == 'Product'} <= set(PRODUCT_FIELDS)
+
+
+def test_orders_and_refunds_scanned_concurrently(fake_webservice):
+    fake_webservice.latency = 0.005
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    requests = []
+    webservice.request_listeners.append(
+        lambda method, endpoint, url, status_code, start, duration: requests.append((threading.current_thread().name,
+                                                                                     start)))
+    orders = list(webservice.get_orders_to_export(['2', '4', '5'], ['7']))
+
+    # Ventes puis avoirs, chacun dans l'ordre des ID
+    refunds = [order for order in orders if order.is_refund]
+    assert orders == sorted(orders, key=lambda order: (order.is_refund, order.id)) and refunds
+    first_refund_request = min(start for thread, start in requests if thread == 'scan-refunds')
+    last_order_request = max(start for thread, start in requests if thread == 'scan-orders')
+    assert first_refund_request < last_order_request
+
+
+def test_sessions_not_shared_between_threads(fake_webservice):
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    sessions = {}
+    # Les sessions sont conservees (et non leur id) : une session fermee pourrait etre remplacee a la meme adresse
+    webservice.request_listeners.append(
+        lambda *args: sessions.setdefault(threading.current_thread().name, {})
+                              .setdefault(id(webservice._session), webservice._session))
+    orders = webservice.get_orders_to_export(['2', '4', '5'], ['7'])
+    order = next(orders)
+    webservice.get_address(order.id_address_delivery)
+    list(orders)
+
+    assert {'MainThread', 'scan-orders', 'scan-refunds'} <= set(sessions)
+    assert all(len(thread_sessions) == 1 for thread_sessions in sessions.values())
+    assert len({session_id for thread_sessions in sessions.values() for session_id in thread_sessions}) == len(sessions)
+
+
+def test_orders_scan_stopped_when_closed(fake_webservice):
+    fake_webservice.latency = 0.005
+    webservice = Webservice(fake_webservice.url, 'APIKEY')
+    orders = webservice.get_orders_to_export(['2', '4', '5'], ['7'])
+    next(orders)
+    orders.close()
+    time.sleep(0.2)
+    calls = sum(fake_webservice.request_counter.values())
+    time.sleep(0.2)
+    assert sum(fake_webservice.request_counter.values()) == calls < len(fake_webservice.dataset.orders)
+
+
+def test_orders_scan_error_raised(fake_webservice):
+    fake_webservice.error_rate = 1
+    with pytest.raises(BadHTTPCode):
+        list(Webservice(fake_webservice.url, 'APIKEY').get_orders_to_export(['2', '4', '5'], ['7']))
@@ -0,0 +1,92 @@
+"""
+MIT License
+
+Copyright (c) 2024 Foxchip
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from .fixtures import fake_webservice, write_online_config
+from psebpconnector.connector import Connector
+from psebpconnector.exceptions import BadHTTPCode
+from psebpconnector.models import Order
+from psebpconnector.webservice import Webservice
+from psebpconnector.writeback_outbox import WritebackOutbox
+from unittest.mock import Mock
+
+
+def test_persistence_and_flush(tmp_path):
+    path = tmp_path / 'writeback_outbox.json'
+    outbox = WritebackOutbox(path)
+    outbox.save()
+    assert not path.is_file()
+    outbox.add(Order(id=12), 'HTTP 500')
+    outbox.add(Order(id=13, is_refund=True), 'HTTP 500')
+
+    reloaded = WritebackOutbox(path)
+    assert reloaded.contains(12, False) and reloaded.contains(13, True) and not reloaded.contains(13, False)
+
+    webservice = Mock()
+    webservice.set_order_exported.side_effect = BadHTTPCode('HTTP 503')
+    assert reloaded.flush(webservice) == 1
+    webservice.set_order_refund.assert_called_once()
+    outbox = WritebackOutbox(path)
+    assert outbox.order_count == 1
+    assert [(order.id, order.is_refund) for order in outbox.pending()] == [(12, False)]
+    assert outbox._entries['12']['attempts'] == 2 and outbox._entries['12']['last_error'] == 'HTTP 503'
+
+
+def test_failed_writeback_retried_without_export(fake_webservice, tmp_path, mocker):
+    config_path = write_online_config(tmp_path / 'config.ini', fake_webservice.url, tmp_path,
+                                      tmp_path / 'database.ebp')
+    set_order_exported = Webservice.set_order_exported
+    failing = set()
+
+    def flaky_set_order_exported(webservice, order):
+        if order.id in failing:
+            raise BadHTTPCode('HTTP 500')
+        set_order_exported(webservice, order)
+
+    mocker.patch.object(Webservice, 'set_order_exported', autospec=True, side_effect=flaky_set_order_exported)
+    dataset = fake_webservice.dataset
+    order_id = next(order_id for order_id, printed in dataset.orders_printed.items()
+                    if printed['exported'] == '0' and dataset.orders[order_id]['current_state'] in ('2', '4', '5'))
+    failing.add(order_id)
+
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert connector.errors_logged()
+    assert connector.report.counters['writebacks_queued'] == 1
+    assert dataset.orders_printed[order_id]['exported'] == '0'
+    assert WritebackOutbox(tmp_path / 'writeback_outbox.json').contains(order_id, False)
+
+    # Prestashop toujours en erreur : la commande, deja dans EBP, n'est pas reexportee
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert connector.report.counters['writeback_pending_skipped'] == 1
+    assert order_id not in [order.id for order in connector.pending_orders]
+
+    failing.clear()
+    orders_calls = fake_webservice.request_counter.get('GET orders', 0)
+    connector = Connector(config_path)
+    assert connector.run() == 0
+    assert connector.report.counters['writebacks_retried'] == 1
+    assert dataset.orders_printed[order_id]['exported'] == '1'
+    assert connector.writeback_outbox.order_count == 0
+    assert fake_webservice.request_counter.get('GET orders', 0) == orders_calls